@@ -1,5 +1,9 @@
-from django.contrib import admin
-from .models import BillingInfo, Invoice, InvoiceItem, Payment, Expense
+from django.contrib import admin, messages
+from .models import (
+    BillingInfo, Invoice, InvoiceItem, Payment, Expense,
+    JournalEntry, JournalLine, BalanceCheckpoint, InvoiceSequence, ExchangeRate
+)
+from .invoicing import refresh_totals
 
 @admin.register(BillingInfo)
 class BillingInfoAdmin(admin.ModelAdmin):
@@ -7,7 +11,19 @@ class BillingInfoAdmin(admin.ModelAdmin):
     list_filter = ( 'payment_status', 'invoice_date', 'created_at')
     search_fields = ('invoice_number', 'case__reference', 'case__title')
     ordering = ('-invoice_date',)
-    readonly_fields = ('created_at', 'updated_at')
+    readonly_fields = ('invoice_number', 'created_at', 'updated_at')
+
+    # Numbered records are cancelled, never deleted, to keep the sequence gapless
+    def has_delete_permission(self, request, obj=None):
+        if obj is not None and obj.invoice_number:
+            return False
+        return super().has_delete_permission(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        numbered = queryset.exclude(invoice_number='').count()
+        if numbered:
+            self.message_user(request, f'{numbered} numbered billing record(s) kept; cancel them instead', messages.WARNING)
+        queryset.filter(invoice_number='').delete()
 
 @admin.register(Invoice)
 class InvoiceAdmin(admin.ModelAdmin):
@@ -15,13 +31,52 @@ class InvoiceAdmin(admin.ModelAdmin):
     list_filter = ('status', 'invoice_date', 'due_date')
     search_fields = ('invoice_number', 'client_name', 'case__reference')
     ordering = ('-invoice_date',)
-    readonly_fields = ('created_at', 'updated_at')
+    readonly_fields = ('invoice_number', 'created_at', 'updated_at')
+
+    # Numbered invoices are cancelled, never deleted, to keep the sequence gapless
+    def has_delete_permission(self, request, obj=None):
+        if obj is not None and obj.invoice_number:
+            return False
+        return super().has_delete_permission(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        numbered = queryset.filter(invoice_number__isnull=False).count()
+        if numbered:
+            self.message_user(request, f'{numbered} numbered invoice(s) kept; cancel them instead', messages.WARNING)
+        queryset.filter(invoice_number__isnull=True).delete()
+
+@admin.register(InvoiceSequence)
+class InvoiceSequenceAdmin(admin.ModelAdmin):
+    list_display = ('series', 'year', 'last_number', 'updated_at')
+    list_filter = ('series',)
+    ordering = ('-year', 'series')
+    # Edited only by the allocator; a manual change would break the sequence
+    readonly_fields = ('series', 'year', 'last_number', 'updated_at')
+
+    def has_add_permission(self, request):
+        return False
 
 @admin.register(InvoiceItem)
 class InvoiceItemAdmin(admin.ModelAdmin):
     list_display = ('invoice', 'description', 'quantity', 'unit_price', 'total_price')
     search_fields = ('description', 'invoice__invoice_number')
 
+    # Items saved one by one here don't touch their invoice; refresh it after
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        refresh_totals(obj.invoice)
+
+    def delete_model(self, request, obj):
+        invoice = obj.invoice
+        super().delete_model(request, obj)
+        refresh_totals(invoice)
+
+    def delete_queryset(self, request, queryset):
+        invoices = list(Invoice.objects.filter(items__in=queryset).distinct())
+        super().delete_queryset(request, queryset)
+        for invoice in invoices:
+            refresh_totals(invoice)
+
 @admin.register(Payment)
 class PaymentAdmin(admin.ModelAdmin):
     list_display = ('invoice', 'amount', 'payment_date', 'payment_method', 'reference_number')
@@ -34,4 +89,47 @@ class ExpenseAdmin(admin.ModelAdmin):
     list_display = ('description', 'case', 'category', 'amount', 'expense_date', 'is_reimbursed')
     list_filter = ('category', 'is_reimbursable', 'is_reimbursed', 'expense_date')
     search_fields = ('description', 'case__reference')
-    ordering = ('-expense_date',)
\ No newline at end of file
+    ordering = ('-expense_date',)
+
+class JournalLineInline(admin.TabularInline):
+    model = JournalLine
+    fields = ('entry_date', 'account', 'case', 'client_name', 'debit', 'credit')
+    readonly_fields = fields
+    can_delete = False
+    extra = 0
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+@admin.register(JournalEntry)
+class JournalEntryAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'source_type', 'source_id', 'description', 'created_at')
+    list_filter = ('source_type', 'created_at')
+    search_fields = ('description', 'user__email')
+    readonly_fields = ('user', 'source_type', 'source_id', 'description', 'created_at')
+    inlines = [JournalLineInline]
+
+    # The journal is append-only
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+@admin.register(BalanceCheckpoint)
+class BalanceCheckpointAdmin(admin.ModelAdmin):
+    list_display = ('user', 'as_of', 'account', 'case', 'client_name', 'balance')
+    list_filter = ('as_of', 'account')
+    search_fields = ('client_name', 'user__email')
+    ordering = ('-as_of',)
+
+@admin.register(ExchangeRate)
+class ExchangeRateAdmin(admin.ModelAdmin):
+    list_display = ('currency', 'rate_date', 'rate', 'source')
+    list_filter = ('currency', 'source')
+    ordering = ('-rate_date', 'currency')
+    date_hierarchy = 'rate_date'
+    readonly_fields = ('created_at',)
@@ -0,0 +1,104 @@
+"""
+Accounts-receivable aging.
+
+Open invoices are grouped by client and case, and each group's outstanding
+balance (``total_amount - amount_paid``) is split into buckets by how far
+past ``due_date`` it is on the report date. The buckets are conditional
+sums in a single grouped query, so the report costs the same whether it
+covers one lawyer or the whole firm, and rows can be streamed as CSV.
+Balances are converted to the base currency at the rates in effect on the
+report date; invoices without a known rate are counted but not summed.
+"""
+import csv
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce
+from django.db.models.lookups import IsNull
+
+from .analytics import MONEY, OPEN_STATUSES, ZERO, outstanding_balance
+from .currency import converted, rate_expression
+
+# (key, label, oldest days past due, newest days past due)
+BUCKETS = [
+    ('current', 'Current', None, 0),
+    ('days_1_30', '1-30', 30, 1),
+    ('days_31_60', '31-60', 60, 31),
+    ('days_61_90', '61-90', 90, 61),
+    ('days_91_120', '91-120', 120, 91),
+    ('days_over_120', '120+', None, 121),
+]
+GROUP_FIELDS = ['client_name', 'case_id', 'case__reference', 'case__title']
+FIRM_GROUP_FIELDS = ['user_id', 'user__email'] + GROUP_FIELDS
+
+
+def _bucket_filter(as_of, oldest, newest):
+    """Invoices between ``newest`` and ``oldest`` days past due on ``as_of``"""
+    if oldest is None and newest == 0:
+        return Q(due_date__gte=as_of)
+    condition = Q(due_date__lte=as_of - timedelta(days=newest))
+    if oldest is not None:
+        condition &= Q(due_date__gte=as_of - timedelta(days=oldest))
+    return condition
+
+
+def open_invoices(queryset, as_of):
+    """Invoices issued by ``as_of`` that still have a balance to collect"""
+    return queryset.filter(
+        status__in=OPEN_STATUSES, invoice_date__lte=as_of
+    ).annotate(balance=outstanding_balance()).filter(balance__gt=0)
+
+
+def aging_rows(queryset, as_of, firm=False):
+    """
+    One row per client and case with the balance in each bucket.
+
+    ``firm`` adds the lawyer to the grouping, for reports across users.
+    """
+    buckets = {
+        key: Coalesce(Sum('base_balance', filter=_bucket_filter(as_of, oldest, newest)), ZERO, output_field=MONEY)
+        for key, _, oldest, newest in BUCKETS
+    }
+    fields = FIRM_GROUP_FIELDS if firm else GROUP_FIELDS
+    invoices = open_invoices(queryset, as_of).annotate(
+        base_balance=converted('balance', MONEY, on_date=as_of)
+    )
+    return invoices.order_by().values(*fields).annotate(
+        invoice_count=Count('id'),
+        unconverted_count=Count('id', filter=Q(IsNull(rate_expression(on_date=as_of), True))),
+        total=Coalesce(Sum('base_balance'), ZERO, output_field=MONEY),
+        **buckets,
+    ).order_by('-total', 'client_name')
+
+
+def aging_totals(rows):
+    totals = dict.fromkeys([key for key, *_ in BUCKETS] + ['total'], Decimal('0'))
+    for row in rows:
+        for key in totals:
+            totals[key] += row[key]
+    return totals
+
+
+class Echo:
+    """File-like object whose write() hands the line straight back"""
+
+    def write(self, value):
+        return value
+
+
+def aging_csv(rows, firm=False):
+    """Yield the aging report as CSV lines"""
+    writer = csv.writer(Echo())
+    header = ['Client', 'Case reference', 'Case title', 'Invoices']
+    header += [label for _, label, *_ in BUCKETS] + ['Total']
+    if firm:
+        header = ['Lawyer'] + header
+    yield writer.writerow(header)
+
+    for row in rows.iterator(chunk_size=2000):
+        line = [row['client_name'], row['case__reference'] or '', row['case__title'] or '', row['invoice_count']]
+        line += [row[key] for key, *_ in BUCKETS] + [row['total']]
+        if firm:
+            line = [row['user__email']] + line
+        yield writer.writerow(line)
@@ -0,0 +1,149 @@
+"""
+Per-user revenue analytics.
+
+The whole payload comes from one aggregate over the user's row: invoice
+metrics are conditional aggregates on the joined invoices, the outstanding
+balance is summed as ``total_amount - amount_paid`` in the database, and
+expenses are a correlated subquery. Amounts are converted to the base
+currency in the query at the rate in effect on each invoice or expense
+date; rows without a known rate are left out of the sums and counted.
+Results are cached per user and date range for
+BILLING_ANALYTICS_CACHE_TIMEOUT seconds; invoice, payment and expense
+changes retire all of a user's entries by rotating a cache token, and
+exchange rate changes retire everyone's.
+"""
+import uuid
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import models
+from django.db.models import Count, ExpressionWrapper, F, Max, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.db.models.lookups import IsNull
+from django.utils import timezone
+
+from .currency import base_currency, converted, rate_expression
+from .models import Expense
+
+# Invoices that still expect money
+OPEN_STATUSES = ('sent', 'partially_paid', 'overdue')
+
+MONEY = models.DecimalField(max_digits=15, decimal_places=2)
+ZERO = Value(Decimal('0'), output_field=MONEY)
+
+
+def outstanding_balance(prefix=''):
+    """Database expression for an invoice's unpaid amount"""
+    return ExpressionWrapper(
+        F(f'{prefix}total_amount') - F(f'{prefix}amount_paid'), output_field=MONEY
+    )
+
+
+RATES_TOKEN_KEY = 'billing:revenue:token:rates'
+
+
+def _token_key(user_id):
+    return f'billing:revenue:token:{user_id}'
+
+
+def _cache_token(key):
+    token = cache.get(key)
+    if token is None:
+        token = uuid.uuid4().hex
+        cache.set(key, token, None)
+    return token
+
+
+def revenue_cache_key(user_id, start_date, end_date):
+    return (
+        f'billing:revenue:{user_id}:{_cache_token(_token_key(user_id))}:{_cache_token(RATES_TOKEN_KEY)}:'
+        f'{start_date.isoformat()}:{end_date.isoformat()}:{timezone.now().date().isoformat()}'
+    )
+
+
+def invalidate_revenue(*user_ids):
+    """Retire every cached range for these users"""
+    cache.set_many({_token_key(user_id): uuid.uuid4().hex for user_id in user_ids if user_id}, None)
+
+
+def invalidate_all_revenue():
+    """Retire every cached range for every user"""
+    cache.set(RATES_TOKEN_KEY, uuid.uuid4().hex, None)
+
+
+def _revenue_row(user, start_date, end_date):
+    today = timezone.now().date()
+    in_range = Q(invoices__invoice_date__range=(start_date, end_date))
+    is_open = in_range & Q(invoices__status__in=OPEN_STATUSES)
+    is_paid = in_range & Q(invoices__status='paid')
+    invoice_rate = rate_expression('invoices__currency', 'invoices__invoice_date')
+    expenses = Expense.objects.filter(
+        user=OuterRef('pk'), expense_date__range=(start_date, end_date)
+    ).order_by().values('user')
+    expense_total = expenses.annotate(
+        total=Sum(converted('amount', MONEY, date_field='expense_date'))
+    ).values('total')
+    expense_unconverted = expenses.annotate(
+        count=Count('pk', filter=IsNull(rate_expression(date_field='expense_date'), True))
+    ).values('count')
+
+    User = get_user_model()
+    # Aggregating from the user row keeps one result row even without invoices
+    return User.objects.filter(pk=user.pk).aggregate(
+        total_invoiced=Coalesce(Sum(F('invoices__total_amount') * invoice_rate, output_field=MONEY, filter=in_range), ZERO),
+        total_paid=Coalesce(Sum(F('invoices__amount_paid') * invoice_rate, output_field=MONEY, filter=is_paid), ZERO),
+        outstanding=Coalesce(Sum(outstanding_balance('invoices__') * invoice_rate, output_field=MONEY, filter=is_open), ZERO),
+        total_expenses=Coalesce(Max(Subquery(expense_total, output_field=MONEY)), ZERO),
+        unconverted_invoices=Count('invoices', filter=in_range & Q(IsNull(invoice_rate, True))),
+        unconverted_expenses=Coalesce(Max(Subquery(expense_unconverted, output_field=models.IntegerField())), 0),
+        total_count=Count('invoices', filter=in_range),
+        paid_count=Count('invoices', filter=is_paid),
+        overdue_count=Count('invoices', filter=in_range & (
+            Q(invoices__status='overdue') | (is_open & Q(invoices__due_date__lt=today))
+        )),
+        case_count=Count('invoices__case', filter=in_range, distinct=True),
+    )
+
+
+def build_revenue_analytics(user, start_date, end_date):
+    row = _revenue_row(user, start_date, end_date)
+    return {
+        'period': {
+            'start_date': start_date,
+            'end_date': end_date
+        },
+        'currency': {
+            'base': base_currency(),
+            'unconverted_invoices': row['unconverted_invoices'],
+            'unconverted_expenses': row['unconverted_expenses']
+        },
+        'revenue': {
+            'total_invoiced': float(row['total_invoiced']),
+            'total_paid': float(row['total_paid']),
+            'outstanding': float(row['outstanding']),
+            'net_profit': float(row['total_paid'] - row['total_expenses'])
+        },
+        'expenses': {
+            'total_expenses': float(row['total_expenses'])
+        },
+        'invoices': {
+            'total_count': row['total_count'],
+            'paid_count': row['paid_count'],
+            'overdue_count': row['overdue_count']
+        },
+        'cases': {
+            'case_count': row['case_count'],
+            'avg_case_value': float(row['total_invoiced'] / max(row['case_count'], 1))
+        }
+    }
+
+
+def revenue_analytics_for(user, start_date, end_date):
+    key = revenue_cache_key(user.pk, start_date, end_date)
+    analytics = cache.get(key)
+    if analytics is None:
+        analytics = build_revenue_analytics(user, start_date, end_date)
+        cache.set(key, analytics, getattr(settings, 'BILLING_ANALYTICS_CACHE_TIMEOUT', 5 * 60))
+    return analytics
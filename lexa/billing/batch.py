@@ -0,0 +1,195 @@
+"""
+Month-end batch invoicing.
+
+Unbilled work up to the end of a period is gathered per lawyer: open
+billing records (hours and fees) and reimbursable, not yet reimbursed
+expenses that no live invoice has billed. A source counts as unbilled while
+``billed_invoice`` is empty or points at a cancelled invoice, a filter on an
+indexed foreign key. Sources are grouped into one draft per case (or per
+client) and currency; for each lawyer the drafts are bulk-created with
+their items and their sources marked as billed, all in a single
+transaction. Drafts are unnumbered: a number is issued from the yearly
+sequence only when the lawyer sends the invoice, so rejected drafts can be
+deleted without leaving a gap.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from .analytics import invalidate_revenue
+from .invoicing import apply_totals, price_item
+from .models import BillingInfo, Expense, Invoice, InvoiceItem
+
+UNBILLED = Q(billed_invoice__isnull=True) | Q(billed_invoice__status='cancelled')
+BILLABLE_RECORD_STATUSES = ('pending', 'overdue')
+RECORD_FEES = [
+    ('advanced_expenses', 'Frais avancés'),
+    ('court_fees', 'Frais de justice'),
+    ('administrative_fees', 'Frais administratifs'),
+]
+
+
+class Draft:
+    """One invoice to be created, with its unsaved items and sources"""
+
+    def __init__(self, user_id, client_name, currency):
+        self.user_id = user_id
+        self.client_name = client_name
+        self.currency = currency
+        self.cases = {}
+        self.items = []
+        self.records = []
+        self.expenses = []
+        self.invoice = None
+
+    @property
+    def case(self):
+        return next(iter(self.cases.values())) if len(self.cases) == 1 else None
+
+    @property
+    def subtotal(self):
+        return sum((item.total_price for item in self.items), Decimal('0'))
+
+
+def unbilled_records(period_end):
+    return BillingInfo.objects.filter(
+        UNBILLED,
+        invoice_date__lte=period_end,
+        payment_status__in=BILLABLE_RECORD_STATUSES,
+        amount__gt=0,
+    )
+
+
+def unbilled_expenses(period_end):
+    return Expense.objects.filter(
+        UNBILLED,
+        expense_date__lte=period_end,
+        is_reimbursable=True,
+        is_reimbursed=False,
+    )
+
+
+def users_with_unbilled_work(period_end):
+    user_ids = set(unbilled_records(period_end).values_list('user_id', flat=True).distinct())
+    user_ids.update(unbilled_expenses(period_end).values_list('user_id', flat=True).distinct())
+    return sorted(user_ids)
+
+
+def _record_items(record, prefix):
+    items = []
+    if record.hours_worked and record.hourly_rate:
+        items.append(InvoiceItem(
+            description=f'{prefix}Honoraires',
+            hours_worked=record.hours_worked,
+            hourly_rate=record.hourly_rate,
+            service_date=record.invoice_date,
+        ))
+    for field, label in RECORD_FEES:
+        value = getattr(record, field)
+        if value:
+            items.append(InvoiceItem(
+                description=f'{prefix}{label}', quantity=1, unit_price=value, service_date=record.invoice_date
+            ))
+    return items
+
+
+def _expense_item(expense, prefix):
+    return InvoiceItem(
+        description=f'{prefix}{expense.get_category_display()} - {expense.description}'[:300],
+        quantity=1,
+        unit_price=expense.amount,
+        service_date=expense.expense_date,
+    )
+
+
+def build_drafts(user_id, period_end, group_by='case', lock=False):
+    """Group a lawyer's unbilled work into drafts (nothing is saved)"""
+    records = unbilled_records(period_end).filter(user_id=user_id).select_related('case').order_by('invoice_date', 'pk')
+    expenses = unbilled_expenses(period_end).filter(user_id=user_id).select_related('case').order_by('expense_date', 'pk')
+    if lock:
+        records = records.select_for_update(of=('self',))
+        expenses = expenses.select_for_update(of=('self',))
+
+    drafts = {}
+
+    def draft_for(case, currency):
+        client_name = case.client_name
+        if group_by == 'client':
+            key = (client_name.strip().lower(), currency)
+        else:
+            key = (case.pk, currency)
+        if key not in drafts:
+            drafts[key] = Draft(user_id, client_name, currency)
+        draft = drafts[key]
+        draft.cases[case.pk] = case
+        return draft
+
+    for record in records:
+        draft = draft_for(record.case, record.currency)
+        prefix = f'{record.case.reference} - ' if group_by == 'client' else ''
+        draft.items.extend(price_item(item) for item in _record_items(record, prefix))
+        draft.records.append(record)
+    for expense in expenses:
+        draft = draft_for(expense.case, expense.currency)
+        prefix = f'{expense.case.reference} - ' if group_by == 'client' else ''
+        draft.items.append(price_item(_expense_item(expense, prefix)))
+        draft.expenses.append(expense)
+    return [draft for draft in drafts.values() if draft.items]
+
+
+def create_invoices(drafts, invoice_date):
+    """Save ``drafts`` of one lawyer; must run inside a transaction"""
+    if not drafts:
+        return []
+    due_date = invoice_date + timedelta(days=getattr(settings, 'INVOICE_PAYMENT_TERMS_DAYS', 30))
+
+    invoices = []
+    for draft in drafts:
+        case = draft.case or next(iter(draft.cases.values()))
+        invoice = Invoice(
+            invoice_date=invoice_date,
+            due_date=due_date,
+            case=draft.case,
+            client_name=draft.client_name,
+            client_address=case.client_address,
+            client_email=case.client_email,
+            client_phone=case.client_phone,
+            currency=draft.currency,
+            status='draft',
+            user_id=draft.user_id,
+        )
+        invoices.append(apply_totals(invoice, draft.subtotal))
+    Invoice.objects.bulk_create(invoices)
+
+    items = []
+    for draft, invoice in zip(drafts, invoices):
+        for item in draft.items:
+            item.invoice = invoice
+        items.extend(draft.items)
+        # Drafts post nothing, so the records keep their own ledger lines
+        # until the invoice is sent
+        BillingInfo.objects.filter(pk__in=[record.pk for record in draft.records]).update(billed_invoice=invoice)
+        Expense.objects.filter(pk__in=[expense.pk for expense in draft.expenses]).update(billed_invoice=invoice)
+    InvoiceItem.objects.bulk_create(items, batch_size=500)
+
+    invalidate_revenue(*{draft.user_id for draft in drafts})
+    return invoices
+
+
+def invoice_unbilled_work(user_id, period_end, invoice_date=None, group_by='case', dry_run=False):
+    """
+    Draft invoices for one lawyer's unbilled work up to ``period_end``.
+
+    Returns the drafts; with ``dry_run`` nothing is written.
+    """
+    invoice_date = invoice_date or period_end
+    if dry_run:
+        return build_drafts(user_id, period_end, group_by)
+    with transaction.atomic():
+        drafts = build_drafts(user_id, period_end, group_by, lock=True)
+        for draft, invoice in zip(drafts, create_invoices(drafts, invoice_date)):
+            draft.invoice = invoice
+    return drafts
@@ -0,0 +1,125 @@
+"""
+Currency conversion.
+
+Amounts are converted to BILLING_BASE_CURRENCY with the ``ExchangeRate``
+table: a rate applies from its ``rate_date`` until the next rate for the
+same currency. Aggregates convert inside the query through a correlated
+lookup of the latest rate on or before each row's date, which the unique
+(currency, rate_date) index answers with a single seek, so mixed-currency
+totals never load rows into Python. Single conversions go through a small
+in-process cache of as-of-date lookups.
+"""
+import threading
+import time
+from collections import OrderedDict
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import models
+from django.db.models import Case, ExpressionWrapper, F, OuterRef, Subquery, Value, When
+
+from .models import ExchangeRate
+
+RATE = models.DecimalField(max_digits=18, decimal_places=6)
+ONE = Value(Decimal('1'), output_field=RATE)
+MISSING = object()
+
+
+def base_currency():
+    return getattr(settings, 'BILLING_BASE_CURRENCY', 'DZD')
+
+
+class MissingRate(ValueError):
+    """No exchange rate is known for a currency on a date"""
+
+    def __init__(self, currency, on_date):
+        self.currency = currency
+        self.on_date = on_date
+        super().__init__(f'No {currency} exchange rate on or before {on_date}')
+
+
+class RateCache:
+    """Thread-safe LRU of ``(currency, date)`` lookups that expire after ``timeout`` seconds"""
+
+    def __init__(self, max_size, timeout):
+        self.max_size = max_size
+        self.timeout = timeout
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._items:
+                return MISSING
+            value, expires = self._items[key]
+            if expires < time.monotonic():
+                del self._items[key]
+                return MISSING
+            self._items.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._items[key] = (value, time.monotonic() + self.timeout)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+rate_cache = RateCache(
+    getattr(settings, 'EXCHANGE_RATE_CACHE_SIZE', 1024),
+    getattr(settings, 'EXCHANGE_RATE_CACHE_TIMEOUT', 5 * 60),
+)
+
+
+def rate_on(currency, on_date):
+    """Rate in effect for ``currency`` on ``on_date``, or None when unknown"""
+    currency = currency.upper()
+    if currency == base_currency():
+        return Decimal('1')
+    key = (currency, on_date)
+    rate = rate_cache.get(key)
+    if rate is MISSING:
+        rate = ExchangeRate.objects.filter(
+            currency=currency, rate_date__lte=on_date
+        ).order_by('-rate_date').values_list('rate', flat=True).first()
+        rate_cache.set(key, rate)
+    return rate
+
+
+def convert(amount, currency, on_date):
+    """``amount`` of ``currency`` in the base currency; raises MissingRate"""
+    rate = rate_on(currency, on_date)
+    if rate is None:
+        raise MissingRate(currency, on_date)
+    return (Decimal(amount) * rate).quantize(Decimal('0.01'))
+
+
+def rate_expression(currency_field='currency', date_field=None, on_date=None):
+    """
+    Database expression for the rate of each row's currency.
+
+    The rate is taken on the row's ``date_field`` or on a fixed ``on_date``;
+    it is NULL when no rate is known, so converted sums skip the row.
+    """
+    as_of = OuterRef(date_field) if date_field else Value(on_date)
+    latest = ExchangeRate.objects.filter(
+        currency=OuterRef(currency_field), rate_date__lte=as_of
+    ).order_by('-rate_date').values('rate')[:1]
+    return Case(
+        When(**{currency_field: base_currency()}, then=ONE),
+        default=Subquery(latest, output_field=RATE),
+        output_field=RATE,
+    )
+
+
+def converted(amount_field, output_field, currency_field='currency', date_field=None, on_date=None):
+    """``amount_field`` (a field name or expression) in the base currency"""
+    amount = F(amount_field) if isinstance(amount_field, str) else amount_field
+    return ExpressionWrapper(
+        amount * rate_expression(currency_field, date_field, on_date), output_field=output_field
+    )
@@ -0,0 +1,122 @@
+"""
+Invoice write path.
+
+The pricing rules live here: an item costs ``hours_worked * hourly_rate``
+when both are set and ``quantity * unit_price`` otherwise, and an invoice
+total is its subtotal plus tax at ``tax_rate`` percent, all rounded to the
+cent. ``save_invoice`` prices the items, computes the totals once and
+bulk-creates the items in a single transaction. ``record_payment`` adds a
+payment under a row lock and derives the invoice status from the new
+totals.
+"""
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+
+from .models import Invoice, InvoiceItem, Payment
+
+CENT = Decimal('0.01')
+
+
+def money(value):
+    return Decimal(str(value or 0)).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def price_item(item):
+    """Set ``item.total_price`` from its hours or quantity"""
+    if item.hours_worked and item.hourly_rate:
+        item.total_price = money(Decimal(str(item.hours_worked)) * Decimal(str(item.hourly_rate)))
+    else:
+        item.total_price = money(Decimal(str(item.quantity or 0)) * Decimal(str(item.unit_price or 0)))
+    return item
+
+
+def apply_totals(invoice, subtotal):
+    """Set subtotal, tax and total on ``invoice`` (not saved)"""
+    invoice.subtotal = money(subtotal)
+    invoice.tax_amount = money(invoice.subtotal * Decimal(str(invoice.tax_rate or 0)) / 100)
+    invoice.total_amount = invoice.subtotal + invoice.tax_amount
+    return invoice
+
+
+@transaction.atomic
+def save_invoice(invoice, items_data=None):
+    """
+    Save ``invoice`` and, when ``items_data`` is given, replace its items.
+
+    ``items_data`` is a list of InvoiceItem field dicts. Without it the
+    stored subtotal is kept and only tax and total follow the current rate.
+    """
+    if items_data is None:
+        apply_totals(invoice, invoice.subtotal if invoice.pk else 0)
+        invoice.save()
+        return invoice
+
+    items = [price_item(InvoiceItem(**data)) for data in items_data]
+    apply_totals(invoice, sum((item.total_price for item in items), Decimal('0')))
+    replacing = invoice.pk is not None
+    invoice.save()
+
+    if replacing:
+        invoice.items.all().delete()
+    for item in items:
+        item.invoice = invoice
+    InvoiceItem.objects.bulk_create(items)
+    return invoice
+
+
+def refresh_totals(invoice):
+    """Recompute totals from the stored items with one aggregate and save"""
+    subtotal = invoice.items.aggregate(total=Sum('total_price'))['total']
+    apply_totals(invoice, subtotal or 0)
+    invoice.save(update_fields=['subtotal', 'tax_amount', 'total_amount', 'updated_at'])
+    return invoice
+
+
+def apply_payment_status(invoice, payment_date=None):
+    """Derive the status from ``amount_paid``; returns the changed fields"""
+    if invoice.status == 'cancelled':
+        return []
+    if invoice.total_amount > 0 and invoice.amount_paid >= invoice.total_amount:
+        invoice.status = 'paid'
+        invoice.payment_date = payment_date or invoice.payment_date
+        return ['status', 'payment_date']
+    if invoice.amount_paid > 0:
+        invoice.status = 'partially_paid'
+        return ['status']
+    return []
+
+
+def record_payment(invoice_id, user, data, idempotency_key=''):
+    """
+    Add a payment to one of ``user``'s invoices.
+
+    ``data`` holds validated Payment fields. The invoice row is locked and
+    ``amount_paid`` incremented in the database, so concurrent payments all
+    count. A payment already recorded under ``idempotency_key`` is returned
+    as is. Returns ``(payment, created)``; raises Invoice.DoesNotExist.
+    """
+    try:
+        with transaction.atomic():
+            invoice = Invoice.objects.select_for_update().get(id=invoice_id, user=user)
+            if idempotency_key:
+                existing = Payment.objects.filter(user=user, idempotency_key=idempotency_key).first()
+                if existing is not None:
+                    return existing, False
+
+            payment = Payment.objects.create(
+                invoice=invoice, user=user, idempotency_key=idempotency_key, **data
+            )
+            Invoice.objects.filter(pk=invoice.pk).update(amount_paid=F('amount_paid') + payment.amount)
+            invoice.refresh_from_db(fields=['amount_paid', 'total_amount', 'status'])
+            changed = apply_payment_status(invoice, payment.payment_date)
+            invoice.save(update_fields=changed + ['updated_at'])
+            return payment, True
+    except IntegrityError:
+        # A parallel retry won the race for this key
+        if idempotency_key:
+            existing = Payment.objects.filter(user=user, idempotency_key=idempotency_key).first()
+            if existing is not None:
+                return existing, False
+        raise
@@ -0,0 +1,260 @@
+"""
+Double-entry journal for billing.
+
+Billing records, invoices, payments and expenses post balanced entries to
+JournalEntry/JournalLine as they are saved or deleted. Posting is by
+difference: the lines a source should contribute are compared with what it
+has already posted, and only the change is appended, so the journal is never
+rewritten and a deleted source nets to zero.
+
+Amounts are signed ``debit - credit`` in the currency of their source and
+are never converted, so every posting and balance is kept per currency.
+BalanceCheckpoint rows hold the cumulative balance of every account, case,
+client and currency at a date, so a balance at any date is the latest
+earlier checkpoint plus the lines posted after it.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Max, Q, QuerySet, Sum
+
+from .currency import base_currency
+from .models import BalanceCheckpoint, BillingInfo, Expense, Invoice, JournalEntry, JournalLine, Payment
+
+ZERO = Decimal('0')
+# Invoices that are not (or no longer) owed
+UNPOSTED_INVOICE_STATUSES = ('draft', 'cancelled')
+
+SOURCE_TYPES = {
+    BillingInfo: 'billing_info',
+    Invoice: 'invoice',
+    Payment: 'payment',
+    Expense: 'expense',
+}
+
+
+class Postings:
+    """Signed amounts keyed by (entry_date, account, case_id, client_name, currency)"""
+
+    def __init__(self, currency=None):
+        self.currency = (currency or base_currency()).upper()
+        self.amounts = defaultdict(Decimal)
+
+    def add(self, entry_date, debit_account, credit_account, amount, case_id=None, client_name=''):
+        amount = Decimal(amount or 0)
+        if not amount:
+            return
+        client_name = client_name or ''
+        self.amounts[(entry_date, debit_account, case_id, client_name, self.currency)] += amount
+        self.amounts[(entry_date, credit_account, case_id, client_name, self.currency)] -= amount
+
+
+def billing_info_postings(record):
+    postings = Postings(record.currency)
+    if record.payment_status == 'cancelled':
+        return postings
+    if record.billed_invoice_id and record.billed_invoice.status not in UNPOSTED_INVOICE_STATUSES:
+        # Hours billed through a posted invoice are carried by that invoice
+        return postings
+    postings.add(record.invoice_date, 'receivable', 'revenue', record.amount, record.case_id, record.client_name)
+    if record.payment_status == 'paid':
+        postings.add(
+            record.payment_date or record.invoice_date, 'cash', 'receivable', record.amount,
+            record.case_id, record.client_name
+        )
+    return postings
+
+
+def invoice_postings(invoice):
+    postings = Postings(invoice.currency)
+    if invoice.status in UNPOSTED_INVOICE_STATUSES:
+        return postings
+    tax = invoice.tax_amount or ZERO
+    postings.add(
+        invoice.invoice_date, 'receivable', 'revenue', (invoice.total_amount or ZERO) - tax,
+        invoice.case_id, invoice.client_name
+    )
+    postings.add(invoice.invoice_date, 'receivable', 'tax_payable', tax, invoice.case_id, invoice.client_name)
+    return postings
+
+
+def payment_postings(payment):
+    invoice = payment.invoice
+    postings = Postings(invoice.currency)
+    postings.add(payment.payment_date, 'cash', 'receivable', payment.amount, invoice.case_id, invoice.client_name)
+    return postings
+
+
+def expense_postings(expense):
+    postings = Postings(expense.currency)
+    account = 'disbursements' if expense.is_reimbursable else 'expenses'
+    postings.add(expense.expense_date, account, 'cash', expense.amount, expense.case_id, expense.case.client_name)
+    return postings
+
+
+POSTING_RULES = {
+    'billing_info': billing_info_postings,
+    'invoice': invoice_postings,
+    'payment': payment_postings,
+    'expense': expense_postings,
+}
+
+
+def posted_amounts(source_type, source_id):
+    """Net amounts a source has posted so far, keyed like Postings"""
+    rows = JournalLine.objects.filter(
+        entry__source_type=source_type, entry__source_id=source_id
+    ).values('entry_date', 'account', 'case_id', 'client_name', 'currency').annotate(
+        net=Sum('debit') - Sum('credit')
+    )
+    return {
+        (row['entry_date'], row['account'], row['case_id'], row['client_name'], row['currency']): row['net']
+        for row in rows
+    }
+
+
+@transaction.atomic
+def post_source(source_type, source_id, user_id, postings, description=''):
+    """Append the entry that brings a source's posted lines to ``postings``"""
+    current = posted_amounts(source_type, source_id)
+    delta = defaultdict(Decimal, postings.amounts)
+    for key, net in current.items():
+        delta[key] -= net
+    delta = {key: amount for key, amount in delta.items() if amount}
+    if not delta:
+        return None
+
+    entry = JournalEntry.objects.create(
+        user_id=user_id, source_type=source_type, source_id=source_id, description=description[:300]
+    )
+    JournalLine.objects.bulk_create([
+        JournalLine(
+            entry=entry, user_id=user_id, entry_date=entry_date, account=account,
+            case_id=case_id, client_name=client_name, currency=currency,
+            debit=amount if amount > 0 else ZERO,
+            credit=-amount if amount < 0 else ZERO,
+        )
+        for (entry_date, account, case_id, client_name, currency), amount in sorted(delta.items(), key=str)
+    ])
+    return entry
+
+
+def post_instance(instance):
+    source_type = SOURCE_TYPES[type(instance)]
+    postings = POSTING_RULES[source_type](instance)
+    return post_source(source_type, instance.pk, instance.user_id, postings, str(instance))
+
+
+def post_billed_records(record_ids):
+    """
+    Re-post billing records after their invoice changed status or was deleted.
+
+    Records stay in the ledger while their invoice is a draft or cancelled,
+    and are carried by the invoice once it is posted.
+    """
+    records = BillingInfo.objects.filter(pk__in=record_ids).select_related('billed_invoice')
+    for record in records:
+        post_instance(record)
+
+
+def reverse_instance(instance):
+    """Net out everything a deleted source posted"""
+    return post_source(
+        SOURCE_TYPES[type(instance)], instance.pk, instance.user_id, Postings(), f'Deleted: {instance}'
+    )
+
+
+def deleting_user(origin):
+    """True when a delete cascades from removing a user (their ledger goes too)"""
+    User = get_user_model()
+    if isinstance(origin, QuerySet):
+        return origin.model is User
+    return isinstance(origin, User)
+
+
+def _checkpoint_filter(checkpoint):
+    """Lines not yet covered by ``checkpoint`` (dict with as_of, last_line_id)"""
+    return Q(entry_date__gt=checkpoint['as_of']) | Q(id__gt=checkpoint['last_line_id'])
+
+
+def latest_checkpoint(user, as_of):
+    return BalanceCheckpoint.objects.filter(user=user, as_of__lte=as_of).order_by(
+        '-as_of'
+    ).values('as_of', 'last_line_id').first()
+
+
+def account_balances(user, as_of, case=None, client_name=None, currency=None):
+    """
+    ``{currency: {account: debit - credit}}`` at the end of ``as_of``,
+    optionally for one case, client or currency.
+    """
+    filters = {}
+    if case is not None:
+        filters['case'] = case
+    if client_name is not None:
+        filters['client_name'] = client_name
+    if currency is not None:
+        filters['currency'] = currency.upper()
+
+    balances = defaultdict(Decimal)
+    lines = JournalLine.objects.filter(user=user, entry_date__lte=as_of, **filters)
+    checkpoint = latest_checkpoint(user, as_of)
+    if checkpoint is not None:
+        rows = BalanceCheckpoint.objects.filter(
+            user=user, as_of=checkpoint['as_of'], **filters
+        ).values('currency', 'account').annotate(total=Sum('balance'))
+        for row in rows:
+            balances[(row['currency'], row['account'])] += row['total']
+        lines = lines.filter(_checkpoint_filter(checkpoint))
+
+    for row in lines.values('currency', 'account').annotate(total=Sum('debit') - Sum('credit')):
+        balances[(row['currency'], row['account'])] += row['total']
+
+    by_currency = defaultdict(dict)
+    for (line_currency, account), balance in sorted(balances.items()):
+        if balance:
+            by_currency[line_currency][account] = balance
+    return dict(by_currency)
+
+
+@transaction.atomic
+def create_checkpoint(user_id, as_of):
+    """
+    Record every account, case, client and currency balance of a user at ``as_of``.
+
+    Meant for a scheduled job over past dates. Returns the number of rows
+    written, or None when a checkpoint at or after ``as_of`` exists.
+    """
+    previous = BalanceCheckpoint.objects.filter(user_id=user_id).order_by(
+        '-as_of'
+    ).values('as_of', 'last_line_id').first()
+    if previous is not None and previous['as_of'] >= as_of:
+        return None
+
+    last_line_id = JournalLine.objects.filter(user_id=user_id).aggregate(last=Max('id'))['last'] or 0
+    totals = defaultdict(Decimal)
+    lines = JournalLine.objects.filter(user_id=user_id, entry_date__lte=as_of, id__lte=last_line_id)
+    if previous is not None:
+        rows = BalanceCheckpoint.objects.filter(user_id=user_id, as_of=previous['as_of']).values_list(
+            'account', 'case_id', 'client_name', 'currency', 'balance'
+        )
+        for account, case_id, client_name, currency, balance in rows:
+            totals[(account, case_id, client_name, currency)] += balance
+        lines = lines.filter(_checkpoint_filter(previous))
+
+    rows = lines.values('account', 'case_id', 'client_name', 'currency').annotate(net=Sum('debit') - Sum('credit'))
+    for row in rows:
+        totals[(row['account'], row['case_id'], row['client_name'], row['currency'])] += row['net']
+
+    checkpoints = [
+        BalanceCheckpoint(
+            user_id=user_id, as_of=as_of, account=account, case_id=case_id,
+            client_name=client_name, currency=currency, balance=balance, last_line_id=last_line_id
+        )
+        for (account, case_id, client_name, currency), balance in totals.items()
+        if balance
+    ]
+    BalanceCheckpoint.objects.bulk_create(checkpoints, batch_size=1000)
+    return len(checkpoints)
@@ -0,0 +1,92 @@
+from datetime import datetime, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from billing.ledger import SOURCE_TYPES, create_checkpoint, post_instance
+from billing.models import BillingInfo, JournalLine, Payment, Expense
+
+class Command(BaseCommand):
+    help = 'Write ledger balance checkpoints (and optionally post existing billing data)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--date',
+            help='Checkpoint date as YYYY-MM-DD (defaults to yesterday)'
+        )
+        parser.add_argument(
+            '--user',
+            type=int,
+            help='Only checkpoint this user id'
+        )
+        parser.add_argument(
+            '--backfill',
+            action='store_true',
+            help='First post every billing record, invoice, payment and expense missing from the journal'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show what would be checkpointed without writing anything'
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        if options['date']:
+            try:
+                as_of = datetime.strptime(options['date'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('--date must be formatted YYYY-MM-DD')
+        else:
+            as_of = timezone.now().date() - timedelta(days=1)
+
+        self.stdout.write(f'📒 Checkpointing ledger balances at {as_of}...')
+        if dry_run:
+            self.stdout.write('📋 DRY RUN - No data will be modified')
+
+        if options['backfill']:
+            self.backfill(options['user'], dry_run)
+
+        user_ids = JournalLine.objects.order_by('user_id').values_list('user_id', flat=True).distinct()
+        if options['user']:
+            user_ids = user_ids.filter(user_id=options['user'])
+
+        users = rows = 0
+        for user_id in user_ids.iterator():
+            if dry_run:
+                users += 1
+                continue
+            written = create_checkpoint(user_id, as_of)
+            if written is None:
+                self.stdout.write(f'   User {user_id}: already checkpointed at or after {as_of}')
+                continue
+            users += 1
+            rows += written
+
+        self.stdout.write(
+            f'   {"Would checkpoint" if dry_run else "Checkpointed"} {users} users ({rows} balances)'
+        )
+        if not dry_run:
+            self.stdout.write(
+                self.style.SUCCESS('✅ Ledger checkpoint complete!')
+            )
+
+    def backfill(self, user_id, dry_run):
+        for model, source_type in SOURCE_TYPES.items():
+            queryset = model.objects.order_by('pk')
+            if model is Payment:
+                queryset = queryset.select_related('invoice')
+            elif model is BillingInfo:
+                queryset = queryset.select_related('billed_invoice')
+            elif model is Expense:
+                queryset = queryset.select_related('case')
+            if user_id:
+                queryset = queryset.filter(user_id=user_id)
+
+            posted = 0
+            for instance in queryset.iterator(chunk_size=500):
+                if dry_run:
+                    posted += 1
+                elif post_instance(instance) is not None:
+                    posted += 1
+            self.stdout.write(
+                f'   {source_type}: {posted} {"to check" if dry_run else "entries posted"}'
+            )
@@ -0,0 +1,73 @@
+import calendar
+from datetime import datetime, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from billing.batch import invoice_unbilled_work, users_with_unbilled_work
+
+class Command(BaseCommand):
+    help = 'Draft invoices from unbilled hours and reimbursable expenses at month end'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--month',
+            help='Month to close as YYYY-MM (defaults to the previous month)'
+        )
+        parser.add_argument(
+            '--group-by',
+            choices=['case', 'client'],
+            default='case',
+            help='Draft one invoice per case (default) or per client'
+        )
+        parser.add_argument(
+            '--user',
+            type=int,
+            help='Only invoice this user id'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Preview the invoices without creating them'
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        if options['month']:
+            try:
+                month = datetime.strptime(options['month'], '%Y-%m').date()
+            except ValueError:
+                raise CommandError('--month must be formatted YYYY-MM')
+        else:
+            first_of_month = timezone.now().date().replace(day=1)
+            month = (first_of_month - timedelta(days=1)).replace(day=1)
+        period_end = month.replace(day=calendar.monthrange(month.year, month.month)[1])
+
+        self.stdout.write(f'🧾 Invoicing unbilled work up to {period_end}...')
+        if dry_run:
+            self.stdout.write('📋 DRY RUN - No invoices will be created')
+
+        user_ids = users_with_unbilled_work(period_end)
+        if options['user']:
+            user_ids = [user_id for user_id in user_ids if user_id == options['user']]
+
+        invoices = items = 0
+        for user_id in user_ids:
+            drafts = invoice_unbilled_work(
+                user_id, period_end, group_by=options['group_by'], dry_run=dry_run
+            )
+            for draft in drafts:
+                invoices += 1
+                items += len(draft.items)
+                number = f'draft #{draft.invoice.pk}' if draft.invoice else 'draft'
+                self.stdout.write(
+                    f'   User {user_id} · {draft.client_name} · {number}: '
+                    f'{len(draft.items)} items, {draft.subtotal} {draft.currency} before tax '
+                    f'({len(draft.records)} billing records, {len(draft.expenses)} expenses)'
+                )
+
+        self.stdout.write(
+            f'   {"Would create" if dry_run else "Created"} {invoices} invoices with {items} items'
+        )
+        if not dry_run:
+            self.stdout.write(
+                self.style.SUCCESS('✅ Month-end invoicing complete!')
+            )
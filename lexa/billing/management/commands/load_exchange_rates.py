@@ -0,0 +1,73 @@
+import csv
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from billing.analytics import invalidate_all_revenue
+from billing.currency import base_currency, rate_cache
+from billing.models import ExchangeRate
+
+class Command(BaseCommand):
+    help = 'Load daily exchange rates from a CSV file (currency,date,rate)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'file',
+            help='CSV file with currency, date (YYYY-MM-DD) and rate columns; rate is the base-currency value of one unit'
+        )
+        parser.add_argument(
+            '--source',
+            default='',
+            help='Label stored with every loaded rate'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Validate the file without writing anything'
+        )
+
+    def handle(self, *args, **options):
+        rates = {}
+        try:
+            with open(options['file'], newline='', encoding='utf-8') as handle:
+                for line, row in enumerate(csv.DictReader(handle), start=2):
+                    rate = self.parse(row, line, options['source'])
+                    if rate.currency == base_currency():
+                        continue
+                    rates[(rate.currency, rate.rate_date)] = rate
+        except OSError as exc:
+            raise CommandError(f'Cannot read {options["file"]}: {exc}')
+
+        self.stdout.write(f'💱 Loading {len(rates)} exchange rates...')
+        if options['dry_run']:
+            self.stdout.write('📋 DRY RUN - No data will be modified')
+            return
+
+        with transaction.atomic():
+            ExchangeRate.objects.bulk_create(
+                rates.values(),
+                batch_size=500,
+                update_conflicts=True,
+                unique_fields=['currency', 'rate_date'],
+                update_fields=['rate', 'source'],
+            )
+        # bulk_create skips the signals that retire cached rates
+        rate_cache.clear()
+        invalidate_all_revenue()
+
+        currencies = sorted({currency for currency, _ in rates})
+        self.stdout.write(f'   Currencies: {", ".join(currencies) or "none"}')
+        self.stdout.write(
+            self.style.SUCCESS('✅ Exchange rates loaded!')
+        )
+
+    def parse(self, row, line, source):
+        try:
+            currency = row['currency'].strip().upper()
+            rate_date = datetime.strptime(row['date'].strip(), '%Y-%m-%d').date()
+            rate = Decimal(row['rate'].strip()).quantize(Decimal('0.000001'))
+        except (KeyError, AttributeError, ValueError, InvalidOperation):
+            raise CommandError(f'Line {line}: expected currency, date (YYYY-MM-DD) and rate')
+        if len(currency) != 3 or rate <= 0:
+            raise CommandError(f'Line {line}: invalid currency or non-positive rate')
+        return ExchangeRate(currency=currency, rate_date=rate_date, rate=rate, source=source)
@@ -0,0 +1,48 @@
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from billing.models import Invoice
+from billing.pdf import prerender_invoices
+
+class Command(BaseCommand):
+    help = "Pre-render a month's invoice PDFs in the worker pool"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--month',
+            help='Month to render as YYYY-MM (defaults to the current month)'
+        )
+        parser.add_argument(
+            '--user',
+            type=int,
+            help="Only render this user's invoices"
+        )
+        parser.add_argument(
+            '--include-drafts',
+            action='store_true',
+            help='Also render draft invoices'
+        )
+
+    def handle(self, *args, **options):
+        if options['month']:
+            try:
+                month = datetime.strptime(options['month'], '%Y-%m').date()
+            except ValueError:
+                raise CommandError('--month must be formatted YYYY-MM')
+        else:
+            month = timezone.now().date().replace(day=1)
+
+        invoices = Invoice.objects.filter(
+            invoice_date__year=month.year, invoice_date__month=month.month
+        ).order_by('pk')
+        if not options['include_drafts']:
+            invoices = invoices.exclude(status__in=['draft', 'cancelled'])
+        if options['user']:
+            invoices = invoices.filter(user_id=options['user'])
+
+        self.stdout.write(f'🖨️ Rendering invoices for {month:%Y-%m}...')
+        rendered, cached, failed = prerender_invoices(invoices)
+        self.stdout.write(f'   {rendered} rendered, {cached} already cached, {failed} failed')
+        self.stdout.write(
+            self.style.SUCCESS('✅ Invoice PDFs ready!')
+        )
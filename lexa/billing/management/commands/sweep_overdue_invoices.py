@@ -0,0 +1,39 @@
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from billing.overdue import sweep_overdue
+
+class Command(BaseCommand):
+    help = 'Mark past-due invoices and billing records as overdue and notify their owners (run nightly)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--date',
+            help='Treat this YYYY-MM-DD as today'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Count what would become overdue without changing anything'
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        today = None
+        if options['date']:
+            try:
+                today = datetime.strptime(options['date'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('--date must be formatted YYYY-MM-DD')
+
+        self.stdout.write('⏰ Sweeping overdue invoices...')
+        if dry_run:
+            self.stdout.write('📋 DRY RUN - No data will be modified')
+
+        invoices, records, notifications = sweep_overdue(today, dry_run=dry_run)
+        verb = 'Would mark' if dry_run else 'Marked'
+        self.stdout.write(f'   {verb} {invoices} invoices and {records} billing records overdue')
+        self.stdout.write(f'   {"Would send" if dry_run else "Sent"} {notifications} notifications')
+        if not dry_run:
+            self.stdout.write(
+                self.style.SUCCESS('✅ Overdue sweep complete!')
+            )
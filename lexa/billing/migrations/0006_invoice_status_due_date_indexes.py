@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-19 16:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0005_remove_billinginfo_cleint_name_billinginfo_amount_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['user', 'status', 'due_date'], name='billing_inv_user_id_dda3f6_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['status', 'due_date'], name='billing_inv_status_996e80_idx'),
+        ),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 4.2.7 on 2026-10-19 16:35
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('cases', '0002_alter_jurisdiction_level_alter_jurisdiction_type_fr'),
+        ('billing', '0007_payment_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JournalEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source_type', models.CharField(choices=[('billing_info', 'Billing Record'), ('invoice', 'Invoice'), ('payment', 'Payment'), ('expense', 'Expense')], max_length=20)),
+                ('source_id', models.PositiveIntegerField()),
+                ('description', models.CharField(blank=True, max_length=300)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='journal_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Journal Entry',
+                'verbose_name_plural': 'Journal Entries',
+                'ordering': ['-id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='BalanceCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('as_of', models.DateField()),
+                ('account', models.CharField(choices=[('receivable', 'Accounts Receivable'), ('revenue', 'Fee Revenue'), ('tax_payable', 'TVA Payable'), ('cash', 'Cash and Bank'), ('expenses', 'Expenses'), ('disbursements', 'Recoverable Disbursements')], max_length=20)),
+                ('client_name', models.CharField(blank=True, max_length=200)),
+                ('balance', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('last_line_id', models.PositiveBigIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('case', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='cases.case')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_checkpoints', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Balance Checkpoint',
+                'verbose_name_plural': 'Balance Checkpoints',
+                'ordering': ['-as_of'],
+            },
+        ),
+        migrations.CreateModel(
+            name='JournalLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entry_date', models.DateField()),
+                ('account', models.CharField(choices=[('receivable', 'Accounts Receivable'), ('revenue', 'Fee Revenue'), ('tax_payable', 'TVA Payable'), ('cash', 'Cash and Bank'), ('expenses', 'Expenses'), ('disbursements', 'Recoverable Disbursements')], max_length=20)),
+                ('client_name', models.CharField(blank=True, max_length=200)),
+                ('debit', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('credit', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('case', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='cases.case')),
+                ('entry', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='billing.journalentry')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='journal_lines', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Journal Line',
+                'verbose_name_plural': 'Journal Lines',
+                'indexes': [models.Index(fields=['user', 'account', 'entry_date'], name='billing_jou_user_id_56b0ae_idx'), models.Index(fields=['user', 'case', 'entry_date'], name='billing_jou_user_id_53c29b_idx')],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='journalentry',
+            index=models.Index(fields=['source_type', 'source_id'], name='billing_jou_source__4adc24_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='balancecheckpoint',
+            index=models.Index(fields=['user', 'as_of', 'account'], name='billing_bal_user_id_cf1a2b_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.7 on 2026-10-19 16:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0009_invoice_sequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='billinginfo',
+            name='billed_invoice',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='billed_records', to='billing.invoice'),
+        ),
+        migrations.AddField(
+            model_name='expense',
+            name='billed_invoice',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='billed_expenses', to='billing.invoice'),
+        ),
+    ]
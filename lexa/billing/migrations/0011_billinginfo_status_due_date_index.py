@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-19 16:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0010_billed_invoice'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='billinginfo',
+            index=models.Index(fields=['payment_status', 'due_date'], name='billing_bil_payment_5df974_idx'),
+        ),
+    ]
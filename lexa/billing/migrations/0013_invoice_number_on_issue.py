@@ -0,0 +1,36 @@
+# Generated by Django 4.2.7 on 2026-10-19 16:55
+
+from django.db import migrations, models
+
+
+def seed_sequences(apps, schema_editor):
+    """Start every sequence after the numbers already stored in its format"""
+    from billing.numbering import highest_issued
+
+    InvoiceSequence = apps.get_model('billing', 'InvoiceSequence')
+    Invoice = apps.get_model('billing', 'Invoice')
+    Invoice.objects.filter(invoice_number='').update(invoice_number=None)
+
+    for series, model in (('invoice', Invoice), ('billing_info', apps.get_model('billing', 'BillingInfo'))):
+        numbers = model.objects.exclude(invoice_number__isnull=True).values_list('invoice_number', flat=True)
+        for year, number in highest_issued(series, numbers.iterator()).items():
+            sequence, _ = InvoiceSequence.objects.get_or_create(series=series, year=year)
+            if sequence.last_number < number:
+                sequence.last_number = number
+                sequence.save(update_fields=['last_number'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0012_exchange_rate'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='invoice',
+            name='invoice_number',
+            field=models.CharField(blank=True, max_length=50, null=True, unique=True),
+        ),
+        migrations.RunPython(seed_sequences, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 4.2.7 on 2026-10-19 17:09
+
+from django.db import migrations, models
+
+# Source type -> (model name, path to the currency of its rows)
+SOURCE_CURRENCIES = {
+    'billing_info': ('BillingInfo', 'currency'),
+    'invoice': ('Invoice', 'currency'),
+    'payment': ('Payment', 'invoice__currency'),
+    'expense': ('Expense', 'currency'),
+}
+
+
+def tag_line_currencies(apps, schema_editor):
+    """
+    Give existing lines the currency of their source and drop checkpoints.
+
+    Checkpoints summed every currency together; checkpoint_ledger rebuilds
+    them per currency. Lines of deleted sources keep the default currency.
+    """
+    JournalEntry = apps.get_model('billing', 'JournalEntry')
+    JournalLine = apps.get_model('billing', 'JournalLine')
+    apps.get_model('billing', 'BalanceCheckpoint').objects.all().delete()
+
+    for source_type, (model_name, currency_path) in SOURCE_CURRENCIES.items():
+        currencies = dict(
+            apps.get_model('billing', model_name).objects.values_list('pk', currency_path).iterator()
+        )
+        entries = {}
+        for entry_id, source_id in JournalEntry.objects.filter(source_type=source_type).values_list(
+            'id', 'source_id'
+        ).iterator():
+            currency = currencies.get(source_id)
+            if currency:
+                entries.setdefault(currency.upper(), []).append(entry_id)
+        for currency, entry_ids in entries.items():
+            for start in range(0, len(entry_ids), 500):
+                JournalLine.objects.filter(entry_id__in=entry_ids[start:start + 500]).update(currency=currency)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0013_invoice_number_on_issue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='balancecheckpoint',
+            name='currency',
+            field=models.CharField(default='DZD', max_length=3),
+        ),
+        migrations.AddField(
+            model_name='journalline',
+            name='currency',
+            field=models.CharField(default='DZD', max_length=3),
+        ),
+        migrations.RunPython(tag_line_currencies, migrations.RunPython.noop),
+    ]
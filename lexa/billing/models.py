@@ -1,5 +1,5 @@
 # models.py - Updated sections for better frontend compatibility
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth import get_user_model
 from django.utils.translation import gettext_lazy as _
 from django.core.validators import MinValueValidator
@@ -35,8 +35,8 @@ class BillingInfo(models.Model):
     rc = models.CharField(max_length=20, blank=True, help_text="Registre de Commerce")
     tva = models.CharField(max_length=20, blank=True, help_text="Numéro TVA")
     
-    # Invoice details
-    invoice_number = models.CharField(max_length=50, unique=True)
+    # Invoice details; the number is issued from the yearly sequence when left blank
+    invoice_number = models.CharField(max_length=50, unique=True, blank=True)
     invoice_date = models.DateField()
     due_date = models.DateField()
     payment_status = models.CharField(max_length=20, choices=PAYMENT_STATUS_CHOICES, default='pending')
@@ -53,6 +53,11 @@ class BillingInfo(models.Model):
     # Notes
     notes = models.TextField(blank=True)
     terms_conditions = models.TextField(blank=True)
+
+    # Invoice that billed these hours (month-end batch invoicing)
+    billed_invoice = models.ForeignKey(
+        'Invoice', on_delete=models.SET_NULL, null=True, blank=True, related_name='billed_records'
+    )
     
     # User relationship
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='billing_records')
@@ -65,21 +70,33 @@ class BillingInfo(models.Model):
         verbose_name = _('Billing Information')
         verbose_name_plural = _('Billing Information')
         ordering = ['-invoice_date']
+        indexes = [
+            models.Index(fields=['payment_status', 'due_date']),
+        ]
 
     def __str__(self):
         return f"{self.invoice_number} - {self.case.reference}"
 
     @property
     def is_overdue(self):
-        """Check if payment is overdue"""
+        """Check if payment is overdue (the nightly sweep sets the status)"""
         from django.utils import timezone
+        if self.payment_status == 'overdue':
+            return True
         return self.payment_status == 'pending' and self.due_date < timezone.now().date()
 
     def save(self, *args, **kwargs):
         # Calculate total amount
         base_amount = (self.hourly_rate or 0) * (self.hours_worked or 0)
         self.amount = base_amount + self.advanced_expenses + self.court_fees + self.administrative_fees
-        super().save(*args, **kwargs)
+        if self.invoice_number:
+            super().save(*args, **kwargs)
+            return
+        from .numbering import next_number
+        # Number and row commit together, so a failed insert leaves no gap
+        with transaction.atomic():
+            self.invoice_number = next_number('billing_info', self.invoice_date)
+            super().save(*args, **kwargs)
 
 class Invoice(models.Model):
     INVOICE_STATUS_CHOICES = [
@@ -91,8 +108,9 @@ class Invoice(models.Model):
         ('cancelled', _('Cancelled')),
     ]
 
-    # Invoice identification
-    invoice_number = models.CharField(max_length=50, unique=True)
+    # Invoice identification; drafts have no number, one is issued from the
+    # yearly sequence when the invoice leaves draft
+    invoice_number = models.CharField(max_length=50, unique=True, null=True, blank=True)
     invoice_date = models.DateField()
     due_date = models.DateField()
     
@@ -134,9 +152,13 @@ class Invoice(models.Model):
         verbose_name = _('Invoice')
         verbose_name_plural = _('Invoices')
         ordering = ['-invoice_date']
+        indexes = [
+            models.Index(fields=['user', 'status', 'due_date']),
+            models.Index(fields=['status', 'due_date']),
+        ]
 
     def __str__(self):
-        return f"{self.invoice_number} - {self.client_name}"
+        return f"{self.invoice_number or _('Draft')} - {self.client_name}"
 
     @property
     def outstanding_amount(self):
@@ -145,15 +167,36 @@ class Invoice(models.Model):
 
     @property
     def is_overdue(self):
-        """Check if invoice is overdue"""
+        """Check if invoice is overdue (the nightly sweep sets the status)"""
         from django.utils import timezone
+        if self.status == 'overdue':
+            return True
         return self.status in ['sent', 'partially_paid'] and self.due_date < timezone.now().date()
 
+    def save(self, *args, **kwargs):
+        if self.invoice_number or self.status == 'draft':
+            self.invoice_number = self.invoice_number or None
+            super().save(*args, **kwargs)
+            return
+        from .numbering import next_number
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'invoice_number'}
+        # Number and row commit together, so a failed save leaves no gap
+        try:
+            with transaction.atomic():
+                self.invoice_number = next_number('invoice', self.invoice_date)
+                super().save(*args, **kwargs)
+        except Exception:
+            # The number went back to the sequence with the rollback
+            self.invoice_number = None
+            raise
+
     def calculate_totals(self):
         """Recalculate invoice totals based on items"""
-        self.subtotal = sum(item.total_price for item in self.items.all())
-        self.tax_amount = (self.subtotal * self.tax_rate) / 100
-        self.total_amount = self.subtotal + self.tax_amount
+        from .invoicing import apply_totals
+        subtotal = self.items.aggregate(total=models.Sum('total_price'))['total']
+        apply_totals(self, subtotal or 0)
 
 class InvoiceItem(models.Model):
     invoice = models.ForeignKey(Invoice, on_delete=models.CASCADE, related_name='items')
@@ -177,17 +220,33 @@ class InvoiceItem(models.Model):
         return f"{self.description} - {self.total_price} {self.invoice.currency}"
 
     def save(self, *args, **kwargs):
-        # Calculate total price automatically
-        if self.hours_worked and self.hourly_rate:
-            self.total_price = self.hours_worked * self.hourly_rate
-        else:
-            self.total_price = self.quantity * self.unit_price
+        # Calculate total price automatically; invoice totals are updated
+        # once per write by billing.invoicing, not per item
+        from .invoicing import price_item
+        price_item(self)
         super().save(*args, **kwargs)
-        
-        # Update invoice totals
-        if self.invoice_id:
-            self.invoice.calculate_totals()
-            self.invoice.save()
+
+class InvoiceSequence(models.Model):
+    """Last number issued per series and year; rows are locked while numbering"""
+    SERIES_CHOICES = [
+        ('invoice', _('Invoice')),
+        ('billing_info', _('Billing Record')),
+    ]
+
+    series = models.CharField(max_length=20, choices=SERIES_CHOICES)
+    year = models.PositiveIntegerField()
+    last_number = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = _('Invoice Sequence')
+        verbose_name_plural = _('Invoice Sequences')
+        constraints = [
+            models.UniqueConstraint(fields=['series', 'year'], name='unique_invoice_sequence_year'),
+        ]
+
+    def __str__(self):
+        return f"{self.series} {self.year}: {self.last_number}"
 
 # Keep Payment and Expense models as they were - they're fine
 class Payment(models.Model):
@@ -214,6 +273,9 @@ class Payment(models.Model):
     
     # User relationship
     user = models.ForeignKey(User, on_delete=models.CASCADE)
+
+    # Client-supplied Idempotency-Key, so a retried request records nothing twice
+    idempotency_key = models.CharField(max_length=100, blank=True)
     
     # Metadata
     created_at = models.DateTimeField(auto_now_add=True)
@@ -222,6 +284,13 @@ class Payment(models.Model):
         verbose_name = _('Payment')
         verbose_name_plural = _('Payments')
         ordering = ['-payment_date']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'idempotency_key'],
+                condition=~models.Q(idempotency_key=''),
+                name='unique_payment_idempotency_key',
+            ),
+        ]
 
     def __str__(self):
         return f"Payment {self.amount} for {self.invoice.invoice_number}"
@@ -253,6 +322,9 @@ class Expense(models.Model):
     is_reimbursable = models.BooleanField(default=True)
     is_reimbursed = models.BooleanField(default=False)
     reimbursement_date = models.DateField(null=True, blank=True)
+    billed_invoice = models.ForeignKey(
+        Invoice, on_delete=models.SET_NULL, null=True, blank=True, related_name='billed_expenses'
+    )
     
     # Currency
     currency = models.CharField(max_length=3, default='DZD')
@@ -272,4 +344,121 @@ class Expense(models.Model):
         ordering = ['-expense_date']
 
     def __str__(self):
-        return f"{self.description} - {self.amount} {self.currency}"
\ No newline at end of file
+        return f"{self.description} - {self.amount} {self.currency}"
+
+class JournalEntry(models.Model):
+    """
+    One balanced posting to the ledger.
+
+    Entries are append-only: a changed or deleted invoice, payment, expense
+    or billing record is corrected by a further entry for the same source.
+    """
+    SOURCE_CHOICES = [
+        ('billing_info', _('Billing Record')),
+        ('invoice', _('Invoice')),
+        ('payment', _('Payment')),
+        ('expense', _('Expense')),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='journal_entries')
+    source_type = models.CharField(max_length=20, choices=SOURCE_CHOICES)
+    source_id = models.PositiveIntegerField()
+    description = models.CharField(max_length=300, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = _('Journal Entry')
+        verbose_name_plural = _('Journal Entries')
+        ordering = ['-id']
+        indexes = [
+            models.Index(fields=['source_type', 'source_id']),
+        ]
+
+    def __str__(self):
+        return f"{self.get_source_type_display()} #{self.source_id} ({self.id})"
+
+
+class JournalLine(models.Model):
+    ACCOUNT_CHOICES = [
+        ('receivable', _('Accounts Receivable')),
+        ('revenue', _('Fee Revenue')),
+        ('tax_payable', _('TVA Payable')),
+        ('cash', _('Cash and Bank')),
+        ('expenses', _('Expenses')),
+        ('disbursements', _('Recoverable Disbursements')),
+    ]
+
+    entry = models.ForeignKey(JournalEntry, on_delete=models.CASCADE, related_name='lines')
+    # Denormalized from the entry so balances are read from this table alone
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='journal_lines')
+    entry_date = models.DateField()
+    account = models.CharField(max_length=20, choices=ACCOUNT_CHOICES)
+    # Ledger history outlives the case; deleting one posts reversals instead
+    case = models.ForeignKey(
+        Case, on_delete=models.DO_NOTHING, db_constraint=False, null=True, blank=True, related_name='+'
+    )
+    client_name = models.CharField(max_length=200, blank=True)
+    # Amounts stay in the source's currency; balances are kept per currency
+    currency = models.CharField(max_length=3, default='DZD')
+    debit = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    credit = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = _('Journal Line')
+        verbose_name_plural = _('Journal Lines')
+        indexes = [
+            models.Index(fields=['user', 'account', 'entry_date']),
+            models.Index(fields=['user', 'case', 'entry_date']),
+        ]
+
+    def __str__(self):
+        return f"{self.account} {self.debit - self.credit} on {self.entry_date}"
+
+
+class BalanceCheckpoint(models.Model):
+    """
+    Cumulative ``debit - credit`` of one account, case, client and currency
+    up to ``as_of``, covering every line with ``id <= last_line_id``.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='balance_checkpoints')
+    as_of = models.DateField()
+    account = models.CharField(max_length=20, choices=JournalLine.ACCOUNT_CHOICES)
+    case = models.ForeignKey(
+        Case, on_delete=models.DO_NOTHING, db_constraint=False, null=True, blank=True, related_name='+'
+    )
+    client_name = models.CharField(max_length=200, blank=True)
+    currency = models.CharField(max_length=3, default='DZD')
+    balance = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    last_line_id = models.PositiveBigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = _('Balance Checkpoint')
+        verbose_name_plural = _('Balance Checkpoints')
+        ordering = ['-as_of']
+        indexes = [
+            models.Index(fields=['user', 'as_of', 'account']),
+        ]
+
+    def __str__(self):
+        return f"{self.account} {self.balance} at {self.as_of}"
+
+
+class ExchangeRate(models.Model):
+    """Value of one unit of ``currency`` in BASE_CURRENCY on ``rate_date``"""
+    currency = models.CharField(max_length=3)
+    rate_date = models.DateField()
+    rate = models.DecimalField(max_digits=18, decimal_places=6, validators=[MinValueValidator(Decimal('0.000001'))])
+    source = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = _('Exchange Rate')
+        verbose_name_plural = _('Exchange Rates')
+        ordering = ['-rate_date', 'currency']
+        constraints = [
+            models.UniqueConstraint(fields=['currency', 'rate_date'], name='unique_exchange_rate_day'),
+        ]
+
+    def __str__(self):
+        return f"{self.currency} {self.rate} on {self.rate_date}"
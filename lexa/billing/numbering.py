@@ -0,0 +1,110 @@
+"""
+Gapless yearly invoice numbering.
+
+Each series (invoices, billing records) has one InvoiceSequence row per
+year. Numbers are taken by locking that row and advancing it inside the
+caller's transaction, so concurrent creates queue on the lock and a rolled
+back create hands its number back. Formats come from INVOICE_NUMBER_FORMATS
+and receive ``year`` and ``number``. A year's sequence starts after the
+highest number already stored in that format, so rows numbered before the
+sequence existed are never issued twice.
+"""
+import re
+import string
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from .models import BillingInfo, Invoice, InvoiceSequence
+
+DEFAULT_FORMATS = {
+    'invoice': 'FAC-{year}-{number:05d}',
+    'billing_info': 'HON-{year}-{number:05d}',
+}
+
+
+SERIES_MODELS = {
+    'invoice': Invoice,
+    'billing_info': BillingInfo,
+}
+
+
+def numbered_case_ids(case_ids):
+    """
+    Ids among ``case_ids`` that carry a numbered invoice or billing record.
+
+    Deleting such a case would cascade through issued numbers and leave
+    gaps in the legal sequence.
+    """
+    numbered = set(
+        Invoice.objects.filter(case_id__in=case_ids, invoice_number__isnull=False).values_list('case_id', flat=True)
+    )
+    numbered.update(
+        BillingInfo.objects.filter(case_id__in=case_ids).exclude(invoice_number='').values_list('case_id', flat=True)
+    )
+    return numbered
+
+
+def number_format(series):
+    return {**DEFAULT_FORMATS, **getattr(settings, 'INVOICE_NUMBER_FORMATS', {})}[series]
+
+
+def number_pattern(series):
+    """Regex matching the series' numbers, with ``year`` and ``number`` groups"""
+    parts = []
+    for literal, field, _, _ in string.Formatter().parse(number_format(series)):
+        parts.append(re.escape(literal))
+        if field in ('year', 'number'):
+            parts.append(rf'(?P<{field}>\d+)')
+    return re.compile(''.join(parts))
+
+
+def highest_issued(series, numbers):
+    """Highest number per year among ``numbers`` written in the series' format"""
+    pattern = number_pattern(series)
+    highest = {}
+    for value in numbers:
+        match = pattern.fullmatch(value or '')
+        if match and 'year' in pattern.groupindex:
+            year, number = int(match['year']), int(match['number'])
+            highest[year] = max(highest.get(year, 0), number)
+    return highest
+
+
+def _locked_sequence(series, year):
+    if not InvoiceSequence.objects.filter(series=series, year=year).exists():
+        numbers = SERIES_MODELS[series].objects.filter(
+            invoice_number__contains=str(year)
+        ).values_list('invoice_number', flat=True)
+        try:
+            with transaction.atomic():
+                InvoiceSequence.objects.create(
+                    series=series, year=year, last_number=highest_issued(series, numbers).get(year, 0)
+                )
+        except IntegrityError:
+            pass  # created by a concurrent transaction
+    return InvoiceSequence.objects.select_for_update().get(series=series, year=year)
+
+
+def reserve_numbers(series, on_date, count=1):
+    """
+    Issue ``count`` consecutive numbers for the year of ``on_date``.
+
+    Must run inside the transaction that stores the numbered rows.
+    """
+    if count < 1:
+        return []
+    if not transaction.get_connection().in_atomic_block:
+        raise RuntimeError('Invoice numbers must be reserved inside a transaction')
+
+    sequence = _locked_sequence(series, on_date.year)
+    first = sequence.last_number + 1
+    sequence.last_number += count
+    sequence.save(update_fields=['last_number', 'updated_at'])
+
+    pattern = number_format(series)
+    return [pattern.format(year=on_date.year, number=number) for number in range(first, first + count)]
+
+
+def next_number(series, on_date):
+    return reserve_numbers(series, on_date)[0]
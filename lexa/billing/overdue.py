@@ -0,0 +1,112 @@
+"""
+Overdue sweep.
+
+Sent and partially paid invoices, and pending billing records, whose due
+date has passed are switched to ``overdue`` with set-based UPDATEs, so
+overdue becomes a plain indexed status instead of a per-row computation.
+Each lawyer gets one ``invoice_overdue`` notification per switched row,
+written with a single bulk insert. Meant to run nightly.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from notifications.models import Notification, NotificationPreference
+from .analytics import invalidate_revenue
+from .models import BillingInfo, Invoice
+
+OVERDUE_INVOICE_FROM = ('sent', 'partially_paid')
+OVERDUE_RECORD_FROM = ('pending',)
+BATCH_SIZE = 500
+
+
+def overdue_invoices(today):
+    return Invoice.objects.filter(status__in=OVERDUE_INVOICE_FROM, due_date__lt=today)
+
+
+def overdue_records(today):
+    return BillingInfo.objects.filter(payment_status__in=OVERDUE_RECORD_FROM, due_date__lt=today)
+
+
+def _muted_users(user_ids):
+    """Users who turned off in-app payment notifications"""
+    return set(NotificationPreference.objects.filter(
+        user_id__in=user_ids, app_payment_updates=False
+    ).values_list('user_id', flat=True))
+
+
+def _invoice_notification(row, today):
+    days = (today - row['due_date']).days
+    return Notification(
+        user_id=row['user_id'],
+        title=f"Facture {row['invoice_number']} en retard",
+        message=(
+            f"La facture {row['invoice_number']} de {row['client_name']} est échue depuis "
+            f"{days} jour(s) ; reste à payer : {row['total_amount'] - row['amount_paid']} {row['currency']}."
+        ),
+        notification_type='invoice_overdue',
+        priority='high',
+        related_object_type='invoice',
+        related_object_id=row['id'],
+        data={'invoice_number': row['invoice_number'], 'due_date': row['due_date'].isoformat()},
+        sent_at=timezone.now(),
+    )
+
+
+def _record_notification(row, today):
+    days = (today - row['due_date']).days
+    return Notification(
+        user_id=row['user_id'],
+        title=f"Honoraires {row['invoice_number']} en retard",
+        message=(
+            f"Les honoraires {row['invoice_number']} de {row['client_name']} sont échus depuis "
+            f"{days} jour(s) : {row['amount']} {row['currency']}."
+        ),
+        notification_type='invoice_overdue',
+        priority='high',
+        related_object_type='billing_info',
+        related_object_id=row['id'],
+        data={'invoice_number': row['invoice_number'], 'due_date': row['due_date'].isoformat()},
+        sent_at=timezone.now(),
+    )
+
+
+def sweep_overdue(today=None, dry_run=False):
+    """
+    Mark everything past due as overdue and notify the owners.
+
+    Returns ``(invoices, records, notifications)`` counts; with ``dry_run``
+    the counts are what would change.
+    """
+    today = today or timezone.now().date()
+    invoice_fields = ('id', 'user_id', 'invoice_number', 'client_name', 'total_amount', 'amount_paid', 'currency', 'due_date')
+    record_fields = ('id', 'user_id', 'invoice_number', 'client_name', 'amount', 'currency', 'due_date')
+
+    with transaction.atomic():
+        invoices = list(overdue_invoices(today).select_for_update().values(*invoice_fields))
+        records = list(overdue_records(today).select_for_update().values(*record_fields))
+        user_ids = {row['user_id'] for row in invoices} | {row['user_id'] for row in records}
+        muted = _muted_users(user_ids)
+        notifications = [
+            _invoice_notification(row, today) for row in invoices if row['user_id'] not in muted
+        ] + [
+            _record_notification(row, today) for row in records if row['user_id'] not in muted
+        ]
+        if dry_run:
+            return len(invoices), len(records), len(notifications)
+
+        now = timezone.now()
+        for start in range(0, len(invoices), BATCH_SIZE):
+            ids = [row['id'] for row in invoices[start:start + BATCH_SIZE]]
+            Invoice.objects.filter(pk__in=ids, status__in=OVERDUE_INVOICE_FROM).update(
+                status='overdue', updated_at=now
+            )
+        for start in range(0, len(records), BATCH_SIZE):
+            ids = [row['id'] for row in records[start:start + BATCH_SIZE]]
+            BillingInfo.objects.filter(pk__in=ids, payment_status__in=OVERDUE_RECORD_FROM).update(
+                payment_status='overdue', updated_at=now
+            )
+        Notification.objects.bulk_create(notifications, batch_size=BATCH_SIZE)
+
+    # UPDATEs skip signals; the revenue payload counts overdue invoices
+    invalidate_revenue(*user_ids)
+    return len(invoices), len(records), len(notifications)
@@ -0,0 +1,367 @@
+"""
+Printable bilingual (French/Arabic) invoices.
+
+The invoice, its items, the lawyer's tax identifiers (UserProfile) and the
+client's (latest BillingInfo of the case) are flattened into a plain dict in
+the web process; the PDF itself is drawn with reportlab in the process pool.
+Output is cached under MEDIA_ROOT/invoices/pdf/<invoice id>/, named by a
+digest of the invoice's ``updated_at`` and the case, profile and billing
+record timestamps, so any edit renders a fresh file and repeat downloads
+are read straight from disk.
+
+Arabic needs a TrueType font with Arabic glyphs in INVOICE_PDF_FONT (for
+example DejaVu Sans or Amiri); without one the Arabic labels are left out.
+Requires ``reportlab``, ``arabic-reshaper`` and ``python-bidi``.
+"""
+import glob
+import hashlib
+import logging
+import os
+import shutil
+from concurrent.futures import as_completed
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import F, Max, OuterRef, Subquery
+
+from utils.background import call_in_process, process_pool
+from .models import BillingInfo
+
+logger = logging.getLogger(__name__)
+
+# Bump when the layout changes so cached files are re-rendered
+LAYOUT_VERSION = 1
+FONT_NAME = 'InvoiceFont'
+
+LABELS = {
+    'invoice': ('FACTURE', 'فاتورة'),
+    'number': ('N°', 'رقم'),
+    'date': ('Date', 'التاريخ'),
+    'due_date': ("Échéance", 'تاريخ الاستحقاق'),
+    'client': ('Client', 'الموكل'),
+    'case': ('Affaire', 'القضية'),
+    'description': ('Désignation', 'البيان'),
+    'quantity': ('Qté', 'الكمية'),
+    'unit_price': ('Prix unitaire', 'سعر الوحدة'),
+    'amount': ('Montant', 'المبلغ'),
+    'subtotal': ('Total HT', 'المجموع دون رسوم'),
+    'tax': ('TVA', 'الرسم على القيمة المضافة'),
+    'total': ('Total TTC', 'المجموع بكل الرسوم'),
+    'paid': ('Payé', 'المدفوع'),
+    'outstanding': ('Reste à payer', 'المبلغ المتبقي'),
+    'notes': ('Notes', 'ملاحظات'),
+    'terms': ('Conditions', 'الشروط'),
+}
+TAX_IDS = [('nif', 'NIF'), ('nis', 'NIS'), ('rc', 'RC'), ('tva', 'TVA'), ('activity_code', 'Code activité')]
+
+
+def pdf_dir(invoice_id):
+    return os.path.join(settings.MEDIA_ROOT, 'invoices', 'pdf', str(invoice_id))
+
+
+def pdf_stamps(queryset):
+    """Annotate the timestamps that invalidate a rendered invoice"""
+    billing = BillingInfo.objects.filter(case=OuterRef('case')).order_by().values('case').annotate(
+        last=Max('updated_at')
+    ).values('last')
+    return queryset.annotate(
+        case_updated_at=F('case__updated_at'),
+        profile_updated_at=F('user__profile__updated_at'),
+        billing_updated_at=Subquery(billing),
+    )
+
+
+def pdf_digest(invoice):
+    """Digest of an invoice from ``pdf_stamps``"""
+    source = ':'.join(str(part) for part in (
+        LAYOUT_VERSION,
+        invoice.pk,
+        invoice.updated_at.isoformat(),
+        getattr(invoice, 'case_updated_at', None),
+        getattr(invoice, 'profile_updated_at', None),
+        getattr(invoice, 'billing_updated_at', None),
+        getattr(settings, 'INVOICE_PDF_FONT', ''),
+    ))
+    return hashlib.sha1(source.encode('utf-8')).hexdigest()[:16]
+
+
+def pdf_path(invoice):
+    return os.path.join(pdf_dir(invoice.pk), f'{pdf_digest(invoice)}.pdf')
+
+
+def _money(value):
+    return f'{value:,.2f}'.replace(',', ' ')
+
+
+def invoice_payload(invoice):
+    """Everything the renderer draws, as picklable plain values"""
+    user = invoice.user
+    profile = getattr(user, 'profile', None)
+    firm = {
+        'name': (profile and (profile.company_name or profile.law_firm)) or user.full_name,
+        'lawyer': user.full_name,
+        'address': profile.company_address if profile else '',
+        'email': user.email,
+        'ids': [(label, getattr(profile, field)) for field, label in TAX_IDS if profile and getattr(profile, field)],
+    }
+
+    billing = None
+    if invoice.case_id:
+        billing = BillingInfo.objects.filter(case_id=invoice.case_id).order_by('-updated_at').first()
+    client = {
+        'name': invoice.client_name,
+        'address': invoice.client_address,
+        'email': invoice.client_email,
+        'phone': invoice.client_phone,
+        'ids': [(label, getattr(billing, field)) for field, label in TAX_IDS[:4] if billing and getattr(billing, field)],
+    }
+
+    currency = invoice.currency
+    return {
+        'number': invoice.invoice_number or 'BROUILLON',
+        'date': invoice.invoice_date.strftime('%d/%m/%Y'),
+        'due_date': invoice.due_date.strftime('%d/%m/%Y'),
+        'case': f'{invoice.case.reference} - {invoice.case.title}' if invoice.case_id else '',
+        'firm': firm,
+        'client': client,
+        'items': [
+            (
+                item.description,
+                f'{item.hours_worked} h' if item.hours_worked and item.hourly_rate else f'{item.quantity:g}',
+                _money(item.hourly_rate if item.hours_worked and item.hourly_rate else item.unit_price),
+                _money(item.total_price),
+            )
+            for item in invoice.items.order_by('id')
+        ],
+        'totals': [
+            ('subtotal', f'{_money(invoice.subtotal)} {currency}'),
+            ('tax', f'{invoice.tax_rate:g}%  {_money(invoice.tax_amount)} {currency}'),
+            ('total', f'{_money(invoice.total_amount)} {currency}'),
+            ('paid', f'{_money(invoice.amount_paid)} {currency}'),
+            ('outstanding', f'{_money(invoice.outstanding_amount)} {currency}'),
+        ],
+        'notes': invoice.notes,
+        'terms': invoice.terms_conditions,
+    }
+
+
+def _register_font(font_path):
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+
+    if not font_path:
+        return None
+    if FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(TTFont(FONT_NAME, font_path))
+    return FONT_NAME
+
+
+def _arabic(text):
+    import arabic_reshaper
+    from bidi.algorithm import get_display
+    return get_display(arabic_reshaper.reshape(text))
+
+
+def render_invoice_pdf(payload, path, font_path=''):
+    """
+    Draw ``payload`` to ``path`` (A4).
+
+    Runs in a worker process, so it only touches the filesystem. The file
+    is written next to ``path`` and moved into place when complete.
+    """
+    try:
+        from reportlab.lib.pagesizes import A4
+        from reportlab.lib.units import mm
+        from reportlab.pdfgen import canvas
+    except ImportError:
+        raise ImproperlyConfigured('Invoice PDFs require the reportlab package')
+
+    font = _register_font(font_path)
+    regular = font or 'Helvetica'
+    bold = font or 'Helvetica-Bold'
+    width, height = A4
+    left, right, bottom = 18 * mm, width - 18 * mm, 20 * mm
+
+    def label(key):
+        fr, ar = LABELS[key]
+        return f'{fr} / {_arabic(ar)}' if font else fr
+
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    pdf = canvas.Canvas(tmp_path, pagesize=A4)
+    pdf.setTitle(f"Facture {payload['number']}")
+    pdf.setAuthor(payload['firm']['name'])
+
+    # Header: firm on the left, title on the right
+    y = height - 20 * mm
+    pdf.setFont(bold, 14)
+    pdf.drawString(left, y, payload['firm']['name'])
+    pdf.setFont(regular, 9)
+    for line in [payload['firm']['lawyer'], *payload['firm']['address'].splitlines(), payload['firm']['email']]:
+        if line:
+            y -= 12
+            pdf.drawString(left, y, line)
+    for name, value in payload['firm']['ids']:
+        y -= 12
+        pdf.drawString(left, y, f'{name}: {value}')
+
+    pdf.setFont(bold, 18)
+    pdf.drawRightString(right, height - 20 * mm, LABELS['invoice'][0])
+    if font:
+        pdf.drawRightString(right, height - 28 * mm, _arabic(LABELS['invoice'][1]))
+    pdf.setFont(regular, 9)
+    top = height - 36 * mm
+    for key in ('number', 'date', 'due_date'):
+        pdf.drawRightString(right, top, f"{label(key)}: {payload[key]}")
+        top -= 12
+
+    # Client block
+    y = min(y, top) - 18
+    pdf.setFont(bold, 10)
+    pdf.drawString(left, y, label('client'))
+    pdf.setFont(regular, 9)
+    client = payload['client']
+    for line in [client['name'], *client['address'].splitlines(), client['email'], client['phone']]:
+        if line:
+            y -= 12
+            pdf.drawString(left, y, line)
+    for name, value in client['ids']:
+        y -= 12
+        pdf.drawString(left, y, f'{name}: {value}')
+    if payload['case']:
+        y -= 16
+        pdf.drawString(left, y, f"{label('case')}: {payload['case']}")
+
+    # Items
+    columns = [left, right - 80 * mm, right - 50 * mm, right]
+
+    def table_header(y):
+        pdf.setFont(bold, 9)
+        pdf.drawString(columns[0], y, label('description'))
+        pdf.drawRightString(columns[1] + 15 * mm, y, label('quantity'))
+        pdf.drawRightString(columns[2] + 20 * mm, y, LABELS['unit_price'][0])
+        pdf.drawRightString(columns[3], y, label('amount'))
+        pdf.line(left, y - 4, right, y - 4)
+        pdf.setFont(regular, 9)
+        return y - 16
+
+    y = table_header(y - 24)
+    for description, quantity, unit_price, amount in payload['items']:
+        if y < bottom + 40 * mm:
+            pdf.showPage()
+            y = table_header(height - 20 * mm)
+        pdf.drawString(columns[0], y, description[:70])
+        pdf.drawRightString(columns[1] + 15 * mm, y, quantity)
+        pdf.drawRightString(columns[2] + 20 * mm, y, unit_price)
+        pdf.drawRightString(columns[3], y, amount)
+        y -= 14
+
+    # Totals
+    pdf.line(left, y + 6, right, y + 6)
+    y -= 8
+    for key, value in payload['totals']:
+        pdf.setFont(bold if key in ('total', 'outstanding') else regular, 10)
+        pdf.drawRightString(right - 45 * mm, y, label(key))
+        pdf.drawRightString(right, y, value)
+        y -= 14
+
+    pdf.setFont(regular, 8)
+    for key in ('notes', 'terms'):
+        text = payload[key]
+        if not text:
+            continue
+        y -= 10
+        pdf.drawString(left, y, f'{label(key)}:')
+        for line in text.splitlines():
+            if y < bottom:
+                pdf.showPage()
+                pdf.setFont(regular, 8)
+                y = height - 20 * mm
+            y -= 10
+            pdf.drawString(left, y, line[:120])
+
+    pdf.save()
+    os.replace(tmp_path, path)
+    return path
+
+
+def _prepare(invoice):
+    """Return (path, payload) for an invoice from ``pdf_stamps``; payload is None when cached"""
+    path = pdf_path(invoice)
+    if os.path.exists(path):
+        return path, None
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path, invoice_payload(invoice)
+
+
+def _drop_stale(path):
+    for stale in glob.glob(os.path.join(os.path.dirname(path), '*.pdf')):
+        if stale != path:
+            try:
+                os.remove(stale)
+            except FileNotFoundError:
+                pass
+
+
+def invoice_pdf(invoice):
+    """
+    Path of the rendered PDF for an invoice loaded through ``pdf_stamps``,
+    rendering it in the process pool first when it is not cached.
+    """
+    path, payload = _prepare(invoice)
+    if payload is not None:
+        call_in_process(render_invoice_pdf, payload, path, getattr(settings, 'INVOICE_PDF_FONT', ''))
+        _drop_stale(path)
+    return path
+
+
+def open_invoice_pdf(invoice, attempts=3):
+    """
+    Open the rendered PDF of an invoice from ``pdf_stamps`` for reading.
+
+    A concurrent render of a newer digest may remove the file between
+    rendering and opening it; the render is then retried. Once open, the
+    file stays readable even if it is removed.
+    """
+    for attempt in range(attempts):
+        try:
+            return open(invoice_pdf(invoice), 'rb')
+        except FileNotFoundError:
+            if attempt == attempts - 1:
+                raise
+
+
+def prerender_invoices(invoices):
+    """
+    Render every uncached invoice of ``invoices`` in parallel.
+
+    Returns ``(rendered, cached, failed)`` counts.
+    """
+    font_path = getattr(settings, 'INVOICE_PDF_FONT', '')
+    eager = getattr(settings, 'BACKGROUND_TASKS_EAGER', False)
+    rendered = cached = failed = 0
+    futures = {}
+    queryset = pdf_stamps(invoices).select_related('user', 'user__profile', 'case')
+    for invoice in queryset.iterator(chunk_size=200):
+        path, payload = _prepare(invoice)
+        if payload is None:
+            cached += 1
+            continue
+        if eager:
+            render_invoice_pdf(payload, path, font_path)
+            _drop_stale(path)
+            rendered += 1
+        else:
+            futures[process_pool().submit(render_invoice_pdf, payload, path, font_path)] = invoice.pk
+
+    for future in as_completed(futures):
+        try:
+            _drop_stale(future.result())
+            rendered += 1
+        except Exception as e:
+            logger.warning('Rendering invoice %s failed: %s', futures[future], e)
+            failed += 1
+    return rendered, cached, failed
+
+
+def delete_invoice_pdfs(invoice_id):
+    shutil.rmtree(pdf_dir(invoice_id), ignore_errors=True)
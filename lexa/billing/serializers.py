@@ -2,6 +2,8 @@
 from rest_framework import serializers
 from .models import BillingInfo, Invoice, InvoiceItem, Payment, Expense,Case
 from django.utils import timezone
+from .invoicing import save_invoice
+from documents.quota import check_upload, file_bytes
 class BillingInfoSerializer(serializers.ModelSerializer):
     case_title = serializers.CharField(source='case.title', read_only=True)
     case_reference = serializers.CharField(source='case.reference', read_only=True)
@@ -10,7 +12,7 @@ class BillingInfoSerializer(serializers.ModelSerializer):
     class Meta:
         model = BillingInfo
         fields = '__all__'
-        read_only_fields = ['user', 'created_at', 'updated_at']
+        read_only_fields = ['user', 'invoice_number', 'billed_invoice', 'created_at', 'updated_at']
 
 class InvoiceItemSerializer(serializers.ModelSerializer):
     # Map frontend fields to model fields
@@ -20,20 +22,18 @@ class InvoiceItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = InvoiceItem
         fields = ['id', 'description', 'quantity', 'rate', 'amount', 'service_date']
-        
-    def validate(self, data):
-        # Calculate total_price automatically
-        quantity = data.get('quantity', 1)
-        unit_price = data.get('unit_price', 0)
-        data['total_price'] = quantity * unit_price
-        return data
 
 class PaymentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Payment
-        exclude = ['user']
+        exclude = ['user', 'idempotency_key']
         read_only_fields = ['created_at']
 
+    def validate_amount(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("Payment amount must be positive.")
+        return value
+
 class InvoiceSerializer(serializers.ModelSerializer):
     case_title = serializers.CharField(source='case.title', read_only=True)
     case_reference = serializers.CharField(source='case.reference', read_only=True)
@@ -45,7 +45,7 @@ class InvoiceSerializer(serializers.ModelSerializer):
     class Meta:
         model = Invoice
         fields = '__all__'
-        read_only_fields = ['user', 'created_at', 'updated_at', 'amount_paid']
+        read_only_fields = ['user', 'invoice_number', 'created_at', 'updated_at', 'amount_paid']
 
     def validate_case(self, value):
         if not Case.objects.filter(id=value.id, user=self.context['request'].user).exists():
@@ -61,46 +61,13 @@ class InvoiceSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         items_data = validated_data.pop('items', [])
-        subtotal = sum(item.get('quantity', 1) * item.get('unit_price', 0) for item in items_data)
-        tax_rate = validated_data.get('tax_rate', 19.00)
-        tax_amount = (subtotal * tax_rate) / 100
-        total_amount = subtotal + tax_amount
-
-        validated_data.update({
-            'subtotal': subtotal,
-            'tax_amount': tax_amount,
-            'total_amount': total_amount
-        })
-
-        invoice = Invoice.objects.create(**validated_data)
-        for item_data in items_data:
-            item_data['total_price'] = item_data.get('quantity', 1) * item_data.get('unit_price', 0)
-            InvoiceItem.objects.create(invoice=invoice, **item_data)
-
-        return invoice
+        return save_invoice(Invoice(**validated_data), items_data)
 
     def update(self, instance, validated_data):
         items_data = validated_data.pop('items', None)
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
-
-        if items_data is not None:
-            instance.items.all().delete()
-            subtotal = sum(item.get('quantity', 1) * item.get('unit_price', 0) for item in items_data)
-            tax_rate = instance.tax_rate
-            tax_amount = (subtotal * tax_rate) / 100
-            total_amount = subtotal + tax_amount
-
-            instance.subtotal = subtotal
-            instance.tax_amount = tax_amount
-            instance.total_amount = total_amount
-
-            for item_data in items_data:
-                item_data['total_price'] = item_data.get('quantity', 1) * item_data.get('unit_price', 0)
-                InvoiceItem.objects.create(invoice=instance, **item_data)
-
-        instance.save()
-        return instance
+        return save_invoice(instance, items_data)
 
 class ExpenseSerializer(serializers.ModelSerializer):
     case_title = serializers.CharField(source='case.title', read_only=True)
@@ -109,4 +76,4 @@ class ExpenseSerializer(serializers.ModelSerializer):
     class Meta:
         model = Expense
         fields = '__all__'
-        read_only_fields = ['user', 'created_at']
\ No newline at end of file
+        read_only_fields = ['user', 'billed_invoice', 'created_at']
\ No newline at end of file
@@ -0,0 +1,113 @@
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.db import transaction
+from django.dispatch import receiver
+from documents.analytics import invalidate_analytics
+from documents.quota import adjust_usage, file_bytes
+from .analytics import invalidate_all_revenue, invalidate_revenue
+from .currency import rate_cache
+from .ledger import deleting_user, post_billed_records, post_instance, reverse_instance
+from .models import BillingInfo, ExchangeRate, Expense, Invoice, Payment
+from .pdf import delete_invoice_pdfs
+
+
+@receiver(pre_save, sender=Expense)
+def remember_previous_receipt(sender, instance, update_fields=None, **kwargs):
+    instance._previous_receipt = None
+    if instance.pk and (update_fields is None or 'receipt_file' in update_fields):
+        instance._previous_receipt = Expense.objects.filter(pk=instance.pk).values_list(
+            'receipt_file'
+        ).first()
+
+
+@receiver(post_save, sender=Expense)
+def account_receipt_storage(sender, instance, created, **kwargs):
+    """Count receipt uploads and replacements in the owner's storage usage"""
+    if created:
+        if instance.receipt_file:
+            adjust_usage(instance.user_id, file_bytes(instance.receipt_file))
+            invalidate_analytics(instance.user_id)
+        return
+
+    previous = getattr(instance, '_previous_receipt', None)
+    if previous is None:
+        return
+    previous = previous[0] or ''
+    if previous == (instance.receipt_file.name or ''):
+        return
+    previous_size = 0
+    if previous:
+        try:
+            previous_size = instance.receipt_file.storage.size(previous)
+        except OSError:
+            previous_size = 0
+    adjust_usage(instance.user_id, file_bytes(instance.receipt_file) - previous_size)
+    invalidate_analytics(instance.user_id)
+
+
+@receiver(post_delete, sender=Expense)
+def release_receipt_storage(sender, instance, **kwargs):
+    if instance.receipt_file:
+        adjust_usage(instance.user_id, -file_bytes(instance.receipt_file))
+        invalidate_analytics(instance.user_id)
+
+
+@receiver(post_save, sender=Invoice)
+@receiver(post_delete, sender=Invoice)
+@receiver(post_save, sender=Payment)
+@receiver(post_delete, sender=Payment)
+@receiver(post_save, sender=Expense)
+@receiver(post_delete, sender=Expense)
+def invalidate_revenue_analytics(sender, instance, **kwargs):
+    invalidate_revenue(instance.user_id)
+
+
+@receiver(post_save, sender=BillingInfo)
+@receiver(post_save, sender=Invoice)
+@receiver(post_save, sender=Payment)
+@receiver(post_save, sender=Expense)
+def post_to_ledger(sender, instance, raw=False, **kwargs):
+    if not raw:
+        post_instance(instance)
+
+
+@receiver(post_delete, sender=BillingInfo)
+@receiver(post_delete, sender=Invoice)
+@receiver(post_delete, sender=Payment)
+@receiver(post_delete, sender=Expense)
+def reverse_in_ledger(sender, instance, origin=None, **kwargs):
+    if not deleting_user(origin):
+        reverse_instance(instance)
+
+
+@receiver(post_save, sender=Invoice)
+def repost_billed_records(sender, instance, created=False, raw=False, update_fields=None, **kwargs):
+    """Billed records leave or rejoin the ledger as their invoice is posted or not"""
+    if raw or created or (update_fields is not None and 'status' not in update_fields):
+        return
+    post_billed_records(instance.billed_records.values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=Invoice)
+def remember_billed_records(sender, instance, **kwargs):
+    # SET_NULL clears billed_invoice with a plain UPDATE before post_delete
+    instance._billed_record_ids = list(instance.billed_records.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Invoice)
+def repost_unbilled_records(sender, instance, origin=None, **kwargs):
+    if not deleting_user(origin):
+        post_billed_records(getattr(instance, '_billed_record_ids', []))
+
+
+@receiver(post_delete, sender=Invoice)
+def remove_invoice_pdfs(sender, instance, **kwargs):
+    invoice_id = instance.pk
+    transaction.on_commit(lambda: delete_invoice_pdfs(invoice_id))
+
+
+@receiver(post_save, sender=ExchangeRate)
+@receiver(post_delete, sender=ExchangeRate)
+def invalidate_exchange_rates(sender, instance, **kwargs):
+    """Other processes pick the change up when their lookups expire"""
+    rate_cache.clear()
+    invalidate_all_revenue()
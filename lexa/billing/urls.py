@@ -11,6 +11,7 @@ urlpatterns = [
     # Invoices
     path('invoices/<int:pk>/', views.InvoiceDetailView.as_view(), name='invoice_detail'),
     path('invoices/<int:invoice_id>/payments/', views.add_invoice_payment, name='add_invoice_payment'),
+    path('invoices/<int:pk>/pdf/', views.invoice_pdf_download, name='invoice_pdf'),
     
     # Expenses
     path('expenses/', views.ExpenseListCreateView.as_view(), name='expense_list_create'),
@@ -18,4 +19,11 @@ urlpatterns = [
     
     # Analytics
     path('analytics/revenue/', views.revenue_analytics, name='revenue_analytics'),
+    path('analytics/aging/', views.aging_report, name='aging_report'),
+
+    # Ledger
+    path('ledger/balances/', views.ledger_balances, name='ledger_balances'),
+
+    # Currencies
+    path('exchange-rates/', views.exchange_rate, name='exchange_rate'),
 ]
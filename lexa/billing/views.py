@@ -1,12 +1,23 @@
+import os
 from rest_framework import generics, status, permissions
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
-from django.db.models import Sum, Count, Q
+from django.db.models import Count, Q
 from django.utils import timezone
 from datetime import datetime, timedelta
-from .models import BillingInfo, Invoice, InvoiceItem, Payment, Expense
+from utils.permissions import HasStorageQuota
+from django.http import StreamingHttpResponse
+from utils.permissions import IsAdminUser
+from .aging import BUCKETS, aging_csv, aging_rows, aging_totals
+from .analytics import revenue_analytics_for
+from .currency import base_currency, rate_on
+from .invoicing import record_payment
+from .ledger import account_balances
+from .pdf import open_invoice_pdf, pdf_digest, pdf_stamps
+from utils.http_cache import file_response, make_etag, not_modified
+from .models import BillingInfo, Invoice, InvoiceItem, Expense
 from .serializers import (
     BillingInfoSerializer, InvoiceSerializer, InvoiceItemSerializer,
     PaymentSerializer, ExpenseSerializer
@@ -38,6 +49,17 @@ class BillingInfoDetailView(generics.RetrieveUpdateDestroyAPIView):
     def get_queryset(self):
         return BillingInfo.objects.filter(user=self.request.user)
 
+    def destroy(self, request, *args, **kwargs):
+        record = self.get_object()
+        if record.invoice_number:
+            # Deleting would leave a gap in the legal numbering
+            return Response(
+                {'error': 'Numbered billing records cannot be deleted; cancel them instead'},
+                status=status.HTTP_409_CONFLICT
+            )
+        self.perform_destroy(record)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
 # class InvoiceListCreateView(generics.ListCreateAPIView):
 #     serializer_class = InvoiceSerializer
 #     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
@@ -69,8 +91,20 @@ class InvoiceDetailView(generics.RetrieveUpdateDestroyAPIView):
     def get_queryset(self):
         return Invoice.objects.filter(user=self.request.user)
 
+    def destroy(self, request, *args, **kwargs):
+        invoice = self.get_object()
+        if invoice.invoice_number:
+            # Deleting would leave a gap in the legal numbering
+            return Response(
+                {'error': 'Numbered invoices cannot be deleted; cancel them instead'},
+                status=status.HTTP_409_CONFLICT
+            )
+        self.perform_destroy(invoice)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
 class ExpenseListCreateView(generics.ListCreateAPIView):
     serializer_class = ExpenseSerializer
+    permission_classes = [permissions.IsAuthenticated, HasStorageQuota]
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
     filterset_fields = ['case', 'category', 'is_reimbursable', 'is_reimbursed']
     search_fields = ['description', 'case__reference']
@@ -84,10 +118,32 @@ class ExpenseListCreateView(generics.ListCreateAPIView):
 
 class ExpenseDetailView(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = ExpenseSerializer
+    permission_classes = [permissions.IsAuthenticated, HasStorageQuota]
 
     def get_queryset(self):
         return Expense.objects.filter(user=self.request.user)
 
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def invoice_pdf_download(request, pk):
+    """Download an invoice as a printable PDF, rendered once per change"""
+    invoice = pdf_stamps(Invoice.objects.filter(pk=pk, user=request.user)).select_related(
+        'user', 'user__profile', 'case'
+    ).first()
+    if invoice is None:
+        return Response({'error': 'Invoice not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    etag = make_etag('invoice-pdf', pdf_digest(invoice))
+    cached = not_modified(request, etag=etag, last_modified=invoice.updated_at)
+    if cached is not None:
+        return cached
+
+    fileobj = open_invoice_pdf(invoice)
+    return file_response(
+        request, fileobj, os.fstat(fileobj.fileno()).st_size, 'application/pdf',
+        f'{invoice.invoice_number or f"draft-{invoice.pk}"}.pdf', etag, invoice.updated_at
+    )
+
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def revenue_analytics(request):
@@ -101,100 +157,154 @@ def revenue_analytics(request):
         start_date = now.replace(month=1, day=1).date()
         end_date = now.date()
     else:
-        start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
-        end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
-    
-    # Get invoices in date range
-    invoices = Invoice.objects.filter(
-        user=request.user,
-        invoice_date__range=[start_date, end_date]
-    )
+        try:
+            start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
+            end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
+        except ValueError:
+            return Response({'error': 'Dates must be formatted YYYY-MM-DD'}, status=status.HTTP_400_BAD_REQUEST)
     
-    # Get expenses in date range
-    expenses = Expense.objects.filter(
-        user=request.user,
-        expense_date__range=[start_date, end_date]
+    return Response(revenue_analytics_for(request.user, start_date, end_date))
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def aging_report(request):
+    """
+    Accounts-receivable aging by client and case.
+
+    ``as_of`` (YYYY-MM-DD) defaults to today; ``export=csv`` streams the rows
+    as CSV. Admins can pass ``firm=1`` to cover every lawyer's invoices.
+    """
+    as_of = request.GET.get('as_of')
+    if as_of:
+        try:
+            as_of = datetime.strptime(as_of, '%Y-%m-%d').date()
+        except ValueError:
+            return Response({'error': 'as_of must be formatted YYYY-MM-DD'}, status=status.HTTP_400_BAD_REQUEST)
+    else:
+        as_of = timezone.now().date()
+
+    firm = request.GET.get('firm') in ('1', 'true')
+    if firm and not IsAdminUser().has_permission(request, None):
+        return Response({'error': 'Firm-wide reports are restricted to admins'}, status=status.HTTP_403_FORBIDDEN)
+
+    invoices = Invoice.objects.all() if firm else Invoice.objects.filter(user=request.user)
+    rows = aging_rows(invoices, as_of, firm=firm)
+
+    if request.GET.get('export') == 'csv':
+        response = StreamingHttpResponse(aging_csv(rows, firm=firm), content_type='text/csv')
+        response['Content-Disposition'] = f'attachment; filename="aging-{as_of.isoformat()}.csv"'
+        return response
+
+    rows = list(rows)
+    return Response({
+        'as_of': as_of,
+        'currency': base_currency(),
+        'buckets': [{'key': key, 'label': label} for key, label, *_ in BUCKETS],
+        'totals': aging_totals(rows),
+        'rows': rows,
+    })
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def ledger_balances(request):
+    """
+    Ledger balances (debit - credit) per currency and account at the end of
+    ``as_of``, optionally narrowed to one ``case``, ``client_name`` or
+    ``currency``. Amounts in different currencies are never added together.
+    """
+    as_of = request.GET.get('as_of')
+    if as_of:
+        try:
+            as_of = datetime.strptime(as_of, '%Y-%m-%d').date()
+        except ValueError:
+            return Response({'error': 'as_of must be formatted YYYY-MM-DD'}, status=status.HTTP_400_BAD_REQUEST)
+    else:
+        as_of = timezone.now().date()
+
+    case = request.GET.get('case')
+    if case is not None and not case.isdigit():
+        return Response({'error': 'case must be a case id'}, status=status.HTTP_400_BAD_REQUEST)
+
+    balances = account_balances(
+        request.user, as_of,
+        case=int(case) if case else None,
+        client_name=request.GET.get('client_name'),
+        currency=request.GET.get('currency'),
     )
-    
-    # Calculate metrics
-    total_revenue = invoices.aggregate(
-        total=Sum('total_amount')
-    )['total'] or 0
-    
-    paid_revenue = invoices.filter(
-        status='paid'
-    ).aggregate(
-        total=Sum('amount_paid')
-    )['total'] or 0
-    
-    total_expenses = expenses.aggregate(
-        total=Sum('amount')
-    )['total'] or 0
-    
-    outstanding_amount = invoices.filter(
-        status__in=['sent', 'partially_paid']
-    ).aggregate(
-        total=Sum('outstanding_amount')
-    )['total'] or 0
-    
-    analytics = {
-        'period': {
-            'start_date': start_date,
-            'end_date': end_date
-        },
-        'revenue': {
-            'total_invoiced': float(total_revenue),
-            'total_paid': float(paid_revenue),
-            'outstanding': float(outstanding_amount),
-            'net_profit': float(paid_revenue - total_expenses)
+    return Response({
+        'as_of': as_of,
+        'balances': {
+            currency: {account: float(balance) for account, balance in accounts.items()}
+            for currency, accounts in balances.items()
         },
-        'expenses': {
-            'total_expenses': float(total_expenses)
-        },
-        'invoices': {
-            'total_count': invoices.count(),
-            'paid_count': invoices.filter(status='paid').count(),
-            'overdue_count': invoices.filter(
-                status__in=['sent', 'partially_paid'],
-                due_date__lt=timezone.now().date()
-            ).count()
-        },
-        'cases': {
-            'case_count': invoices.values('case').distinct().count(),
-            'avg_case_value': float(total_revenue / max(invoices.values('case').distinct().count(), 1))
-        }
-    }
-    
-    return Response(analytics)
+    })
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
 def add_invoice_payment(request, invoice_id):
-    """Add a payment to an invoice"""
+    """
+    Add a payment to an invoice.
+
+    Send an ``Idempotency-Key`` header to make retries safe: a key that was
+    already used returns the original payment with 200 instead of 201.
+    """
+    idempotency_key = request.headers.get('Idempotency-Key', '').strip()
+    if len(idempotency_key) > 100:
+        return Response({'error': 'Idempotency-Key is too long'}, status=status.HTTP_400_BAD_REQUEST)
+
+    data = {
+        key: request.data.get(key)
+        for key in ('amount', 'payment_date', 'payment_method', 'reference_number',
+                    'bank_name', 'account_number', 'notes')
+        if key in request.data
+    }
+    serializer = PaymentSerializer(data={**data, 'invoice': invoice_id})
+    # The invoice itself is checked under lock below
+    serializer.fields['invoice'].queryset = Invoice.objects.filter(user=request.user)
+    if not serializer.is_valid():
+        if 'invoice' in serializer.errors:
+            return Response({'error': 'Invoice not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    validated = dict(serializer.validated_data)
+    validated.pop('invoice')
     try:
-        invoice = Invoice.objects.get(id=invoice_id, user=request.user)
+        payment, created = record_payment(invoice_id, request.user, validated, idempotency_key)
     except Invoice.DoesNotExist:
         return Response({'error': 'Invoice not found'}, status=status.HTTP_404_NOT_FOUND)
-    
-    # Create payment
-    payment = Payment.objects.create(
-        invoice=invoice,
-        amount=request.data.get('amount'),
-        payment_date=request.data.get('payment_date'),
-        payment_method=request.data.get('payment_method'),
-        reference_number=request.data.get('reference_number', ''),
-        notes=request.data.get('notes', ''),
-        user=request.user
+
+    if not created and payment.invoice_id != invoice_id:
+        return Response(
+            {'error': 'Idempotency-Key was already used for another invoice'},
+            status=status.HTTP_409_CONFLICT
+        )
+    return Response(
+        PaymentSerializer(payment).data,
+        status=status.HTTP_201_CREATED if created else status.HTTP_200_OK
     )
-    
-    # Update invoice
-    invoice.amount_paid += payment.amount
-    if invoice.amount_paid >= invoice.total_amount:
-        invoice.status = 'paid'
-        invoice.payment_date = payment.payment_date
-    elif invoice.amount_paid > 0:
-        invoice.status = 'partially_paid'
-    
-    invoice.save()
-    
-    return Response(PaymentSerializer(payment).data, status=status.HTTP_201_CREATED)
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def exchange_rate(request):
+    """
+    Rate of ``currency`` in the base currency on ``date`` (YYYY-MM-DD,
+    defaults to today): the latest rate published on or before that day.
+    """
+    currency = request.GET.get('currency', '').strip().upper()
+    if len(currency) != 3:
+        return Response({'error': 'currency must be a 3-letter code'}, status=status.HTTP_400_BAD_REQUEST)
+    on_date = request.GET.get('date')
+    if on_date:
+        try:
+            on_date = datetime.strptime(on_date, '%Y-%m-%d').date()
+        except ValueError:
+            return Response({'error': 'date must be formatted YYYY-MM-DD'}, status=status.HTTP_400_BAD_REQUEST)
+    else:
+        on_date = timezone.now().date()
+
+    rate = rate_on(currency, on_date)
+    if rate is None:
+        return Response(
+            {'error': f'No {currency} exchange rate on or before {on_date}'}, status=status.HTTP_404_NOT_FOUND
+        )
+    return Response({'currency': currency, 'base': base_currency(), 'date': on_date, 'rate': rate})
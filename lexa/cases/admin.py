@@ -1,7 +1,24 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from .models import Case,CaseMetric,CaseType,Jurisdiction,Audience
 
-admin.site.register(Case)
+@admin.register(Case)
+class CaseAdmin(admin.ModelAdmin):
+    # Deleting a case cascades to its invoices; numbered ones must survive
+    def has_delete_permission(self, request, obj=None):
+        from billing.numbering import numbered_case_ids
+
+        if obj is not None and numbered_case_ids([obj.pk]):
+            return False
+        return super().has_delete_permission(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        from billing.numbering import numbered_case_ids
+
+        numbered = numbered_case_ids(queryset.values_list('pk', flat=True))
+        if numbered:
+            self.message_user(request, f'{len(numbered)} case(s) with numbered invoices kept', messages.WARNING)
+        queryset.exclude(pk__in=numbered).delete()
+
 admin.site.register(CaseMetric)
 
 admin.site.register(CaseType)
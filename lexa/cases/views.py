@@ -64,6 +64,19 @@ class CaseDetailView(generics.RetrieveUpdateDestroyAPIView):
             'jurisdiction', 'case_type'
         ).prefetch_related('audiences') #(,'documents') later zidha direct
 
+    def destroy(self, request, *args, **kwargs):
+        from billing.numbering import numbered_case_ids
+
+        case = self.get_object()
+        if numbered_case_ids([case.pk]):
+            # The delete would cascade through issued invoice numbers
+            return Response(
+                {'error': 'Cases with numbered invoices or billing records cannot be deleted'},
+                status=status.HTTP_409_CONFLICT
+            )
+        self.perform_destroy(case)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
 class AudienceListCreateView(generics.ListCreateAPIView):
     serializer_class = AudienceSerializer
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
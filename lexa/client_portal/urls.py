@@ -18,4 +18,5 @@ urlpatterns = [
     # Public Client Portal APIs
     path('verify-access/', views.verify_client_access, name='verify_client_access'),
     path('send-message/', views.send_client_message, name='send_client_message'),
+    path('documents/<int:client_document_id>/open/', views.access_client_document, name='access_client_document'),
 ]
\ No newline at end of file
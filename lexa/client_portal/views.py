@@ -4,12 +4,16 @@ from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
 from django.shortcuts import get_object_or_404
+from django.core.exceptions import ValidationError
 from django.utils import timezone
 from django.http import Http404
 import uuid
 from .models import ClientAccess, ClientMessage, ClientDocument
 from .serializers import ClientAccessSerializer, ClientMessageSerializer, ClientDocumentSerializer
 from cases.models import Case
+from utils.access_counters import record_access
+from utils.http_cache import file_response
+from documents.encryption import open_plaintext
 
 class ClientAccessListCreateView(generics.ListCreateAPIView):
     serializer_class = ClientAccessSerializer
@@ -114,10 +118,8 @@ def verify_client_access(request):
         if client_access.is_expired:
             return Response({'error': 'Access token has expired'}, status=status.HTTP_403_FORBIDDEN)
         
-        # Update access tracking
-        client_access.access_count += 1
-        client_access.last_accessed = timezone.now()
-        client_access.save(update_fields=['access_count', 'last_accessed'])
+        # Update access tracking (buffered, flushed in batches)
+        record_access(ClientAccess, client_access.pk, 'access_count')
         
         # Return case information
         case_data = {
@@ -173,3 +175,54 @@ def send_client_message(request):
     
     serializer = ClientMessageSerializer(message)
     return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
+@api_view(['POST'])
+@permission_classes([permissions.AllowAny])
+def access_client_document(request, client_document_id):
+    """Open a document shared with a client through the portal"""
+    access_token = request.data.get('access_token')
+    client_email = request.data.get('client_email')
+    
+    # Verify access
+    try:
+        client_access = ClientAccess.objects.get(
+            access_token=access_token,
+            client_email=client_email,
+            is_active=True
+        )
+        
+        if client_access.is_expired:
+            return Response({'error': 'Access token has expired'}, status=status.HTTP_403_FORBIDDEN)
+        
+    except (ClientAccess.DoesNotExist, ValueError, ValidationError):
+        return Response({'error': 'Invalid access credentials'}, status=status.HTTP_403_FORBIDDEN)
+    
+    client_document = get_object_or_404(
+        ClientDocument.objects.select_related('document'),
+        id=client_document_id,
+        case=client_access.case,
+        client_email=client_email,
+        is_active=True
+    )
+    
+    if client_document.expires_at and client_document.expires_at < timezone.now():
+        return Response({'error': 'Document access has expired'}, status=status.HTTP_403_FORBIDDEN)
+    
+    # Update access tracking (buffered, flushed in batches)
+    record_access(ClientDocument, client_document.pk, 'access_count')
+    
+    document = client_document.document
+    
+    if client_document.access_level == 'download' and document.file:
+        fileobj, size = open_plaintext(document.file)
+        return file_response(request, fileobj, size, document.file_type, document.file_name)
+    
+    return Response({
+        'title': document.title_fr,
+        'content': document.content,
+        'created_at': document.created_at,
+        'language': document.language,
+        'document_type': document.document_type,
+        'share_message': client_document.share_message,
+    })
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Document, DocumentTemplate, DocumentVersion, DocumentShare
+from .models import Document, DocumentTemplate, DocumentVersion, DocumentShare, DocumentText, DocumentOptimization
 
 @admin.register(DocumentTemplate)
 class DocumentTemplateAdmin(admin.ModelAdmin):
@@ -18,10 +18,11 @@ class DocumentAdmin(admin.ModelAdmin):
 
 @admin.register(DocumentVersion)
 class DocumentVersionAdmin(admin.ModelAdmin):
-    list_display = ('document', 'version_number', 'created_by', 'created_at')
-    list_filter = ('created_at',)
+    list_display = ('document', 'version_number', 'is_keyframe', 'created_by', 'created_at')
+    list_filter = ('is_keyframe', 'created_at')
     search_fields = ('document__title_fr', 'change_notes')
     ordering = ('-created_at',)
+    readonly_fields = ('stored_content', 'is_keyframe')
 
 @admin.register(DocumentShare)
 class DocumentShareAdmin(admin.ModelAdmin):
@@ -29,4 +30,18 @@ class DocumentShareAdmin(admin.ModelAdmin):
     list_filter = ('access_level', 'is_active', 'created_at')
     search_fields = ('document__title_fr', 'shared_with_email')
     ordering = ('-created_at',)
-    readonly_fields = ('access_token', 'accessed_count', 'last_accessed')
\ No newline at end of file
+    readonly_fields = ('access_token', 'accessed_count', 'last_accessed')
+
+@admin.register(DocumentText)
+class DocumentTextAdmin(admin.ModelAdmin):
+    list_display = ('document', 'status', 'language', 'page_count', 'word_count', 'attempts', 'extracted_at')
+    list_filter = ('status', 'language')
+    search_fields = ('document__title_fr', 'error')
+    readonly_fields = ('text', 'metadata', 'source_name', 'attempts', 'error', 'extracted_at', 'created_at', 'updated_at')
+
+@admin.register(DocumentOptimization)
+class DocumentOptimizationAdmin(admin.ModelAdmin):
+    list_display = ('document', 'status', 'output_format', 'original_size', 'optimized_size', 'updated_at')
+    list_filter = ('status', 'output_format')
+    search_fields = ('document__title_fr', 'error')
+    readonly_fields = ('source_name', 'optimized_name', 'original_file', 'original_size', 'optimized_size', 'page_count', 'error', 'created_at', 'updated_at')
@@ -0,0 +1,120 @@
+"""
+Per-user document analytics.
+
+The payload is built from three queries (one grouped count over the user's
+documents, one row of scalar counts, and the ten most recent documents in
+summary form) and cached for DOCUMENT_ANALYTICS_CACHE_TIMEOUT seconds.
+Document, share, template and storage changes invalidate the owner's entry.
+"""
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import models
+from django.db.models.functions import Coalesce
+
+from .models import Document, DocumentShare, DocumentTemplate, StorageUsage
+from .quota import storage_limits
+from .serializers import DocumentSummarySerializer
+
+RECENT_DOCUMENTS = 10
+
+
+def analytics_cache_key(user_id):
+    return f'documents:analytics:{user_id}'
+
+
+def invalidate_analytics(*user_ids):
+    cache.delete_many([analytics_cache_key(user_id) for user_id in user_ids if user_id])
+
+
+def invalidate_analytics_for_email(email):
+    if email:
+        User = get_user_model()
+        invalidate_analytics(*User.objects.filter(email=email).values_list('id', flat=True))
+
+
+def _count(queryset, group_field):
+    """Correlated COUNT of ``queryset`` grouped on the field it is filtered by"""
+    return Coalesce(models.Subquery(
+        queryset.order_by().values(group_field).annotate(total=models.Count('id')).values('total')
+    ), 0)
+
+
+def _scalar_counts(user):
+    """Share, template and storage counters for ``user`` in a single row"""
+    User = get_user_model()
+    outer = models.OuterRef('pk')
+    shares = DocumentShare.objects.filter(document__user=outer, is_active=True)
+    received = DocumentShare.objects.filter(shared_with_email=models.OuterRef('email'), is_active=True)
+    templates = DocumentTemplate.objects.filter(user=outer)
+    usage = StorageUsage.objects.filter(user=outer)
+
+    return User.objects.filter(pk=user.pk).annotate(
+        shared_documents_count=_count(shares, 'document__user'),
+        documents_shared_with_me=_count(received, 'shared_with_email'),
+        templates_count=_count(templates, 'user'),
+        bytes_used=Coalesce(models.Subquery(usage.values('bytes_used')[:1]), 0),
+        stored_documents=Coalesce(models.Subquery(usage.values('document_count')[:1]), 0),
+    ).values(
+        'shared_documents_count', 'documents_shared_with_me', 'templates_count',
+        'bytes_used', 'stored_documents'
+    ).get()
+
+
+def build_document_analytics(user, request=None):
+    groups = Document.objects.filter(user=user).order_by().values(
+        'document_type', 'language', 'template_type'
+    ).annotate(count=models.Count('id'))
+
+    by_type, by_language, by_template_type = Counter(), Counter(), Counter()
+    total = 0
+    for row in groups:
+        total += row['count']
+        by_type[row['document_type']] += row['count']
+        by_language[row['language']] += row['count']
+        if row['template_type']:
+            by_template_type[row['template_type']] += row['count']
+
+    counts = _scalar_counts(user)
+    limits = storage_limits(user)
+    recent = Document.objects.filter(user=user).defer('content').select_related(
+        'template'
+    ).with_counts().order_by('-created_at')[:RECENT_DOCUMENTS]
+
+    return {
+        'total_documents': total,
+        'documents_by_type': [
+            {'document_type': key, 'count': count} for key, count in by_type.items()
+        ],
+        'documents_by_language': [
+            {'language': key, 'count': count} for key, count in by_language.items()
+        ],
+        'documents_by_template_type': [
+            {'template_type': key, 'count': count} for key, count in by_template_type.items()
+        ],
+        'recent_documents': list(DocumentSummarySerializer(
+            recent, many=True, context={'request': request}
+        ).data),
+        'shared_documents_count': counts['shared_documents_count'],
+        'templates_count': counts['templates_count'],
+        'total_file_size': counts['bytes_used'],
+        'storage_quota': {
+            'bytes_used': counts['bytes_used'],
+            'max_bytes': limits[0] if limits else None,
+            'document_count': counts['stored_documents'],
+            'max_documents': limits[1] if limits else None,
+        },
+        'documents_shared_with_me': counts['documents_shared_with_me'],
+    }
+
+
+def document_analytics_for(user, request=None):
+    """Return the cached analytics payload for ``user``, building it on a miss"""
+    key = analytics_cache_key(user.pk)
+    analytics = cache.get(key)
+    if analytics is None:
+        analytics = build_document_analytics(user, request)
+        cache.set(key, analytics, getattr(settings, 'DOCUMENT_ANALYTICS_CACHE_TIMEOUT', 300))
+    return analytics
@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core import checks
+
+from .encryption import encryption_problem
+
+
+@checks.register(checks.Tags.security)
+def check_document_encryption(app_configs, **kwargs):
+    """Confidential uploads fail without encryption, so a production deploy refuses to start"""
+    problem = encryption_problem()
+    if problem is None:
+        return []
+    level = checks.Warning if settings.DEBUG else checks.Error
+    return [level(
+        problem,
+        hint='Confidential documents are rejected until encryption is configured.',
+        id='documents.E001' if level is checks.Error else 'documents.W001',
+    )]
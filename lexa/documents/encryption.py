@@ -0,0 +1,292 @@
+"""
+Chunked authenticated encryption at rest for confidential documents.
+
+Encrypted files start with a header (magic, chunk size and a random salt)
+followed by fixed-size chunks, each sealed with AES-256-GCM under a key
+derived from DOCUMENT_ENCRYPTION_KEY and the salt. A chunk's nonce is its
+index and the last chunk is marked in the associated data, so reordered,
+swapped or truncated chunks fail to authenticate.
+
+Files are encrypted while they stream into storage and decrypted on the fly
+through a seekable reader, so memory per transfer is one chunk whatever the
+file size, and ranged reads only decrypt the chunks they touch. Requires
+the ``cryptography`` package.
+"""
+import hashlib
+import io
+import os
+import struct
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files import File
+from django.utils import timezone
+
+MAGIC = b'LXENC\x00\x01\x00'
+HEADER = struct.Struct('>8sI16s')
+TAG_SIZE = 16
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+
+class DecryptionError(Exception):
+    pass
+
+
+MISSING_PACKAGE = 'Encrypting confidential documents requires the cryptography package'
+MISSING_KEY = 'DOCUMENT_ENCRYPTION_KEY must be set to store confidential documents'
+
+
+def encryption_problem():
+    """Why confidential files cannot be encrypted here, or None if they can"""
+    try:
+        import cryptography  # noqa: F401
+    except ImportError:
+        return MISSING_PACKAGE
+    if not getattr(settings, 'DOCUMENT_ENCRYPTION_KEY', ''):
+        return MISSING_KEY
+    return None
+
+
+def _aead(salt):
+    try:
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+        from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+    except ImportError:
+        raise ImproperlyConfigured(MISSING_PACKAGE)
+
+    secret = getattr(settings, 'DOCUMENT_ENCRYPTION_KEY', '')
+    if not secret:
+        raise ImproperlyConfigured(MISSING_KEY)
+    master_key = hashlib.sha256(secret.encode('utf-8')).digest()
+    key = HKDF(
+        algorithm=hashes.SHA256(), length=32, salt=salt, info=b'lexa-document-file'
+    ).derive(master_key)
+    return AESGCM(key)
+
+
+def _nonce(index):
+    return index.to_bytes(12, 'big')
+
+
+def _aad(header, final):
+    return header + (b'\x01' if final else b'\x00')
+
+
+def encrypted_size(plain_size, chunk_size=DEFAULT_CHUNK_SIZE):
+    chunks = max(1, -(-plain_size // chunk_size))
+    return HEADER.size + plain_size + chunks * TAG_SIZE
+
+
+class EncryptedFile(File):
+    """
+    Wrap a plaintext file so that storage writes it encrypted.
+
+    Storage backends save content by iterating ``chunks()``, which here
+    yields the header and then one sealed chunk at a time.
+    """
+
+    def __init__(self, file, name=None, chunk_size=None):
+        super().__init__(file, name or getattr(file, 'name', None))
+        self.encryption_chunk_size = chunk_size or getattr(
+            settings, 'DOCUMENT_ENCRYPTION_CHUNK_SIZE', DEFAULT_CHUNK_SIZE
+        )
+        self.plain_size = file.size if hasattr(file, 'size') else None
+
+    @property
+    def size(self):
+        if self.plain_size is None:
+            return super().size
+        return encrypted_size(self.plain_size, self.encryption_chunk_size)
+
+    def multiple_chunks(self, chunk_size=None):
+        return True
+
+    def chunks(self, chunk_size=None):
+        chunk_size = self.encryption_chunk_size
+        salt = os.urandom(16)
+        header = HEADER.pack(MAGIC, chunk_size, salt)
+        aead = _aead(salt)
+        yield header
+
+        self.file.seek(0)
+        index = 0
+        current = self.file.read(chunk_size)
+        while True:
+            following = self.file.read(chunk_size)
+            final = not following
+            yield aead.encrypt(_nonce(index), current, _aad(header, final))
+            if final:
+                return
+            current = following
+            index += 1
+
+
+class DecryptedReader(io.RawIOBase):
+    """Seekable plaintext view of an encrypted file object"""
+
+    def __init__(self, raw):
+        self.raw = raw
+        header = raw.read(HEADER.size)
+        if len(header) != HEADER.size:
+            raise DecryptionError('Truncated header')
+        magic, self.chunk_size, salt = HEADER.unpack(header)
+        if magic != MAGIC:
+            raise DecryptionError('Not an encrypted document file')
+        self.header = header
+        self._aead = _aead(salt)
+
+        body = raw.seek(0, io.SEEK_END) - HEADER.size
+        sealed_chunk = self.chunk_size + TAG_SIZE
+        self.chunk_count = max(1, -(-body // sealed_chunk))
+        last = body - (self.chunk_count - 1) * sealed_chunk
+        if last < TAG_SIZE:
+            raise DecryptionError('Truncated file')
+        self.size = (self.chunk_count - 1) * self.chunk_size + last - TAG_SIZE
+
+        self._position = 0
+        self._chunk_index = None
+        self._chunk = b''
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError('Negative seek position')
+        self._position = offset
+        return offset
+
+    def _load(self, index):
+        if index == self._chunk_index:
+            return
+        from cryptography.exceptions import InvalidTag
+
+        sealed_chunk = self.chunk_size + TAG_SIZE
+        self.raw.seek(HEADER.size + index * sealed_chunk)
+        sealed = self.raw.read(sealed_chunk)
+        final = index == self.chunk_count - 1
+        try:
+            self._chunk = self._aead.decrypt(_nonce(index), sealed, _aad(self.header, final))
+        except InvalidTag:
+            raise DecryptionError(f'Chunk {index} failed authentication')
+        self._chunk_index = index
+
+    def readinto(self, buffer):
+        if self._position >= self.size:
+            return 0
+        index, offset = divmod(self._position, self.chunk_size)
+        self._load(index)
+        data = self._chunk[offset:offset + len(buffer)]
+        buffer[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self.raw.close()
+        super().close()
+
+
+def is_encrypted(fileobj):
+    position = fileobj.tell()
+    magic = fileobj.read(len(MAGIC))
+    fileobj.seek(position)
+    return magic == MAGIC
+
+
+def open_plaintext(field_file):
+    """
+    Open a stored file for reading, decrypting it if needed.
+
+    Returns ``(fileobj, size)``; the object is seekable and must be closed
+    by the caller.
+    """
+    fileobj = field_file.storage.open(field_file.name, 'rb')
+    if not is_encrypted(fileobj):
+        size = fileobj.seek(0, io.SEEK_END)
+        fileobj.seek(0)
+        return fileobj, size
+    reader = DecryptedReader(fileobj)
+    return io.BufferedReader(reader, buffer_size=reader.chunk_size), reader.size
+
+
+def rewrite_stored(field_file, encrypt):
+    """
+    Store an encrypted (or decrypted) copy of ``field_file`` next to it.
+
+    Returns the new name, or None when the file is already in that state.
+    The caller points the row at the copy and deletes the old file.
+    """
+    storage = field_file.storage
+    with storage.open(field_file.name, 'rb') as fileobj:
+        if is_encrypted(fileobj) == encrypt:
+            return None
+
+    source, _ = open_plaintext(field_file)
+    with source:
+        name = os.path.basename(field_file.name)
+        content = EncryptedFile(File(source), name=name) if encrypt else File(source, name=name)
+        return storage.save(field_file.name, content)
+
+
+def sync_document_encryption(document_id):
+    """
+    Make a document's stored files match its confidentiality flag.
+
+    Confidential documents get their file, version files and any kept
+    original encrypted; documents that stop being confidential get them
+    decrypted. Runs in the background after the flag or file changes.
+    """
+    from .models import Document, DocumentOptimization, DocumentText, DocumentVersion
+    from .previews import delete_previews
+
+    document = Document.objects.filter(pk=document_id).only('id', 'file', 'is_confidential').first()
+    if document is None:
+        return
+    encrypt = document.is_confidential
+
+    targets = []
+    if document.file:
+        targets.append((Document.objects.filter(pk=document.pk), 'file', document.file))
+    for version in DocumentVersion.objects.filter(document=document).exclude(file='').exclude(file__isnull=True):
+        targets.append((DocumentVersion.objects.filter(pk=version.pk), 'file', version.file))
+    optimization = DocumentOptimization.objects.filter(document=document).first()
+    if optimization is not None and optimization.original_file:
+        targets.append((
+            DocumentOptimization.objects.filter(pk=optimization.pk), 'original_file', optimization.original_file
+        ))
+
+    renamed = False
+    for queryset, field, field_file in targets:
+        old_name = field_file.name
+        try:
+            new_name = rewrite_stored(field_file, encrypt)
+        except FileNotFoundError:
+            continue
+        if new_name is None:
+            continue
+        # Only switch if the row still points at the file we rewrote
+        if queryset.filter(**{field: old_name}).update(**{field: new_name}):
+            renamed = True
+            field_file.storage.delete(old_name)
+            if field == 'file' and queryset.model is Document:
+                DocumentText.objects.filter(document_id=document_id, source_name=old_name).update(source_name=new_name)
+        else:
+            field_file.storage.delete(new_name)
+
+    if renamed:
+        # File URLs changed; retire the validators of the document and its versions
+        Document.objects.filter(pk=document_id).update(updated_at=timezone.now())
+    # Previews are plaintext renderings and are rebuilt on demand
+    delete_previews(document_id)
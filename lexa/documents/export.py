@@ -0,0 +1,129 @@
+"""
+Streaming ZIP export of documents.
+
+The archive is produced on the fly: each file is read in chunks, deflated
+into the ZIP stream and handed to the response as soon as it is written.
+Nothing is buffered on disk and memory stays bounded by the chunk size.
+Encrypted files are decrypted on the way in.
+A manifest.json describing every entry closes the archive.
+"""
+import io
+import json
+import os
+import zipfile
+
+from django.utils import timezone
+from django.utils.text import slugify
+
+from .encryption import open_plaintext
+
+CHUNK_SIZE = 64 * 1024
+# Formats that are already compressed only get a cheap deflate pass
+COMPRESSED_EXTENSIONS = {'.pdf', '.jpg', '.jpeg', '.png', '.webp', '.gif', '.docx', '.xlsx', '.zip'}
+
+
+class ZipStream(io.RawIOBase):
+    """Write-only sink that lets ZipFile emit bytes to a generator"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def pop(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _zip_info(arcname, when):
+    info = zipfile.ZipInfo(arcname, date_time=timezone.localtime(when).timetuple()[:6])
+    info.compress_type = zipfile.ZIP_DEFLATED
+    info.external_attr = 0o644 << 16
+    return info
+
+
+def _document_folder(document):
+    return f'{document.pk}-{slugify(document.title_fr)[:60] or "document"}'
+
+
+def _export_entries(documents):
+    """Yield (arcname, field_file or text, timestamp, manifest record) for each entry"""
+    for document in documents:
+        folder = _document_folder(document)
+        record = {
+            'id': document.pk,
+            'title_fr': document.title_fr,
+            'title_ar': document.title_ar,
+            'document_type': document.document_type,
+            'language': document.language,
+            'version': document.version,
+            'is_final': document.is_final,
+            'created_at': document.created_at.isoformat(),
+            'files': [],
+        }
+
+        if document.file:
+            name = f'{folder}/{os.path.basename(document.file.name)}'
+            yield name, document.file, document.updated_at, record
+        elif document.content:
+            yield f'{folder}/content.txt', document.content, document.updated_at, record
+
+        for version in document.versions.all():
+            if version.file:
+                name = f'{folder}/versions/v{version.version_number}-{os.path.basename(version.file.name)}'
+                yield name, version.file, version.created_at, record
+
+        yield None, None, None, record
+
+
+def stream_documents_zip(documents):
+    """Generate the bytes of a ZIP archive holding ``documents``"""
+    stream = ZipStream()
+    manifest = []
+
+    with zipfile.ZipFile(stream, 'w') as archive:
+        for arcname, source, when, record in _export_entries(documents):
+            if arcname is None:
+                manifest.append(record)
+                continue
+
+            info = _zip_info(arcname, when)
+            extension = os.path.splitext(arcname)[1].lower()
+            # ZipFile.open() has no compresslevel argument; it reads it from the ZipInfo
+            info._compresslevel = 1 if extension in COMPRESSED_EXTENSIONS else 6
+
+            if isinstance(source, str):
+                archive.writestr(info, source.encode('utf-8'))
+                record['files'].append({'path': arcname, 'size': len(source.encode('utf-8'))})
+                yield stream.pop()
+                continue
+
+            try:
+                fileobj, _ = open_plaintext(source)
+            except (OSError, ValueError):
+                record['files'].append({'path': arcname, 'missing': True})
+                continue
+
+            size = 0
+            with fileobj, archive.open(info, 'w', force_zip64=True) as target:
+                while chunk := fileobj.read(CHUNK_SIZE):
+                    target.write(chunk)
+                    size += len(chunk)
+                    yield stream.pop()
+            record['files'].append({'path': arcname, 'size': size})
+            yield stream.pop()
+
+        info = _zip_info('manifest.json', timezone.now())
+        archive.writestr(info, json.dumps({
+            'generated_at': timezone.now().isoformat(),
+            'document_count': len(manifest),
+            'documents': manifest,
+        }, ensure_ascii=False, indent=2).encode('utf-8'))
+
+    yield stream.pop()
@@ -0,0 +1,179 @@
+"""
+Text and metadata extraction for uploaded document files.
+
+Extraction runs in the background worker pool after the upload commits and
+stores its results in DocumentText. PDF support needs the optional ``pypdf``
+package; DOCX and plain text only use the standard library.
+"""
+import logging
+import os
+import re
+import time
+import zipfile
+from xml.etree import ElementTree
+
+from django.conf import settings
+from django.db import OperationalError
+from django.utils import timezone
+
+from utils.background import run_in_background
+from .models import Document, DocumentText
+from .encryption import open_plaintext
+from . import search
+
+logger = logging.getLogger(__name__)
+
+WORD_NAMESPACE = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+ARABIC_RE = re.compile(r'[\u0600-\u06FF\u0750-\u077F\uFB50-\uFDFF\uFE70-\uFEFF]')
+LATIN_RE = re.compile(r'[A-Za-zÀ-ÿ]')
+TEXT_ENCODINGS = ('utf-8', 'windows-1256', 'latin-1')
+
+
+class UnsupportedFileType(Exception):
+    pass
+
+
+def extract_pdf(fileobj):
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        raise UnsupportedFileType('PDF extraction requires the pypdf package')
+
+    reader = PdfReader(fileobj)
+    pages = [page.extract_text() or '' for page in reader.pages]
+    info = reader.metadata or {}
+    metadata = {
+        key.lstrip('/').lower(): str(value)
+        for key, value in info.items()
+        if key in ('/Title', '/Author', '/Subject', '/Creator', '/Producer')
+    }
+    return '\n\n'.join(pages), len(pages), metadata
+
+
+def extract_docx(fileobj):
+    with zipfile.ZipFile(fileobj) as archive:
+        root = ElementTree.fromstring(archive.read('word/document.xml'))
+        app = archive.read('docProps/app.xml') if 'docProps/app.xml' in archive.namelist() else None
+
+    paragraphs = []
+    for paragraph in root.iter(f'{WORD_NAMESPACE}p'):
+        paragraphs.append(''.join(node.text or '' for node in paragraph.iter(f'{WORD_NAMESPACE}t')))
+
+    page_count = None
+    if app:
+        pages = re.search(rb'<Pages>(\d+)</Pages>', app)
+        if pages:
+            page_count = int(pages.group(1))
+    return '\n'.join(paragraphs), page_count, {}
+
+
+def extract_txt(fileobj):
+    raw = fileobj.read()
+    for encoding in TEXT_ENCODINGS:
+        try:
+            return raw.decode(encoding), None, {'encoding': encoding}
+        except UnicodeDecodeError:
+            continue
+    return raw.decode('utf-8', errors='replace'), None, {'encoding': 'unknown'}
+
+
+EXTRACTORS = {
+    '.pdf': extract_pdf,
+    '.docx': extract_docx,
+    '.txt': extract_txt,
+}
+
+
+def detect_language(text):
+    """Guess fr/ar/bilingual from the share of Arabic and Latin letters"""
+    arabic = len(ARABIC_RE.findall(text))
+    latin = len(LATIN_RE.findall(text))
+    total = arabic + latin
+    if not total:
+        return ''
+    share = arabic / total
+    if share > 0.8:
+        return 'ar'
+    if share < 0.2:
+        return 'fr'
+    return 'bilingual'
+
+
+def schedule_extraction(document):
+    """Queue text extraction for a document's current file"""
+    if not document.file:
+        DocumentText.objects.filter(document=document).delete()
+        search.set_file_text(document.pk, '')
+        return
+    if DocumentText.objects.filter(document=document, source_name=document.file.name).exists():
+        return
+    DocumentText.objects.update_or_create(
+        document=document,
+        defaults={'status': 'pending', 'attempts': 0, 'error': ''}
+    )
+    run_in_background(extract_document, document.pk)
+
+
+def extract_document(document_id):
+    """
+    Extract and store the text of a document's file.
+
+    Transient failures (storage or database errors) are retried with an
+    exponential backoff up to DOCUMENT_EXTRACTION_MAX_ATTEMPTS.
+    """
+    max_attempts = getattr(settings, 'DOCUMENT_EXTRACTION_MAX_ATTEMPTS', 3)
+    max_chars = getattr(settings, 'DOCUMENT_EXTRACTION_MAX_CHARS', 2_000_000)
+
+    document = Document.objects.filter(pk=document_id).only('id', 'file').first()
+    if document is None or not document.file:
+        return
+
+    record, _ = DocumentText.objects.get_or_create(document=document)
+    while True:
+        record.attempts += 1
+        record.status = 'processing'
+        record.save(update_fields=['attempts', 'status', 'updated_at'])
+
+        try:
+            extractor = EXTRACTORS.get(os.path.splitext(document.file.name)[1].lower())
+            if extractor is None:
+                raise UnsupportedFileType(f'No extractor for {document.file_extension or "this file"}')
+
+            fileobj, _ = open_plaintext(document.file)
+            with fileobj:
+                text, page_count, metadata = extractor(fileobj)
+        except UnsupportedFileType as e:
+            record.status = 'unsupported'
+            record.error = str(e)
+            record.save(update_fields=['status', 'error', 'updated_at'])
+            return
+        except (OSError, OperationalError) as e:
+            if record.attempts >= max_attempts:
+                record.status = 'failed'
+                record.error = str(e)
+                record.save(update_fields=['status', 'error', 'updated_at'])
+                return
+            time.sleep(2 ** record.attempts)
+            continue
+        except Exception as e:
+            # Corrupt or unreadable files will not get better on retry
+            logger.warning('Text extraction failed for document %s: %s', document_id, e)
+            record.status = 'failed'
+            record.error = str(e)
+            record.save(update_fields=['status', 'error', 'updated_at'])
+            return
+        break
+
+    text = text.strip()[:max_chars]
+    record.text = text
+    record.page_count = page_count
+    record.word_count = len(text.split())
+    record.language = detect_language(text)
+    record.metadata = metadata
+    record.source_name = document.file.name
+    record.status = 'done'
+    record.error = ''
+    record.extracted_at = timezone.now()
+    record.save()
+
+    search.set_file_text(document_id, text)
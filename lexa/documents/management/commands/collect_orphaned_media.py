@@ -0,0 +1,184 @@
+import os
+import time
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import models
+from documents.models import Document
+from documents.previews import delete_previews
+
+PREVIEW_ROOT = os.path.join('previews', 'documents')
+
+class Command(BaseCommand):
+    help = 'Find and delete media files that no database row references'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report orphaned files without deleting them'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of files deleted between progress reports'
+        )
+        parser.add_argument(
+            '--pause',
+            type=float,
+            default=0,
+            help='Seconds to sleep after each batch to limit disk load'
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            help='Stop after this many orphans'
+        )
+        parser.add_argument(
+            '--min-age',
+            type=int,
+            default=24,
+            help='Ignore files modified in the last N hours (uploads in flight)'
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        batch_size = options['batch_size']
+        limit = options['limit']
+        cutoff = time.time() - options['min_age'] * 3600
+
+        self.stdout.write('🧹 Collecting orphaned media...')
+        if dry_run:
+            self.stdout.write('📋 DRY RUN - No files will be deleted')
+
+        fields = self.file_fields()
+        # Fields with callable upload_to have no fixed folder to scan
+        roots = sorted({self.upload_root(field) for _, field in fields} - {None})
+        referenced = self.referenced_paths(fields)
+        self.stdout.write(
+            f'   {len(referenced)} referenced files under {", ".join(roots)}'
+        )
+
+        found = reclaimed = 0
+        touched_dirs = set()
+        for path, size in self.orphans(roots, referenced, cutoff):
+            found += 1
+            reclaimed += size
+            if dry_run:
+                if options['verbosity'] > 1:
+                    self.stdout.write(f'   {os.path.relpath(path, settings.MEDIA_ROOT)} ({size} bytes)')
+            else:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                touched_dirs.add(os.path.dirname(path))
+
+            if found % batch_size == 0:
+                self.stdout.write(f'   {found} orphans, {reclaimed} bytes so far')
+                if options['pause'] and not dry_run:
+                    time.sleep(options['pause'])
+            if limit and found >= limit:
+                break
+
+        self.stdout.write(f'   {"Would delete" if dry_run else "Deleted"} {found} files ({reclaimed} bytes)')
+
+        if not limit or found < limit:
+            removed = self.collect_previews(dry_run)
+            self.stdout.write(
+                f'   {"Would remove" if dry_run else "Removed"} {removed} preview folders of deleted documents'
+            )
+
+        if not dry_run:
+            self.prune_empty_dirs(touched_dirs, roots)
+            self.stdout.write(
+                self.style.SUCCESS('✅ Orphaned media collected!')
+            )
+
+    @staticmethod
+    def file_fields():
+        """Every (model, FileField) pair in the project"""
+        return [
+            (model, field)
+            for model in apps.get_models()
+            for field in model._meta.get_fields()
+            if isinstance(field, models.FileField)
+        ]
+
+    @staticmethod
+    def upload_root(field):
+        """Top-level media folder a field uploads to, e.g. 'receipts'"""
+        if not isinstance(field.upload_to, str):
+            return None
+        return field.upload_to.strip('/').split('/')[0] or None
+
+    @staticmethod
+    def referenced_paths(fields):
+        referenced = set()
+        for model, field in fields:
+            names = model._default_manager.exclude(
+                **{field.name: ''}
+            ).exclude(
+                **{f'{field.name}__isnull': True}
+            ).values_list(field.name, flat=True)
+            for name in names.iterator(chunk_size=5000):
+                referenced.add(os.path.normpath(name))
+        return referenced
+
+    @staticmethod
+    def orphans(roots, referenced, cutoff):
+        """Yield (path, size) of unreferenced files, walking one directory at a time"""
+        media_root = settings.MEDIA_ROOT
+        stack = [os.path.join(media_root, root) for root in roots]
+        while stack:
+            directory = stack.pop()
+            try:
+                entries = os.scandir(directory)
+            except FileNotFoundError:
+                continue
+            with entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                        continue
+                    if not entry.is_file(follow_symlinks=False):
+                        continue
+                    if os.path.relpath(entry.path, media_root) in referenced:
+                        continue
+                    stat = entry.stat(follow_symlinks=False)
+                    if stat.st_mtime > cutoff:
+                        continue
+                    yield entry.path, stat.st_size
+
+    @staticmethod
+    def collect_previews(dry_run):
+        """Remove cached previews of documents that no longer exist"""
+        root = os.path.join(settings.MEDIA_ROOT, PREVIEW_ROOT)
+        try:
+            entries = [entry.name for entry in os.scandir(root) if entry.is_dir() and entry.name.isdigit()]
+        except FileNotFoundError:
+            return 0
+
+        ids = [int(name) for name in entries]
+        stale = []
+        for start in range(0, len(ids), 500):
+            batch = ids[start:start + 500]
+            existing = set(Document.objects.filter(id__in=batch).values_list('id', flat=True))
+            stale.extend(document_id for document_id in batch if document_id not in existing)
+        if not dry_run:
+            for document_id in stale:
+                delete_previews(document_id)
+        return len(stale)
+
+    @staticmethod
+    def prune_empty_dirs(directories, roots):
+        """Remove folders emptied by this run, up to (not including) the upload roots"""
+        keep = {os.path.join(settings.MEDIA_ROOT, root) for root in roots}
+        for directory in sorted(directories, key=len, reverse=True):
+            while directory not in keep and directory.startswith(settings.MEDIA_ROOT):
+                try:
+                    os.rmdir(directory)
+                except OSError:
+                    break
+                directory = os.path.dirname(directory)
@@ -0,0 +1,94 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from documents.models import DocumentVersion
+from documents.versioning import encode_version, keyframe_interval, rebuild_chain
+
+class Command(BaseCommand):
+    help = 'Re-encode document version chains as keyframes and deltas'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--keyframe-interval',
+            type=int,
+            default=None,
+            help='Store a full copy every N versions (defaults to DOCUMENT_VERSION_KEYFRAME_INTERVAL)'
+        )
+        parser.add_argument(
+            '--document',
+            type=int,
+            help='Only compact the versions of this document'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show the expected savings without writing anything'
+        )
+
+    def handle(self, *args, **options):
+        interval = options['keyframe_interval'] or keyframe_interval()
+        dry_run = options['dry_run']
+
+        document_ids = DocumentVersion.objects.order_by('document_id').values_list(
+            'document_id', flat=True
+        ).distinct()
+        if options['document']:
+            document_ids = document_ids.filter(document_id=options['document'])
+
+        self.stdout.write(f'🗜️ Compacting document versions (keyframe every {interval} versions)...')
+        if dry_run:
+            self.stdout.write('📋 DRY RUN - No data will be modified')
+
+        documents_count = 0
+        versions_count = 0
+        size_before = 0
+        size_after = 0
+
+        for document_id in document_ids.iterator():
+            with transaction.atomic():
+                versions = list(
+                    DocumentVersion.objects.select_for_update().filter(
+                        document_id=document_id
+                    ).order_by('version_number').only(
+                        'id', 'version_number', 'stored_content', 'is_keyframe'
+                    )
+                )
+
+                previous_content = None
+                changed = []
+                for version in versions:
+                    if version.is_keyframe:
+                        content = version.stored_content
+                    else:
+                        content = rebuild_chain([
+                            (True, previous_content or ''),
+                            (False, version.stored_content),
+                        ])
+
+                    stored_content, is_keyframe = encode_version(
+                        previous_content, content, version.version_number, interval
+                    )
+                    size_before += len(version.stored_content.encode('utf-8'))
+                    size_after += len(stored_content.encode('utf-8'))
+
+                    if stored_content != version.stored_content or is_keyframe != version.is_keyframe:
+                        version.stored_content = stored_content
+                        version.is_keyframe = is_keyframe
+                        changed.append(version)
+                    previous_content = content
+
+                if changed and not dry_run:
+                    DocumentVersion.objects.bulk_update(changed, ['stored_content', 'is_keyframe'])
+                    cache.delete_many([version.content_cache_key for version in changed])
+
+            documents_count += 1
+            versions_count += len(changed)
+
+        action = 'Would re-encode' if dry_run else 'Re-encoded'
+        self.stdout.write(f'   {action} {versions_count} versions across {documents_count} documents')
+        self.stdout.write(f'   Stored content: {size_before} bytes -> {size_after} bytes')
+
+        if not dry_run:
+            self.stdout.write(
+                self.style.SUCCESS('✅ Compaction completed successfully!')
+            )
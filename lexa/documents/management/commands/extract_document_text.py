@@ -0,0 +1,74 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.db.models import Count, Q
+from documents.models import Document, DocumentText
+from documents.extraction import extract_document
+
+class Command(BaseCommand):
+    help = 'Extract text from uploaded document files that have not been processed yet'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--retry-failed',
+            action='store_true',
+            help='Also retry documents whose extraction failed'
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Re-extract every document with a file'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Number of parallel extraction workers'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=200,
+            help='Number of documents queued at a time'
+        )
+
+    def handle(self, *args, **options):
+        documents = Document.objects.exclude(file='').exclude(file__isnull=True)
+
+        if not options['force']:
+            statuses = ['pending', 'processing']
+            if options['retry_failed']:
+                statuses.append('failed')
+            documents = documents.filter(
+                Q(extracted_text__isnull=True) | Q(extracted_text__status__in=statuses)
+            )
+
+        document_ids = list(documents.order_by('id').values_list('id', flat=True))
+        self.stdout.write(f'📄 Extracting text from {len(document_ids)} documents...')
+
+        batch_size = options['batch_size']
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            for start in range(0, len(document_ids), batch_size):
+                batch = document_ids[start:start + batch_size]
+                DocumentText.objects.filter(document_id__in=batch).update(attempts=0, source_name='')
+                list(pool.map(self.extract, batch))
+                self.stdout.write(f'   Processed {min(start + batch_size, len(document_ids))}/{len(document_ids)}')
+
+        counts = dict(
+            DocumentText.objects.values_list('status').annotate(
+                total=Count('id')
+            )
+        )
+        for status, total in sorted(counts.items()):
+            self.stdout.write(f'   {status}: {total}')
+
+        self.stdout.write(
+            self.style.SUCCESS('✅ Text extraction completed!')
+        )
+
+    @staticmethod
+    def extract(document_id):
+        try:
+            extract_document(document_id)
+        finally:
+            close_old_connections()
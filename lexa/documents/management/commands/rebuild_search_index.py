@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from documents.models import Document, DocumentText
+from documents import search
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index of documents'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of documents indexed per transaction'
+        )
+
+    def handle(self, *args, **options):
+        if not search.search_available():
+            raise CommandError('Full-text search requires the SQLite backend')
+
+        batch_size = options['batch_size']
+        self.stdout.write('🔎 Rebuilding document search index...')
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {search.SEARCH_TABLE} "
+                f"WHERE rowid NOT IN (SELECT id FROM {Document._meta.db_table})"
+            )
+            self.stdout.write(f'   Removed {cursor.rowcount} stale entries')
+
+        documents = Document.objects.only('id', 'title_fr', 'title_ar', 'content').order_by('id')
+        indexed = 0
+        last_id = 0
+        while True:
+            batch = list(documents.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            file_texts = dict(
+                DocumentText.objects.filter(
+                    document_id__in=[document.id for document in batch],
+                    status='done'
+                ).values_list('document_id', 'text')
+            )
+            with transaction.atomic():
+                for document in batch:
+                    search.index_document(document)
+                    search.set_file_text(document.id, file_texts.get(document.id, ''))
+            indexed += len(batch)
+            last_id = batch[-1].id
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {search.SEARCH_TABLE}({search.SEARCH_TABLE}) VALUES ('optimize')")
+
+        self.stdout.write(
+            self.style.SUCCESS(f'✅ Indexed {indexed} documents')
+        )
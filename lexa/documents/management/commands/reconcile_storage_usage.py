@@ -0,0 +1,68 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from documents.models import StorageUsage
+from documents.quota import measure_usage
+
+User = get_user_model()
+
+class Command(BaseCommand):
+    help = 'Recompute per-user storage usage and fix counters that drifted'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            type=int,
+            help='Only reconcile this user id'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report drift without fixing it'
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        user_id = options['user']
+
+        self.stdout.write('📊 Reconciling storage usage...')
+        if dry_run:
+            self.stdout.write('📋 DRY RUN - No counters will be changed')
+
+        users = User.objects.all()
+        if user_id:
+            users = users.filter(id=user_id)
+        bytes_used, document_count = measure_usage(user_id)
+
+        current = {
+            usage.user_id: usage
+            for usage in StorageUsage.objects.filter(user__in=users)
+        }
+
+        fixed = 0
+        for uid in users.values_list('id', flat=True).iterator():
+            usage = current.get(uid)
+            expected = (bytes_used.get(uid, 0), document_count.get(uid, 0))
+            actual = (usage.bytes_used, usage.document_count) if usage else (0, 0)
+            if usage is not None and expected == actual:
+                continue
+            if expected == actual == (0, 0):
+                continue
+
+            self.stdout.write(
+                f'   User {uid}: {actual[0]} bytes / {actual[1]} documents '
+                f'-> {expected[0]} bytes / {expected[1]} documents'
+            )
+            fixed += 1
+            if not dry_run:
+                StorageUsage.objects.update_or_create(
+                    user_id=uid,
+                    defaults={'bytes_used': expected[0], 'document_count': expected[1]}
+                )
+
+        action = 'Would fix' if dry_run else 'Fixed'
+        self.stdout.write(f'   {action} {fixed} usage counters')
+
+        if not dry_run:
+            self.stdout.write(
+                self.style.SUCCESS('✅ Storage usage reconciled!')
+            )
@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0002_remove_document_case_remove_document_tags'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='documentversion',
+            old_name='content',
+            new_name='stored_content',
+        ),
+        migrations.AddField(
+            model_name='documentversion',
+            name='is_keyframe',
+            field=models.BooleanField(default=True),
+        ),
+    ]
@@ -0,0 +1,37 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    from documents.search import SEARCH_TABLE, create_search_table, normalize_text
+
+    Document = apps.get_model('documents', 'Document')
+    with schema_editor.connection.cursor() as cursor:
+        create_search_table(cursor)
+        rows = Document.objects.values_list('id', 'title_fr', 'title_ar', 'content').iterator()
+        for document_id, title_fr, title_ar, content in rows:
+            cursor.execute(
+                f"INSERT INTO {SEARCH_TABLE}(rowid, title_fr, title_ar, content, file_text) "
+                f"VALUES (%s, %s, %s, %s, '')",
+                [document_id, normalize_text(title_fr), normalize_text(title_ar), normalize_text(content)]
+            )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    from documents.search import SEARCH_TABLE
+
+    schema_editor.execute(f"DROP TABLE IF EXISTS {SEARCH_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0003_documentversion_delta_storage'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
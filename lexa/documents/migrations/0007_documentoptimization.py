@@ -0,0 +1,36 @@
+# Generated by Django 4.2.7 on 2026-10-19 16:22
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0006_storageusage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentOptimization',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('done', 'Done'), ('skipped', 'Skipped'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('source_name', models.CharField(blank=True, max_length=255)),
+                ('optimized_name', models.CharField(blank=True, max_length=255)),
+                ('original_file', models.FileField(blank=True, null=True, upload_to='documents/originals/%Y/%m/')),
+                ('original_size', models.PositiveIntegerField(blank=True, null=True)),
+                ('optimized_size', models.PositiveIntegerField(blank=True, null=True)),
+                ('output_format', models.CharField(blank=True, max_length=10)),
+                ('page_count', models.PositiveIntegerField(blank=True, null=True)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('document', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='optimization', to='documents.document')),
+            ],
+            options={
+                'verbose_name': 'Document Optimization',
+                'verbose_name_plural': 'Document Optimizations',
+            },
+        ),
+    ]
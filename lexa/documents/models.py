@@ -1,7 +1,11 @@
 from django.db import models
+from django.db.models.functions import Coalesce
+from django.conf import settings
+from django.core.cache import cache
 from django.contrib.auth import get_user_model
 from django.utils.translation import gettext_lazy as _
 from cases.models import Case
+from .versioning import encode_version, rebuild_chain
 import os
 
 User = get_user_model()
@@ -55,6 +59,21 @@ class DocumentTemplate(models.Model):
     def __str__(self):
         return self.name
 
+class DocumentQuerySet(models.QuerySet):
+    def with_counts(self):
+        """Annotate version_count and active share_count without joining the related rows"""
+        versions = DocumentVersion.objects.filter(
+            document=models.OuterRef('pk')
+        ).order_by().values('document').annotate(total=models.Count('id')).values('total')
+        shares = DocumentShare.objects.filter(
+            document=models.OuterRef('pk'),
+            is_active=True
+        ).order_by().values('document').annotate(total=models.Count('id')).values('total')
+        return self.annotate(
+            version_count=Coalesce(models.Subquery(versions), 0),
+            share_count=Coalesce(models.Subquery(shares), 0),
+        )
+
 class Document(models.Model):
     DOCUMENT_TYPES = [
         ('template', _('Generated from template')),
@@ -108,6 +127,8 @@ class Document(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = DocumentQuerySet.as_manager()
+
     class Meta:
         verbose_name = _('Document')
         verbose_name_plural = _('Documents')
@@ -131,8 +152,12 @@ class Document(models.Model):
 class DocumentVersion(models.Model):
     document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='versions')
     version_number = models.PositiveIntegerField()
-    content = models.TextField(blank=True)
+    # Full text for keyframes, delta against the previous version otherwise.
+    # Use the `content` property to read and write the actual text.
+    stored_content = models.TextField(blank=True)
+    is_keyframe = models.BooleanField(default=True)
     file = models.FileField(upload_to='document_versions/%Y/%m/', null=True, blank=True)
+    file_size = models.PositiveIntegerField(null=True, blank=True)
     change_notes = models.TextField(blank=True)
     
     # User who created this version
@@ -148,6 +173,90 @@ class DocumentVersion(models.Model):
     def __str__(self):
         return f"{self.document.title_fr} v{self.version_number}"
 
+    @property
+    def content(self):
+        """Full text of this version, rebuilt from the delta chain if needed"""
+        if getattr(self, '_content', None) is None:
+            if self.is_keyframe or not self.pk:
+                self._content = self.stored_content
+            else:
+                self._content = cache.get(self.content_cache_key)
+                if self._content is None:
+                    self._content = self._rebuild_content()
+                    cache.set(
+                        self.content_cache_key,
+                        self._content,
+                        getattr(settings, 'DOCUMENT_VERSION_CACHE_TIMEOUT', 3600)
+                    )
+        return self._content
+
+    @content.setter
+    def content(self, value):
+        self._content = value or ''
+        self._content_changed = True
+
+    @property
+    def content_cache_key(self):
+        return f'documents:version:{self.pk}:content'
+
+    def _rebuild_content(self):
+        siblings = DocumentVersion.objects.filter(document_id=self.document_id)
+        keyframe_number = siblings.filter(
+            version_number__lte=self.version_number,
+            is_keyframe=True
+        ).order_by('-version_number').values_list('version_number', flat=True).first()
+        chain = siblings.filter(
+            version_number__gte=keyframe_number or 0,
+            version_number__lte=self.version_number
+        ).order_by('version_number').values_list('is_keyframe', 'stored_content')
+        return rebuild_chain(chain)
+
+    def _next_version(self):
+        return DocumentVersion.objects.filter(
+            document_id=self.document_id,
+            version_number__gt=self.version_number
+        ).order_by('version_number').first()
+
+    def _detach_next_version(self):
+        """Turn the following version into a keyframe so it no longer depends on this one"""
+        next_version = self._next_version()
+        if next_version and not next_version.is_keyframe:
+            next_version.stored_content = next_version.content
+            next_version.is_keyframe = True
+            super(DocumentVersion, next_version).save(update_fields=['stored_content', 'is_keyframe'])
+
+    def save(self, *args, **kwargs):
+        if self.file and self.file_size is None:
+            self.file_size = self.file.size
+
+        if getattr(self, '_content_changed', False):
+            if self.pk:
+                self._detach_next_version()
+                cache.delete(self.content_cache_key)
+
+            previous = DocumentVersion.objects.filter(
+                document_id=self.document_id,
+                version_number__lt=self.version_number
+            ).exclude(pk=self.pk).order_by('-version_number').first()
+            self.stored_content, self.is_keyframe = encode_version(
+                previous.content if previous else None,
+                self._content,
+                self.version_number
+            )
+            self._content_changed = False
+
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None and 'content' in update_fields:
+                kwargs['update_fields'] = [
+                    f for f in update_fields if f != 'content'
+                ] + ['stored_content', 'is_keyframe']
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        self._detach_next_version()
+        cache.delete(self.content_cache_key)
+        return super().delete(*args, **kwargs)
+
 class DocumentShare(models.Model):
     ACCESS_LEVELS = [
         ('view', _('View only')),
@@ -177,4 +286,104 @@ class DocumentShare(models.Model):
         verbose_name_plural = _('Document Shares')
 
     def __str__(self):
-        return f"{self.document.title_fr} shared with {self.shared_with_email}"
\ No newline at end of file
+        return f"{self.document.title_fr} shared with {self.shared_with_email}"
+class DocumentText(models.Model):
+    STATUS_CHOICES = [
+        ('pending', _('Pending')),
+        ('processing', _('Processing')),
+        ('done', _('Done')),
+        ('failed', _('Failed')),
+        ('unsupported', _('Unsupported file type')),
+    ]
+
+    document = models.OneToOneField(Document, on_delete=models.CASCADE, related_name='extracted_text')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+
+    # Extraction results
+    text = models.TextField(blank=True)
+    page_count = models.PositiveIntegerField(null=True, blank=True)
+    word_count = models.PositiveIntegerField(default=0)
+    language = models.CharField(max_length=20, choices=Document.LANGUAGE_CHOICES, blank=True)
+    metadata = models.JSONField(default=dict, blank=True)
+
+    # File the text was extracted from, to detect replaced uploads
+    source_name = models.CharField(max_length=255, blank=True)
+
+    # Retry tracking
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    extracted_at = models.DateTimeField(null=True, blank=True)
+
+    # Metadata
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = _('Document Text')
+        verbose_name_plural = _('Document Texts')
+        indexes = [
+            models.Index(fields=['status']),
+        ]
+
+    def __str__(self):
+        return f"Text of {self.document.title_fr} ({self.status})"
+
+
+class DocumentOptimization(models.Model):
+    STATUS_CHOICES = [
+        ('pending', _('Pending')),
+        ('processing', _('Processing')),
+        ('done', _('Done')),
+        ('skipped', _('Skipped')),
+        ('failed', _('Failed')),
+    ]
+
+    document = models.OneToOneField(Document, on_delete=models.CASCADE, related_name='optimization')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+
+    # Upload the run started from, and the file it produced
+    source_name = models.CharField(max_length=255, blank=True)
+    optimized_name = models.CharField(max_length=255, blank=True)
+
+    # Untouched upload, kept when DOCUMENT_IMAGE_KEEP_ORIGINAL is set
+    original_file = models.FileField(upload_to='documents/originals/%Y/%m/', null=True, blank=True)
+
+    # Savings
+    original_size = models.PositiveIntegerField(null=True, blank=True)
+    optimized_size = models.PositiveIntegerField(null=True, blank=True)
+    output_format = models.CharField(max_length=10, blank=True)
+    page_count = models.PositiveIntegerField(null=True, blank=True)
+
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = _('Document Optimization')
+        verbose_name_plural = _('Document Optimizations')
+
+    def __str__(self):
+        return f"Optimization of {self.document.title_fr} ({self.status})"
+
+    @property
+    def saved_bytes(self):
+        if self.status != 'done' or self.original_size is None or self.optimized_size is None:
+            return 0
+        return self.original_size - self.optimized_size
+
+
+class StorageUsage(models.Model):
+    """Running totals of a user's stored files, kept up to date by signals"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='storage_usage')
+    bytes_used = models.BigIntegerField(default=0)
+    document_count = models.IntegerField(default=0)
+
+    # Metadata
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = _('Storage Usage')
+        verbose_name_plural = _('Storage Usage')
+
+    def __str__(self):
+        return f"{self.user} - {self.bytes_used} bytes, {self.document_count} documents"
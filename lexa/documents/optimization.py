@@ -0,0 +1,219 @@
+"""
+Upload-time re-encoding of scanned images.
+
+When DOCUMENT_IMAGE_OPTIMIZATION is set, photos and scanner output are
+re-encoded to DOCUMENT_IMAGE_FORMAT (``jpeg``, ``webp`` or ``pdf``),
+optionally in grayscale and capped at DOCUMENT_IMAGE_MAX_SIDE pixels. Every
+output is lossy, so only JPEG uploads are touched unless
+DOCUMENT_IMAGE_CONVERT_LOSSLESS also lets PNG, BMP and TIFF through.
+Multi-page TIFFs always become a single PDF. Encoding runs in the process
+pool from a background job; the document only switches to the new file
+when it is meaningfully smaller. With DOCUMENT_IMAGE_KEEP_ORIGINAL the
+untouched upload is kept as DocumentOptimization.original_file and counts
+towards the owner's quota, unless the quota has no room for it.
+"""
+import logging
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+
+from utils.background import call_in_process, run_in_background
+from .models import Document, DocumentOptimization
+from .quota import adjust_usage, file_bytes, remaining_bytes
+
+logger = logging.getLogger(__name__)
+
+LOSSY_EXTENSIONS = {'.jpg', '.jpeg'}
+LOSSLESS_EXTENSIONS = {'.png', '.bmp', '.tif', '.tiff'}
+OUTPUT_TYPES = {
+    'jpeg': ('.jpg', 'image/jpeg'),
+    'webp': ('.webp', 'image/webp'),
+    'pdf': ('.pdf', 'application/pdf'),
+}
+# Re-encoded files must save at least this share of the original
+MIN_SAVING = 0.05
+
+
+def optimization_enabled():
+    return getattr(settings, 'DOCUMENT_IMAGE_OPTIMIZATION', False)
+
+
+def optimizable_extensions():
+    if getattr(settings, 'DOCUMENT_IMAGE_CONVERT_LOSSLESS', False):
+        return LOSSY_EXTENSIONS | LOSSLESS_EXTENSIONS
+    return LOSSY_EXTENSIONS
+
+
+def can_optimize(document):
+    if not document.file or document.file_extension not in optimizable_extensions():
+        return False
+    if document.is_confidential:
+        # Encoding needs the plaintext on disk; confidential files stay as uploaded
+        return False
+    min_size = getattr(settings, 'DOCUMENT_IMAGE_MIN_SIZE', 256 * 1024)
+    return file_bytes(document.file, document.file_size) >= min_size
+
+
+def _prepare(image, grayscale, max_side):
+    from PIL import Image, ImageOps
+
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+    image = image.convert('L' if grayscale else 'RGB')
+    image.thumbnail((max_side, max_side), Image.LANCZOS)
+    return image
+
+
+def encode_image(source_path, target_stem, output_format, quality, grayscale, max_side):
+    """
+    Re-encode ``source_path`` next to ``target_stem`` and return
+    (path, output_format, page_count).
+
+    Runs in a worker process, so it only touches the filesystem.
+    """
+    from PIL import Image, ImageSequence
+
+    with Image.open(source_path) as image:
+        pages = [
+            _prepare(frame.copy(), grayscale, max_side)
+            for frame in ImageSequence.Iterator(image)
+        ] if getattr(image, 'n_frames', 1) > 1 else [_prepare(image, grayscale, max_side)]
+
+    if len(pages) > 1:
+        output_format = 'pdf'
+    path = target_stem + OUTPUT_TYPES[output_format][0]
+
+    if output_format == 'pdf':
+        pages[0].save(
+            path, 'PDF', save_all=True, append_images=pages[1:],
+            resolution=300, quality=quality
+        )
+    elif output_format == 'webp':
+        pages[0].save(path, 'WEBP', quality=quality, method=4)
+    else:
+        pages[0].save(path, 'JPEG', quality=quality, optimize=True, progressive=True)
+    return path, output_format, len(pages)
+
+
+def _release_original(record):
+    """Drop a kept original and take it off the owner's storage usage"""
+    if not record.original_file:
+        return
+    name, size = record.original_file.name, record.original_size
+    storage = record.original_file.storage
+    transaction.on_commit(lambda: storage.delete(name))
+    adjust_usage(record.document.user_id, -(size or 0))
+    record.original_file = None
+
+
+def schedule_optimization(document):
+    """Queue re-encoding of a newly uploaded image"""
+    if not optimization_enabled() or not can_optimize(document):
+        return
+    record = DocumentOptimization.objects.filter(document=document).first()
+    if record is not None and document.file.name in (record.source_name, record.optimized_name):
+        return
+
+    if record is None:
+        record = DocumentOptimization(document=document)
+    _release_original(record)
+    record.status = 'pending'
+    record.source_name = document.file.name
+    record.optimized_name = ''
+    record.original_size = record.optimized_size = record.page_count = None
+    record.output_format = record.error = ''
+    record.save()
+    run_in_background(optimize_document, document.pk)
+
+
+def optimize_document(document_id):
+    document = Document.objects.filter(pk=document_id).first()
+    record = DocumentOptimization.objects.filter(document_id=document_id).first()
+    if document is None or record is None or document.file.name != record.source_name:
+        return
+
+    try:
+        source_path = document.file.path
+    except NotImplementedError:
+        record.status = 'skipped'
+        record.error = 'Storage has no local path'
+        record.save(update_fields=['status', 'error', 'updated_at'])
+        return
+
+    record.status = 'processing'
+    record.original_size = file_bytes(document.file, document.file_size)
+    record.save(update_fields=['status', 'original_size', 'updated_at'])
+
+    workdir = tempfile.mkdtemp(prefix='lexa-optimize-')
+    try:
+        stem = os.path.splitext(os.path.basename(document.file.name))[0]
+        try:
+            path, output_format, page_count = call_in_process(
+                encode_image,
+                source_path,
+                os.path.join(workdir, stem),
+                getattr(settings, 'DOCUMENT_IMAGE_FORMAT', 'jpeg'),
+                getattr(settings, 'DOCUMENT_IMAGE_QUALITY', 75),
+                getattr(settings, 'DOCUMENT_IMAGE_GRAYSCALE', False),
+                getattr(settings, 'DOCUMENT_IMAGE_MAX_SIDE', 3508),
+            )
+        except Exception as e:
+            logger.warning('Image optimization failed for document %s: %s', document_id, e)
+            record.status = 'failed'
+            record.error = str(e)
+            record.save(update_fields=['status', 'error', 'updated_at'])
+            return
+
+        record.optimized_size = os.path.getsize(path)
+        record.output_format = output_format
+        record.page_count = page_count
+        if record.optimized_size > record.original_size * (1 - MIN_SAVING):
+            record.status = 'skipped'
+            record.save()
+            return
+
+        _swap_file(document, record, path, output_format)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _swap_file(document, record, path, output_format):
+    keep_original = getattr(settings, 'DOCUMENT_IMAGE_KEEP_ORIGINAL', False)
+    with transaction.atomic():
+        document = Document.objects.select_for_update().select_related('user').get(pk=document.pk)
+        if document.file.name != record.source_name:
+            # Replaced while we were encoding; the new upload has its own run
+            return
+        if keep_original:
+            # Keeping both files adds the optimized size to the owner's usage
+            remaining = remaining_bytes(document.user)
+            keep_original = remaining is None or remaining >= record.optimized_size
+
+        original = document.file.name
+        storage = document.file.storage
+        with open(path, 'rb') as optimized:
+            document.file.save(os.path.basename(path), File(optimized), save=False)
+
+        record.optimized_name = document.file.name
+        record.status = 'done'
+        if keep_original:
+            record.original_file.name = original
+        record.save()
+
+        document.file_size = record.optimized_size
+        document.file_type = OUTPUT_TYPES[output_format][1]
+        document.save(update_fields=['file', 'file_size', 'file_type', 'updated_at'])
+
+        if keep_original:
+            # The document now accounts for the optimized file only
+            adjust_usage(document.user_id, record.original_size)
+        else:
+            transaction.on_commit(lambda: storage.delete(original))
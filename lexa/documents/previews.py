@@ -0,0 +1,163 @@
+"""
+Thumbnails and first-page previews for document files.
+
+Previews are JPEGs rendered with Pillow at the sizes in
+DOCUMENT_PREVIEW_SIZES and cached under MEDIA_ROOT/previews/documents/<id>/.
+File names carry a digest of the source file so a replaced upload never
+serves a stale preview. Rendering runs in the process pool after upload;
+the cache remembers scheduled and failed renders per file digest so polling
+the preview endpoint neither queues duplicate jobs nor waits forever.
+"""
+import hashlib
+import os
+import shutil
+
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+
+from utils.background import call_in_process, run_in_background
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PREVIEW_SIZES = {
+    'small': 160,
+    'medium': 480,
+    'large': 1200,
+}
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tif', '.tiff', '.webp'}
+PREVIEW_EXTENSIONS = IMAGE_EXTENSIONS | {'.pdf'}
+PREVIEW_PENDING = 'pending'
+PREVIEW_FAILED = 'failed'
+
+
+def preview_sizes():
+    return getattr(settings, 'DOCUMENT_PREVIEW_SIZES', DEFAULT_PREVIEW_SIZES)
+
+
+def preview_dir(document_id):
+    return os.path.join(settings.MEDIA_ROOT, 'previews', 'documents', str(document_id))
+
+
+def preview_digest(document):
+    source = f'{document.file.name}:{document.file_size or ""}'
+    return hashlib.sha1(source.encode('utf-8')).hexdigest()[:16]
+
+
+def preview_path(document, size):
+    return os.path.join(preview_dir(document.pk), f'{preview_digest(document)}_{size}.jpg')
+
+
+def preview_state_key(document):
+    return f'documents:preview:{document.pk}:{preview_digest(document)}'
+
+
+def preview_state(document):
+    """PREVIEW_PENDING, PREVIEW_FAILED or None for the document's current file"""
+    return cache.get(preview_state_key(document))
+
+
+def can_preview(document):
+    # Previews are plaintext renderings, so confidential files get none
+    return bool(document.file) and not document.is_confidential and document.file_extension in PREVIEW_EXTENSIONS
+
+
+def _first_page(source_path):
+    """Return the first page of an image or scanned PDF as a Pillow image"""
+    from PIL import Image
+
+    if os.path.splitext(source_path)[1].lower() == '.pdf':
+        # Pillow cannot rasterize PDFs; scans embed each page as an image
+        try:
+            from pypdf import PdfReader
+        except ImportError:
+            return None
+
+        reader = PdfReader(source_path)
+        if not reader.pages or not reader.pages[0].images:
+            return None
+        return reader.pages[0].images[0].image
+
+    image = Image.open(source_path)
+    image.seek(0)  # first frame of multi-page TIFFs and animations
+    return image
+
+
+def render_previews(source_path, targets):
+    """
+    Render ``targets`` ({path: max_side}) from ``source_path``.
+
+    Runs in a worker process, so it only touches the filesystem. Previews
+    of older files in the target directory are removed once the new ones
+    exist; temporary files of renders still in progress are left alone.
+    """
+    from PIL import Image
+
+    image = _first_page(source_path)
+    if image is None:
+        return []
+
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+    else:
+        image = image.convert('RGB')
+
+    written = []
+    for path, max_side in sorted(targets.items(), key=lambda item: -item[1]):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+        temp_path = f'{path}.tmp'
+        image.save(temp_path, 'JPEG', quality=80, optimize=True, progressive=True)
+        os.replace(temp_path, path)
+        written.append(path)
+
+    for directory in {os.path.dirname(path) for path in targets}:
+        for entry in os.scandir(directory):
+            if entry.name.endswith('.jpg') and entry.path not in targets:
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+    return written
+
+
+def _render_job(key, source_path, targets):
+    """Render in the process pool and record the outcome for the preview view"""
+    try:
+        written = call_in_process(render_previews, source_path, targets)
+    except Exception:
+        logger.exception('Preview rendering failed for %s', source_path)
+        written = []
+    if written:
+        cache.delete(key)
+    else:
+        cache.set(key, PREVIEW_FAILED, getattr(settings, 'DOCUMENT_PREVIEW_FAILURE_TIMEOUT', 60 * 60))
+
+
+def schedule_previews(document):
+    """Queue preview rendering for a document's current file"""
+    if not can_preview(document):
+        return
+    try:
+        source_path = document.file.path
+    except NotImplementedError:
+        # Remote storage backends have no local path to render from
+        return
+
+    targets = {preview_path(document, size): max_side for size, max_side in preview_sizes().items()}
+    if all(os.path.exists(path) for path in targets):
+        return
+    # Only the first caller per file digest queues a render; the marker
+    # expires so a render lost with its worker is eventually retried
+    key = preview_state_key(document)
+    if not cache.add(key, PREVIEW_PENDING, getattr(settings, 'DOCUMENT_PREVIEW_PENDING_TIMEOUT', 10 * 60)):
+        return
+    run_in_background(_render_job, key, source_path, targets)
+
+
+def delete_previews(document_id):
+    shutil.rmtree(preview_dir(document_id), ignore_errors=True)
@@ -0,0 +1,156 @@
+"""
+Per-user storage accounting and quota checks.
+
+StorageUsage holds running totals (bytes of documents, versions and
+expense receipts, and the number of documents). Signals adjust them with
+atomic F() updates on every upload, replacement and delete, and the
+reconcile_storage_usage command repairs any drift. A user's row is seeded
+from the stored files the first time it is needed, so users who uploaded
+before the counters existed start from their real usage. Limits come from
+the user's admin_panel Subscription; users without one are not limited.
+"""
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+
+from .models import Document, DocumentOptimization, DocumentVersion, StorageUsage
+
+BYTES_PER_GB = 1024 ** 3
+
+
+def file_bytes(field_file, known_size=None):
+    """Size of a stored file, or 0 if there is none or it cannot be read"""
+    if not field_file:
+        return 0
+    if known_size is not None:
+        return known_size
+    try:
+        return field_file.size
+    except (OSError, ValueError):
+        return 0
+
+
+def measure_usage(user_id=None):
+    """
+    Recompute usage from the stored rows and files.
+
+    Returns ``(bytes_used, document_count)`` dicts keyed by user id, for
+    every user or only ``user_id``.
+    """
+    from billing.models import Expense
+
+    bytes_used = defaultdict(int)
+    document_count = defaultdict(int)
+
+    documents = Document.objects.all()
+    versions = DocumentVersion.objects.exclude(file='').exclude(file__isnull=True)
+    originals = DocumentOptimization.objects.exclude(original_file='').exclude(original_file__isnull=True)
+    expenses = Expense.objects.exclude(receipt_file='').exclude(receipt_file__isnull=True)
+    if user_id:
+        documents = documents.filter(user_id=user_id)
+        versions = versions.filter(document__user_id=user_id)
+        originals = originals.filter(document__user_id=user_id)
+        expenses = expenses.filter(user_id=user_id)
+
+    for row in documents.values('user_id').annotate(total=Sum('file_size'), count=Count('id')):
+        bytes_used[row['user_id']] += row['total'] or 0
+        document_count[row['user_id']] += row['count']
+
+    for row in versions.values('document__user_id').annotate(total=Sum('file_size')):
+        bytes_used[row['document__user_id']] += row['total'] or 0
+
+    # Files uploaded before sizes were recorded are measured from storage
+    unsized = documents.filter(file_size__isnull=True).exclude(file='').exclude(file__isnull=True)
+    for document in unsized.only('id', 'user_id', 'file').iterator():
+        bytes_used[document.user_id] += file_bytes(document.file)
+    unsized = versions.filter(file_size__isnull=True).select_related('document')
+    for version in unsized.only('id', 'file', 'document__user_id').iterator():
+        bytes_used[version.document.user_id] += file_bytes(version.file)
+
+    for row in originals.values('document__user_id').annotate(total=Sum('original_size')):
+        bytes_used[row['document__user_id']] += row['total'] or 0
+
+    # Receipt sizes are not stored, so read them from storage
+    for expense in expenses.only('id', 'user_id', 'receipt_file').iterator():
+        bytes_used[expense.user_id] += file_bytes(expense.receipt_file)
+
+    return bytes_used, document_count
+
+
+def _seed_usage(user_id):
+    """Create a user's counters from their stored files, or return the existing row"""
+    bytes_used, document_count = measure_usage(user_id)
+    try:
+        with transaction.atomic():
+            return StorageUsage.objects.create(
+                user_id=user_id,
+                bytes_used=bytes_used.get(user_id, 0),
+                document_count=document_count.get(user_id, 0)
+            )
+    except IntegrityError:
+        # Another request seeded the row first
+        return StorageUsage.objects.get(user_id=user_id)
+
+
+def adjust_usage(user_id, bytes_delta=0, documents_delta=0):
+    """Atomically add the deltas to a user's usage counters"""
+    if not bytes_delta and not documents_delta:
+        return
+    updated = StorageUsage.objects.filter(user_id=user_id).update(
+        bytes_used=F('bytes_used') + bytes_delta,
+        document_count=F('document_count') + documents_delta,
+        updated_at=timezone.now()
+    )
+    # Only start a counter on growth: releases for a user without a row
+    # happen while that user is being deleted. Callers adjust after the
+    # change is stored, so the seeded totals already include the delta.
+    if not updated and (bytes_delta > 0 or documents_delta > 0):
+        _seed_usage(user_id)
+
+
+def get_usage(user):
+    usage = StorageUsage.objects.filter(user=user).first()
+    if usage is None:
+        usage = _seed_usage(user.pk)
+    return usage
+
+
+def storage_limits(user):
+    """Return (max_bytes, max_documents) for a user, or None if unlimited"""
+    if getattr(user, 'role', None) == 'admin':
+        return None
+    subscription = getattr(user, 'subscription', None)
+    if subscription is None:
+        return None
+    return subscription.max_storage_gb * BYTES_PER_GB, subscription.max_documents
+
+
+def remaining_bytes(user):
+    limits = storage_limits(user)
+    if limits is None:
+        return None
+    return limits[0] - get_usage(user).bytes_used
+
+
+def check_upload(user, size, released=0):
+    """
+    Raise StorageQuotaExceeded if storing ``size`` bytes, after freeing
+    ``released`` bytes of replaced files, would exceed the user's quota.
+
+    HasStorageQuota only sees Content-Length, which chunked requests omit,
+    so serializers check each parsed file with this as well.
+    """
+    from utils.permissions import StorageQuotaExceeded
+
+    remaining = remaining_bytes(user)
+    if remaining is not None and size - released > remaining:
+        raise StorageQuotaExceeded()
+
+
+def remaining_documents(user):
+    limits = storage_limits(user)
+    if limits is None:
+        return None
+    return limits[1] - get_usage(user).document_count
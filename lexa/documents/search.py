@@ -0,0 +1,260 @@
+"""
+Full-text search over documents using an SQLite FTS5 index.
+
+The ``documents_search`` virtual table holds one row per document (rowid is
+the document id) with normalized titles, generated content and the text
+extracted from the uploaded file. Text is normalized in Python before it is
+indexed and before it is queried, so Arabic spelling variants and French
+accents match each other.
+"""
+import re
+import unicodedata
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+from rest_framework.filters import SearchFilter
+from rest_framework.settings import api_settings
+
+SEARCH_TABLE = 'documents_search'
+SEARCH_COLUMNS = ('title_fr', 'title_ar', 'content', 'file_text')
+# bm25 weights, in SEARCH_COLUMNS order: titles rank above body text
+SEARCH_WEIGHTS = (10.0, 10.0, 1.0, 1.0)
+INDEXED_FIELDS = {'title_fr', 'title_ar', 'content'}
+
+ARABIC_TATWEEL = 'ـ'
+ARABIC_LETTER_MAP = str.maketrans({
+    'ٱ': 'ا',  # alef wasla -> alef
+    'ى': 'ي',  # alef maksura -> ya
+    'ة': 'ه',  # ta marbuta -> ha
+    ARABIC_TATWEEL: None,
+})
+TOKEN_RE = re.compile(r'\w+')
+SNIPPET_TOKENS = 16
+ELLIPSIS = '…'
+
+
+def search_available():
+    return connection.vendor == 'sqlite'
+
+
+def normalize_text(text):
+    """
+    Fold text for indexing and querying.
+
+    Decomposes characters and drops combining marks, which removes French
+    accents, Arabic tashkeel and the hamza/madda carried by alef variants,
+    then unifies alef, ya and ta marbuta spellings.
+    """
+    if not text:
+        return ''
+    decomposed = unicodedata.normalize('NFKD', text)
+    stripped = ''.join(c for c in decomposed if not unicodedata.combining(c))
+    return stripped.translate(ARABIC_LETTER_MAP).casefold()
+
+
+def build_match_query(text):
+    """Turn free text into an FTS5 MATCH expression, or None if it has no terms"""
+    tokens = TOKEN_RE.findall(normalize_text(text))
+    if not tokens:
+        return None
+    # Every term is required; the last one also matches as a prefix
+    terms = [f'"{token}"' for token in tokens]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def search_terms(text):
+    """Normalized query tokens and the prefix the last one also matches, as build_match_query does"""
+    tokens = TOKEN_RE.findall(normalize_text(text))
+    return set(tokens), tokens[-1] if tokens else None
+
+
+def match_spans(text, terms, prefix):
+    """
+    ``(start, end)`` offsets in the original ``text`` of the words that match.
+
+    Words are found in the normalized text, built one character at a time so
+    every normalized character remembers the original character it came
+    from; the spans therefore cover the accented, cased original words.
+    """
+    chars, origins = [], []
+    for index, char in enumerate(text or ''):
+        for folded in normalize_text(char):
+            chars.append(folded)
+            origins.append(index)
+    spans = []
+    for word in TOKEN_RE.finditer(''.join(chars)):
+        if word.group() not in terms and not word.group().startswith(prefix):
+            continue
+        start, end = origins[word.start()], origins[word.end() - 1] + 1
+        if spans and start < spans[-1][1]:
+            continue
+        spans.append((start, end))
+    return spans
+
+
+def highlight(text, spans, start=0, end=None):
+    """``text[start:end]`` escaped, with the spans inside it wrapped in <mark>"""
+    end = len(text) if end is None else end
+    parts, position = [], start
+    for span_start, span_end in spans:
+        span_start, span_end = max(span_start, start), min(span_end, end)
+        if span_start >= span_end:
+            continue
+        parts.append(escape(text[position:span_start]))
+        parts.append(f'<mark>{escape(text[span_start:span_end])}</mark>')
+        position = span_end
+    parts.append(escape(text[position:end]))
+    return ''.join(parts)
+
+
+def snippet(text, spans):
+    """About SNIPPET_TOKENS words of ``text`` around its first match, highlighted"""
+    words = list(TOKEN_RE.finditer(text))
+    if len(words) <= SNIPPET_TOKENS:
+        return highlight(text, spans)
+    first = 0
+    if spans:
+        first = next((i for i, word in enumerate(words) if word.end() > spans[0][0]), 0)
+    # Keep a little context before the first match, like FTS5 snippet()
+    first_word = max(0, min(first - SNIPPET_TOKENS // 4, len(words) - SNIPPET_TOKENS))
+    last_word = first_word + SNIPPET_TOKENS - 1
+    start = words[first_word].start() if first_word else 0
+    end = words[last_word].end() if last_word < len(words) - 1 else len(text)
+    return ''.join([
+        ELLIPSIS if start else '',
+        highlight(text, spans, start, end),
+        ELLIPSIS if end < len(text) else '',
+    ])
+
+
+def create_search_table(cursor):
+    columns = ', '.join(SEARCH_COLUMNS)
+    cursor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} "
+        f"USING fts5({columns}, tokenize='unicode61 remove_diacritics 2')"
+    )
+    weights = ', '.join(str(weight) for weight in SEARCH_WEIGHTS)
+    cursor.execute(
+        f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rank) VALUES ('rank', 'bm25({weights})')"
+    )
+
+
+def index_document(document):
+    """Insert or refresh the index row of a document, keeping its file text"""
+    if not search_available():
+        return
+    values = [
+        normalize_text(document.title_fr),
+        normalize_text(document.title_ar),
+        normalize_text(document.content),
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {SEARCH_TABLE} SET title_fr = %s, title_ar = %s, content = %s WHERE rowid = %s",
+            values + [document.pk]
+        )
+        if cursor.rowcount == 0:
+            cursor.execute(
+                f"INSERT INTO {SEARCH_TABLE}(rowid, title_fr, title_ar, content, file_text) "
+                f"VALUES (%s, %s, %s, %s, '')",
+                [document.pk] + values
+            )
+
+
+def set_file_text(document_id, text):
+    """Store the text extracted from a document's file in its index row"""
+    if not search_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {SEARCH_TABLE} SET file_text = %s WHERE rowid = %s",
+            [normalize_text(text), document_id]
+        )
+
+
+def remove_document(document_id):
+    if not search_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [document_id])
+
+
+def search_documents(user, text, limit=20, offset=0):
+    """
+    Ranked search over a user's documents.
+
+    Returns dicts with the document id, titles, bm25 rank (lower is better),
+    the highlighted French title and a highlighted snippet of the first
+    matching column among content, file text and titles. The index only
+    holds normalized text, so highlights are placed on the stored original
+    text rather than taken from FTS5 highlight()/snippet().
+    """
+    match = build_match_query(text)
+    if match is None or not search_available():
+        return []
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT d.id, d.title_fr, d.title_ar, {SEARCH_TABLE}.rank, d.content, t.text
+            FROM {SEARCH_TABLE}
+            JOIN documents_document d ON d.id = {SEARCH_TABLE}.rowid
+            LEFT JOIN documents_documenttext t ON t.document_id = d.id
+            WHERE {SEARCH_TABLE} MATCH %s AND d.user_id = %s
+            ORDER BY {SEARCH_TABLE}.rank
+            LIMIT %s OFFSET %s
+            """,
+            [match, user.pk, limit, offset]
+        )
+        rows = cursor.fetchall()
+
+    terms, prefix = search_terms(text)
+    results = []
+    for document_id, title_fr, title_ar, rank, content, file_text in rows:
+        columns = [
+            (column, match_spans(column, terms, prefix))
+            for column in (content, file_text, title_ar, title_fr) if column
+        ]
+        best = next((column for column in columns if column[1]), columns[0] if columns else ('', []))
+        results.append({
+            'id': document_id,
+            'title_fr': title_fr,
+            'title_ar': title_ar,
+            'rank': rank,
+            'title_highlight': highlight(title_fr or '', match_spans(title_fr, terms, prefix)),
+            'snippet': snippet(*best),
+        })
+    return results
+
+
+class DocumentSearchFilter(SearchFilter):
+    """
+    SearchFilter backed by the FTS index.
+
+    Matches are ranked by bm25 unless the request asks for another ordering.
+    Falls back to the regular icontains search on other databases.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        if not search_available():
+            return super().filter_queryset(request, queryset, view)
+
+        text = request.query_params.get(self.search_param, '')
+        match = build_match_query(text)
+        if match is None:
+            return queryset
+
+        table = queryset.model._meta.db_table
+        queryset = queryset.filter(
+            id__in=RawSQL(f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s", (match,))
+        )
+        if request.query_params.get(api_settings.ORDERING_PARAM):
+            return queryset
+        return queryset.annotate(
+            search_rank=RawSQL(
+                f"SELECT rank FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s AND rowid = {table}.id",
+                (match,)
+            )
+        ).order_by('search_rank')
@@ -1,5 +1,10 @@
 from rest_framework import serializers
-from .models import Document, DocumentTemplate, DocumentVersion, DocumentShare
+from django.urls import reverse
+from .models import Document, DocumentTemplate, DocumentVersion, DocumentShare, DocumentOptimization
+from .previews import can_preview, preview_digest
+from .templating import render_content, template_content
+from .encryption import EncryptedFile, encryption_problem
+from .quota import check_upload, file_bytes
 
 
 class DocumentTemplateSerializer(serializers.ModelSerializer):
@@ -15,11 +20,12 @@ class DocumentTemplateSerializer(serializers.ModelSerializer):
 
 class DocumentVersionSerializer(serializers.ModelSerializer):
     created_by_name = serializers.CharField(source='created_by.get_full_name', read_only=True)
+    content = serializers.CharField(required=False, allow_blank=True)
     
     class Meta:
         model = DocumentVersion
-        fields = '__all__'
-        read_only_fields = ['created_by', 'created_at']
+        exclude = ['stored_content']
+        read_only_fields = ['created_by', 'created_at', 'is_keyframe']
 
     def create(self, validated_data):
         validated_data['created_by'] = self.context['request'].user
@@ -43,11 +49,28 @@ class DocumentShareSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
+class DocumentOptimizationSerializer(serializers.ModelSerializer):
+    saved_bytes = serializers.IntegerField(read_only=True)
+    has_original = serializers.SerializerMethodField()
+
+    class Meta:
+        model = DocumentOptimization
+        fields = [
+            'status', 'output_format', 'page_count', 'original_size', 'optimized_size',
+            'saved_bytes', 'has_original', 'updated_at',
+        ]
+        read_only_fields = fields
+
+    def get_has_original(self, obj):
+        return bool(obj.original_file)
+
+
 class DocumentSerializer(serializers.ModelSerializer):
     # Note: Removed case_title and case_reference as Case relationship doesn't exist in Document model
     template_name = serializers.CharField(source='template.name', read_only=True)
     versions = DocumentVersionSerializer(many=True, read_only=True)
     shares = DocumentShareSerializer(many=True, read_only=True)
+    optimization = DocumentOptimizationSerializer(read_only=True)
     file_name = serializers.CharField(read_only=True)
     file_extension = serializers.CharField(read_only=True)
     
@@ -56,6 +79,21 @@ class DocumentSerializer(serializers.ModelSerializer):
         fields = '__all__'
         read_only_fields = ['user', 'file_size', 'file_type', 'created_at', 'updated_at']
 
+    def validate(self, attrs):
+        confidential = attrs.get('is_confidential', self.instance.is_confidential if self.instance else False)
+        # Refuse up front what could only be stored encrypted
+        if confidential and ('is_confidential' in attrs or attrs.get('file')):
+            problem = encryption_problem()
+            if problem:
+                raise serializers.ValidationError({'is_confidential': problem})
+        return attrs
+
+    def validate_file(self, value):
+        if value:
+            released = file_bytes(self.instance.file, self.instance.file_size) if self.instance else 0
+            check_upload(self.context['request'].user, value.size, released)
+        return value
+
     def create(self, validated_data):
         validated_data['user'] = self.context['request'].user
         
@@ -64,6 +102,8 @@ class DocumentSerializer(serializers.ModelSerializer):
             file_obj = validated_data['file']
             validated_data['file_size'] = file_obj.size
             validated_data['file_type'] = file_obj.content_type
+            if validated_data.get('is_confidential'):
+                validated_data['file'] = EncryptedFile(file_obj)
             
         return super().create(validated_data)
 
@@ -73,10 +113,44 @@ class DocumentSerializer(serializers.ModelSerializer):
             file_obj = validated_data['file']
             validated_data['file_size'] = file_obj.size
             validated_data['file_type'] = file_obj.content_type
+            if validated_data.get('is_confidential', instance.is_confidential):
+                validated_data['file'] = EncryptedFile(file_obj)
             
         return super().update(instance, validated_data)
 
 
+class DocumentSummarySerializer(serializers.ModelSerializer):
+    """Lightweight list representation: no content, versions or shares"""
+    template_name = serializers.CharField(source='template.name', read_only=True)
+    file_name = serializers.CharField(read_only=True)
+    file_extension = serializers.CharField(read_only=True)
+    version_count = serializers.IntegerField(read_only=True)
+    share_count = serializers.IntegerField(read_only=True)
+    preview_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Document
+        fields = [
+            'id', 'title_fr', 'title_ar', 'document_type', 'template_type', 'language',
+            'file', 'file_name', 'file_extension', 'file_size', 'file_type',
+            'template', 'template_name', 'version', 'is_final', 'is_confidential',
+            'is_shared_with_client', 'date_signed', 'version_count', 'share_count',
+            'preview_url', 'created_at', 'updated_at',
+        ]
+        read_only_fields = fields
+
+    def get_preview_url(self, obj):
+        if not can_preview(obj):
+            return None
+        url = reverse('document_preview', args=[obj.pk])
+        return f'{url}?size=medium&v={preview_digest(obj)}'
+
+
+class DocumentTemplatePreviewSerializer(serializers.Serializer):
+    variables = serializers.DictField(child=serializers.CharField(allow_blank=True), required=False, default=dict)
+    language = serializers.ChoiceField(choices=Document.LANGUAGE_CHOICES, default='fr')
+
+
 class DocumentCreateFromTemplateSerializer(serializers.Serializer):
     template_id = serializers.IntegerField()
     case_id = serializers.IntegerField(required=False)  # Made optional since case relationship might not exist
@@ -118,16 +192,11 @@ class DocumentCreateFromTemplateSerializer(serializers.Serializer):
         template = DocumentTemplate.objects.get(id=template_id)
         user = self.context['request'].user
         
-        # Choose content based on language
-        if validated_data['language'] == 'ar' and template.content_ar:
-            content = template.content_ar
-        else:
-            content = template.content_fr
-            
-        # Replace variables in content
-        variables = validated_data.get('variables', {})
-        for var_name, var_value in variables.items():
-            content = content.replace(f'{{{var_name}}}', str(var_value))
+        # Choose content based on language and replace variables
+        content = render_content(
+            template_content(template, validated_data['language']),
+            validated_data.get('variables', {})
+        )
         
         # Create document
         document_data = {
@@ -149,4 +218,41 @@ class DocumentCreateFromTemplateSerializer(serializers.Serializer):
             pass
             
         document = Document.objects.create(**document_data)
-        return document
\ No newline at end of file
+        return document
+
+class DocumentBulkSerializer(serializers.Serializer):
+    MAX_DOCUMENTS = 500
+
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=MAX_DOCUMENTS
+    )
+
+    def validate_ids(self, value):
+        return list(dict.fromkeys(value))
+
+
+class DocumentBulkUpdateSerializer(DocumentBulkSerializer):
+    UPDATABLE_FIELDS = ('is_final', 'is_confidential', 'language')
+
+    is_final = serializers.BooleanField(required=False)
+    is_confidential = serializers.BooleanField(required=False)
+    language = serializers.ChoiceField(choices=Document.LANGUAGE_CHOICES, required=False)
+
+    def validate(self, attrs):
+        if not any(field in attrs for field in self.UPDATABLE_FIELDS):
+            raise serializers.ValidationError(
+                f"Provide at least one of: {', '.join(self.UPDATABLE_FIELDS)}."
+            )
+        if attrs.get('is_confidential'):
+            problem = encryption_problem()
+            if problem:
+                raise serializers.ValidationError({'is_confidential': problem})
+        return attrs
+
+
+class DocumentBulkShareSerializer(DocumentBulkSerializer):
+    email = serializers.EmailField()
+    access_level = serializers.ChoiceField(choices=DocumentShare.ACCESS_LEVELS, default='view')
+    expires_at = serializers.DateTimeField(required=False, allow_null=True)
@@ -0,0 +1,40 @@
+"""
+Cached resolution of share link tokens.
+
+The cache only maps a token to its share id, which never changes, for
+DOCUMENT_SHARE_CACHE_TIMEOUT seconds; tokens that match no share are cached
+as misses so that repeated hits on a dead link stay off the database.
+Whether the share is still active, its access level and its expiry are
+read by primary key on every hit, so a revoke takes effect in every worker
+at once even though each process keeps its own cache.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import DocumentShare
+
+MISSING = 'missing'
+SHARE_FIELDS = ('id', 'document_id', 'access_level', 'expires_at')
+
+
+def share_cache_key(access_token):
+    return f'documents:share:{access_token}'
+
+
+def resolve_share(access_token):
+    """Return the active share for a token as a dict, or None"""
+    key = share_cache_key(access_token)
+    share_id = cache.get(key)
+    if share_id is None:
+        share = DocumentShare.objects.filter(access_token=access_token).values('is_active', *SHARE_FIELDS).first()
+        cache.set(key, share['id'] if share else MISSING, getattr(settings, 'DOCUMENT_SHARE_CACHE_TIMEOUT', 60))
+        if share is None or not share.pop('is_active'):
+            return None
+        return share
+    if share_id == MISSING:
+        return None
+    return DocumentShare.objects.filter(pk=share_id, is_active=True).values(*SHARE_FIELDS).first()
+
+
+def invalidate_share(access_token):
+    cache.delete(share_cache_key(access_token))
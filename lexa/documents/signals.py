@@ -0,0 +1,156 @@
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from .models import (
+    Document, DocumentVersion, DocumentShare, DocumentTemplate, DocumentOptimization, StorageUsage
+)
+from . import search
+from .analytics import invalidate_analytics, invalidate_analytics_for_email
+from .quota import adjust_usage, file_bytes
+from .extraction import schedule_extraction
+from .previews import schedule_previews, delete_previews
+from .optimization import schedule_optimization
+from .encryption import sync_document_encryption
+from utils.background import run_in_background
+
+
+def file_changed(created, instance, update_fields):
+    if update_fields is not None and 'file' not in update_fields:
+        return False
+    return bool(instance.file) or not created
+
+
+@receiver(post_save, sender=Document)
+def index_document(sender, instance, update_fields=None, **kwargs):
+    """Keep the full-text index in sync with document writes"""
+    if update_fields is not None and not search.INDEXED_FIELDS.intersection(update_fields):
+        return
+    search.index_document(instance)
+
+
+@receiver(post_save, sender=Document)
+def extract_document_text(sender, instance, created, update_fields=None, **kwargs):
+    """Queue text extraction when a file is uploaded or replaced"""
+    if file_changed(created, instance, update_fields):
+        schedule_extraction(instance)
+
+
+@receiver(post_save, sender=Document)
+def render_document_previews(sender, instance, created, update_fields=None, **kwargs):
+    """Queue thumbnail rendering when a file is uploaded or replaced"""
+    if not file_changed(created, instance, update_fields):
+        return
+    if instance.file:
+        schedule_previews(instance)
+    else:
+        delete_previews(instance.pk)
+
+
+@receiver(post_delete, sender=Document)
+def cleanup_deleted_document(sender, instance, **kwargs):
+    search.remove_document(instance.pk)
+    delete_previews(instance.pk)
+
+
+@receiver(pre_save, sender=Document)
+def remember_previous_file(sender, instance, update_fields=None, **kwargs):
+    instance._previous_file = None
+    if instance.pk and (update_fields is None or 'file' in update_fields):
+        instance._previous_file = Document.objects.filter(pk=instance.pk).values_list(
+            'file', 'file_size'
+        ).first()
+
+
+@receiver(post_save, sender=Document)
+def account_document_storage(sender, instance, created, **kwargs):
+    """Keep the owner's storage usage in step with uploads and replacements"""
+    if created:
+        adjust_usage(instance.user_id, file_bytes(instance.file, instance.file_size), 1)
+        return
+
+    previous = getattr(instance, '_previous_file', None)
+    if previous is None or (previous[0] or '') == (instance.file.name or ''):
+        return
+    previous_size = (previous[1] or 0) if previous[0] else 0
+    adjust_usage(instance.user_id, file_bytes(instance.file, instance.file_size) - previous_size)
+
+
+@receiver(post_delete, sender=Document)
+def release_document_storage(sender, instance, **kwargs):
+    adjust_usage(instance.user_id, -file_bytes(instance.file, instance.file_size), -1)
+
+
+@receiver(post_save, sender=DocumentVersion)
+def account_version_storage(sender, instance, created, **kwargs):
+    if created and instance.file:
+        adjust_usage(instance.document.user_id, file_bytes(instance.file, instance.file_size))
+
+
+@receiver(post_delete, sender=DocumentVersion)
+def release_version_storage(sender, instance, **kwargs):
+    if instance.file:
+        owner_id = Document.objects.filter(pk=instance.document_id).values_list('user_id', flat=True).first()
+        if owner_id:
+            adjust_usage(owner_id, -file_bytes(instance.file, instance.file_size))
+
+
+# Registered after the storage receivers: the job may start as soon as the
+# upload commits and must find the upload already accounted for
+@receiver(post_save, sender=Document)
+def optimize_uploaded_image(sender, instance, created, update_fields=None, **kwargs):
+    """Queue re-encoding when an image is uploaded or replaced"""
+    if instance.file and file_changed(created, instance, update_fields):
+        schedule_optimization(instance)
+
+
+@receiver(post_delete, sender=DocumentOptimization)
+def release_original_storage(sender, instance, **kwargs):
+    """Kept originals go with their document"""
+    if instance.original_file:
+        instance.original_file.delete(save=False)
+        owner_id = Document.objects.filter(pk=instance.document_id).values_list('user_id', flat=True).first()
+        if owner_id:
+            adjust_usage(owner_id, -(instance.original_size or 0))
+
+
+@receiver(post_save, sender=Document)
+@receiver(post_delete, sender=Document)
+@receiver(post_save, sender=DocumentTemplate)
+@receiver(post_delete, sender=DocumentTemplate)
+@receiver(post_save, sender=StorageUsage)
+def invalidate_owner_analytics(sender, instance, **kwargs):
+    invalidate_analytics(instance.user_id)
+
+
+@receiver(post_save, sender=DocumentVersion)
+@receiver(post_delete, sender=DocumentVersion)
+def invalidate_version_analytics(sender, instance, **kwargs):
+    invalidate_analytics(
+        Document.objects.filter(pk=instance.document_id).values_list('user_id', flat=True).first()
+    )
+
+
+@receiver(post_save, sender=DocumentShare)
+@receiver(post_delete, sender=DocumentShare)
+def invalidate_share_analytics(sender, instance, **kwargs):
+    """Shares count for both the owner and the recipient"""
+    invalidate_analytics(
+        Document.objects.filter(pk=instance.document_id).values_list('user_id', flat=True).first()
+    )
+    invalidate_analytics_for_email(instance.shared_with_email)
+
+
+@receiver(post_save, sender=DocumentShare)
+@receiver(post_delete, sender=DocumentShare)
+def touch_shared_document(sender, instance, **kwargs):
+    """Shares are part of the document's representation, so they move its ETag"""
+    Document.objects.filter(pk=instance.document_id).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Document)
+def sync_confidential_files(sender, instance, update_fields=None, **kwargs):
+    """Encrypt files when a document becomes confidential, decrypt them when it stops"""
+    if update_fields is not None and not {'file', 'is_confidential'}.intersection(update_fields):
+        return
+    if instance.file or instance.is_confidential:
+        run_in_background(sync_document_encryption, instance.pk)
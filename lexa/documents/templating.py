@@ -0,0 +1,91 @@
+"""
+Rendering of DocumentTemplate content.
+
+Placeholders are written ``{variable_name}``. Previews are kept in a bounded,
+per-process LRU cache keyed by template id, ``updated_at``, language and the
+variable values, so editing a template naturally retires its old entries.
+"""
+import re
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+PLACEHOLDER_RE = re.compile(r'\{([^{}]+)\}')
+
+
+def template_content(template, language):
+    if language == 'ar' and template.content_ar:
+        return template.content_ar
+    return template.content_fr
+
+
+def render_content(content, variables):
+    """Replace every ``{name}`` present in ``variables``; others are left as is"""
+    variables = {str(name): value for name, value in variables.items()}
+
+    def replace(match):
+        name = match.group(1)
+        return str(variables[name]) if name in variables else match.group(0)
+    return PLACEHOLDER_RE.sub(replace, content)
+
+
+def sample_variables(template):
+    """Visible stand-ins for the template's declared variables"""
+    return {name: f'[{name}]' for name in template.variables or [] if isinstance(name, str)}
+
+
+class RenderCache:
+    """Thread-safe LRU mapping of render keys to rendered content"""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._items:
+                return None
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+preview_cache = RenderCache(getattr(settings, 'DOCUMENT_TEMPLATE_PREVIEW_CACHE_SIZE', 256))
+
+
+def preview_template(template, variables=None, language='fr'):
+    """
+    Render ``template`` without saving anything.
+
+    Declared variables missing from ``variables`` are filled with samples.
+    Returns ``(content, missing, cached)``.
+    """
+    variables = {name: str(value) for name, value in (variables or {}).items()}
+    missing = sorted(set(sample_variables(template)) - set(variables))
+    values = {**sample_variables(template), **variables}
+
+    key = (
+        template.pk,
+        template.updated_at.isoformat(),
+        language,
+        tuple(sorted(values.items())),
+    )
+    content = preview_cache.get(key)
+    if content is not None:
+        return content, missing, True
+
+    content = render_content(template_content(template, language), values)
+    preview_cache.set(key, content)
+    return content, missing, False
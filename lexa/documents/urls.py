@@ -5,15 +5,23 @@ urlpatterns = [
     # Document Templates
     path('templates/', views.DocumentTemplateListCreateView.as_view(), name='document_template_list_create'),
     path('templates/<int:pk>/', views.DocumentTemplateDetailView.as_view(), name='document_template_detail'),
+    path('templates/<int:pk>/preview/', views.preview_document_template, name='preview_document_template'),
     
     # Documents
     path('', views.DocumentListCreateView.as_view(), name='document_list_create'),
     path('<int:pk>/', views.DocumentDetailView.as_view(), name='document_detail'),
     path('create-from-template/', views.create_document_from_template, name='create_document_from_template'),
     path('<int:document_id>/versions/', views.create_document_version, name='create_document_version'),
+    path('<int:document_id>/versions/<int:version_number>/', views.document_version_detail, name='document_version_detail'),
     path('<int:document_id>/share/', views.share_document, name='share_document'),
     path('<int:document_id>/download/', views.download_document, name='download_document'),
+    path('<int:document_id>/preview/', views.document_preview, name='document_preview'),
     path('analytics/', views.document_analytics, name='document_analytics'),
+    path('search/', views.search_user_documents, name='search_user_documents'),
+    path('export/', views.export_documents, name='export_documents'),
+    path('bulk/update/', views.bulk_update_documents, name='bulk_update_documents'),
+    path('bulk/delete/', views.bulk_delete_documents, name='bulk_delete_documents'),
+    path('bulk/share/', views.bulk_share_documents, name='bulk_share_documents'),
     
     # Public access
     path('shared/<str:access_token>/', views.download_shared_document, name='download_shared_document'),
@@ -0,0 +1,79 @@
+"""
+Delta encoding for DocumentVersion content.
+
+Each version is stored either as a full keyframe or as a line-based delta
+against the previous version. A delta is a JSON list whose items are either
+``[start, end]`` (copy lines ``start:end`` of the previous version) or a
+string (insert this text).
+"""
+import difflib
+import json
+
+from django.conf import settings
+
+DEFAULT_KEYFRAME_INTERVAL = 10
+
+
+def keyframe_interval():
+    return max(1, getattr(settings, 'DOCUMENT_VERSION_KEYFRAME_INTERVAL', DEFAULT_KEYFRAME_INTERVAL))
+
+
+def make_delta(old, new):
+    """Return the delta turning ``old`` into ``new``"""
+    old_lines = old.splitlines(keepends=True)
+    new_lines = new.splitlines(keepends=True)
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+
+    ops = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            ops.append([i1, i2])
+        elif tag in ('replace', 'insert'):
+            ops.append(''.join(new_lines[j1:j2]))
+    return json.dumps(ops, ensure_ascii=False, separators=(',', ':'))
+
+
+def apply_delta(old, delta):
+    """Rebuild the new content from ``old`` and a delta made by ``make_delta``"""
+    old_lines = old.splitlines(keepends=True)
+    parts = []
+    for op in json.loads(delta):
+        if isinstance(op, str):
+            parts.append(op)
+        else:
+            parts.extend(old_lines[op[0]:op[1]])
+    return ''.join(parts)
+
+
+def encode_version(previous_content, content, version_number, interval=None):
+    """
+    Decide how a version is stored.
+
+    Returns ``(stored_content, is_keyframe)``. A keyframe is written for the
+    first version of a chain, every ``interval`` versions, and whenever the
+    delta would not be smaller than the full text.
+    """
+    interval = interval or keyframe_interval()
+    if previous_content is None or (version_number - 1) % interval == 0:
+        return content, True
+
+    delta = make_delta(previous_content, content)
+    if len(delta) >= len(content):
+        return content, True
+    return delta, False
+
+
+def rebuild_chain(chain):
+    """
+    Rebuild the content of the last entry of ``chain``.
+
+    ``chain`` is an ordered iterable of ``(is_keyframe, stored_content)``
+    starting at a keyframe.
+    """
+    content = None
+    for is_keyframe, stored_content in chain:
+        if is_keyframe:
+            content = stored_content
+        else:
+            content = apply_delta(content or '', stored_content)
+    return content or ''
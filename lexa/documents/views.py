@@ -4,22 +4,40 @@ from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
-from django.http import HttpResponse, Http404
+from django.http import Http404, FileResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
+from django.utils.text import slugify
 from django.template import Template, Context
+import os
 import uuid
-from django.db import models
-from django.db.models import Q, Count
+from django.db import transaction
+from django.db.models import Count, Max, Prefetch, Q, Sum
 import mimetypes
 
-from .models import Document, DocumentTemplate, DocumentVersion, DocumentShare
+from .models import Document, DocumentTemplate, DocumentVersion, DocumentShare, DocumentOptimization
 from .serializers import (
-    DocumentSerializer, DocumentTemplateSerializer, DocumentVersionSerializer,
-    DocumentShareSerializer, DocumentCreateFromTemplateSerializer
+    DocumentSerializer, DocumentSummarySerializer, DocumentTemplateSerializer,
+    DocumentVersionSerializer, DocumentShareSerializer, DocumentCreateFromTemplateSerializer,
+    DocumentTemplatePreviewSerializer, DocumentBulkSerializer, DocumentBulkUpdateSerializer,
+    DocumentBulkShareSerializer
 )
-# Import Case model if it exists, otherwise comment out
-# from cases.models import Case
+from .search import DocumentSearchFilter, search_documents
+from .sharing import resolve_share, invalidate_share
+from utils.access_counters import record_access
+from utils.background import run_in_background
+from utils.http_cache import add_validators, file_response, make_etag, not_modified
+from utils.permissions import HasStorageQuota, HasDocumentQuota
+from .analytics import document_analytics_for, invalidate_analytics, invalidate_analytics_for_email
+from .templating import preview_template
+from .previews import (
+    PREVIEW_FAILED, can_preview, delete_previews, preview_digest, preview_path, preview_sizes,
+    preview_state, schedule_previews
+)
+from .export import stream_documents_zip
+from .encryption import EncryptedFile, encryption_problem, open_plaintext, sync_document_encryption
+from .quota import check_upload, file_bytes
+from cases.models import Case
 
 
 class DocumentTemplateListCreateView(generics.ListCreateAPIView):
@@ -59,21 +77,37 @@ class DocumentTemplateDetailView(generics.RetrieveUpdateDestroyAPIView):
         
         return obj
 
+    def retrieve(self, request, *args, **kwargs):
+        updated_at = self.get_queryset().filter(pk=kwargs['pk']).values_list('updated_at', flat=True).first()
+        if updated_at is None:
+            raise Http404("Template not found or access denied")
+        etag = make_etag('template', kwargs['pk'], updated_at.isoformat(), weak=True)
+        response = not_modified(request, etag, updated_at)
+        if response is None:
+            response = add_validators(super().retrieve(request, *args, **kwargs), etag, updated_at)
+        return response
+
 
 class DocumentListCreateView(generics.ListCreateAPIView):
     serializer_class = DocumentSerializer
-    permission_classes = [permissions.IsAuthenticated]
+    permission_classes = [permissions.IsAuthenticated, HasStorageQuota, HasDocumentQuota]
     parser_classes = [MultiPartParser, FormParser]
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    filter_backends = [DjangoFilterBackend, DocumentSearchFilter, OrderingFilter]
     # Removed 'case' from filterset_fields since Document model doesn't have case relationship
     filterset_fields = ['document_type', 'template_type', 'language', 'is_final']
     search_fields = ['title_fr', 'title_ar', 'content']
     ordering_fields = ['created_at', 'updated_at', 'title_fr']
 
+    def get_serializer_class(self):
+        # Version history and content are only served by the detail endpoint
+        if self.request.method == 'GET':
+            return DocumentSummarySerializer
+        return DocumentSerializer
+
     def get_queryset(self):
         return Document.objects.filter(user=self.request.user).select_related(
             'template'
-        ).prefetch_related('versions', 'shares')
+        ).defer('content').with_counts()
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -94,15 +128,69 @@ class DocumentListCreateView(generics.ListCreateAPIView):
 
 class DocumentDetailView(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = DocumentSerializer
-    permission_classes = [permissions.IsAuthenticated]
+    permission_classes = [permissions.IsAuthenticated, HasStorageQuota]
     parser_classes = [MultiPartParser, FormParser]
 
     def get_queryset(self):
-        return Document.objects.filter(user=self.request.user)
+        return Document.objects.filter(user=self.request.user).select_related(
+            'template', 'optimization'
+        ).prefetch_related('versions__created_by', 'shares__shared_by')
+
+    def retrieve(self, request, *args, **kwargs):
+        # Validators come from the bare row so a 304 skips the prefetches.
+        # Share counters and optimization results are saved without touching
+        # the document, so their state is part of the tag as well.
+        row = Document.objects.filter(user=request.user, pk=kwargs['pk']).values(
+            'updated_at', 'version', 'optimization__updated_at'
+        ).annotate(
+            share_count=Count('shares'),
+            active_shares=Count('shares', filter=Q(shares__is_active=True)),
+            share_hits=Sum('shares__accessed_count'),
+            share_last_accessed=Max('shares__last_accessed'),
+        ).order_by('pk').first()
+        if row is None:
+            raise Http404
+        etag = make_etag(
+            'document', kwargs['pk'], row['updated_at'].isoformat(), row['version'],
+            row['optimization__updated_at'], row['share_count'], row['active_shares'],
+            row['share_hits'], row['share_last_accessed'], weak=True
+        )
+        last_modified = max(filter(None, (
+            row['updated_at'], row['optimization__updated_at'], row['share_last_accessed']
+        )))
+        response = not_modified(request, etag, last_modified)
+        if response is None:
+            response = add_validators(super().retrieve(request, *args, **kwargs), etag, last_modified)
+        return response
 
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
+def preview_document_template(request, pk):
+    """Render a template with the given (or sample) variables without creating anything"""
+    template = get_object_or_404(
+        DocumentTemplate.objects.filter(Q(user=request.user) | Q(is_public=True)),
+        pk=pk
+    )
+    serializer = DocumentTemplatePreviewSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+
+    content, missing, cached = preview_template(
+        template,
+        serializer.validated_data['variables'],
+        serializer.validated_data['language']
+    )
+    return Response({
+        'template_id': template.id,
+        'language': serializer.validated_data['language'],
+        'content': content,
+        'missing_variables': missing,
+        'cached': cached,
+    })
+
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated, HasDocumentQuota])
 def create_document_from_template(request):
     """Create a new document from a template"""
     serializer = DocumentCreateFromTemplateSerializer(
@@ -136,11 +224,27 @@ def create_document_from_template(request):
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-@api_view(['POST'])
-@permission_classes([permissions.IsAuthenticated])
+def _document_version_list(request, document):
+    etag = make_etag('versions', document.pk, document.updated_at.isoformat(), document.version, weak=True)
+    response = not_modified(request, etag, document.updated_at)
+    if response is not None:
+        return response
+
+    serializer = DocumentVersionSerializer(
+        document.versions.select_related('created_by'),
+        many=True,
+        context={'request': request}
+    )
+    return add_validators(Response(serializer.data), etag, document.updated_at)
+
+
+@api_view(['GET', 'POST'])
+@permission_classes([permissions.IsAuthenticated, HasStorageQuota])
 def create_document_version(request, document_id):
-    """Create a new version of an existing document"""
-    document = get_object_or_404(Document, id=document_id, user=request.user)
+    """List the versions of a document (GET) or create a new one (POST)"""
+    document = get_object_or_404(Document.objects.defer('content'), id=document_id, user=request.user)
+    if request.method == 'GET':
+        return _document_version_list(request, document)
     
     # Validate required fields
     content = request.data.get('content')
@@ -156,13 +260,24 @@ def create_document_version(request, document_id):
     
     # Handle file upload if provided
     file_data = request.data.get('file')
+    if file_data and document.is_confidential and encryption_problem():
+        return Response(
+            {'error': encryption_problem()},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if file_data:
+        # The file is counted for the version and again for the document
+        check_upload(request.user, 2 * file_data.size, file_bytes(document.file, document.file_size))
+    stored_file = file_data
+    if file_data and document.is_confidential:
+        stored_file = EncryptedFile(file_data)
     
     # Create new version
     version = DocumentVersion.objects.create(
         document=document,
         version_number=new_version_number,
         content=content,
-        file=file_data,
+        file=stored_file,
         change_notes=request.data.get('change_notes', ''),
         created_by=request.user
     )
@@ -171,8 +286,10 @@ def create_document_version(request, document_id):
     document.version = new_version_number
     document.content = content
     if file_data:
-        document.file = file_data
-    document.save(update_fields=['version', 'content', 'file', 'updated_at'])
+        document.file = stored_file
+        document.file_size = file_data.size
+        document.file_type = getattr(file_data, 'content_type', '') or document.file_type
+    document.save(update_fields=['version', 'content', 'file', 'file_size', 'file_type', 'updated_at'])
     
     serializer = DocumentVersionSerializer(version, context={'request': request})
     return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -242,28 +359,136 @@ def share_document(request, document_id):
     return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
+def _owned_document_ids(request, ids):
+    return set(Document.objects.filter(user=request.user, id__in=ids).values_list('id', flat=True))
+
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def bulk_update_documents(request):
+    """Set is_final, is_confidential and/or language on many documents at once"""
+    serializer = DocumentBulkUpdateSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    ids = serializer.validated_data['ids']
+    changes = {
+        field: serializer.validated_data[field]
+        for field in DocumentBulkUpdateSerializer.UPDATABLE_FIELDS
+        if field in serializer.validated_data
+    }
+
+    owned = _owned_document_ids(request, ids)
+    if owned:
+        flipped = []
+        if 'is_confidential' in changes:
+            flipped = list(Document.objects.filter(id__in=owned).exclude(
+                is_confidential=changes['is_confidential']
+            ).values_list('id', flat=True))
+        Document.objects.filter(id__in=owned).update(**changes, updated_at=timezone.now())
+        invalidate_analytics(request.user.id)
+        # The UPDATE skips post_save, which is what normally re-encrypts files
+        for document_id in flipped:
+            delete_previews(document_id)
+            run_in_background(sync_document_encryption, document_id)
+
+    return Response({
+        'updated': len(owned),
+        'results': {document_id: 'updated' if document_id in owned else 'not_found' for document_id in ids},
+    })
+
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def bulk_delete_documents(request):
+    """Delete many documents at once"""
+    serializer = DocumentBulkSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    ids = serializer.validated_data['ids']
+
+    owned = _owned_document_ids(request, ids)
+    if owned:
+        # Batched DELETEs; the per-row signals still release storage,
+        # search rows and previews
+        with transaction.atomic():
+            Document.objects.filter(id__in=owned).delete()
+
+    return Response({
+        'deleted': len(owned),
+        'results': {document_id: 'deleted' if document_id in owned else 'not_found' for document_id in ids},
+    })
+
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def bulk_share_documents(request):
+    """Share many documents with one recipient"""
+    serializer = DocumentBulkShareSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    ids = serializer.validated_data['ids']
+    email = serializer.validated_data['email']
+
+    owned = _owned_document_ids(request, ids)
+    already_shared = set(DocumentShare.objects.filter(
+        document_id__in=owned,
+        shared_with_email=email,
+        is_active=True
+    ).values_list('document_id', flat=True))
+
+    shares = [
+        DocumentShare(
+            document_id=document_id,
+            shared_with_email=email,
+            access_level=serializer.validated_data['access_level'],
+            access_token=str(uuid.uuid4()),
+            expires_at=serializer.validated_data.get('expires_at'),
+            shared_by=request.user
+        )
+        for document_id in ids
+        if document_id in owned and document_id not in already_shared
+    ]
+    if shares:
+        # bulk_create skips the share signals, so do their work once for the batch
+        with transaction.atomic():
+            DocumentShare.objects.bulk_create(shares)
+            Document.objects.filter(id__in=[share.document_id for share in shares]).update(
+                updated_at=timezone.now()
+            )
+        invalidate_analytics(request.user.id)
+        invalidate_analytics_for_email(email)
+
+    results = {}
+    for document_id in ids:
+        if document_id not in owned:
+            results[document_id] = 'not_found'
+        elif document_id in already_shared:
+            results[document_id] = 'already_shared'
+        else:
+            results[document_id] = 'shared'
+
+    return Response({
+        'shared': len(shares),
+        'results': results,
+        'access_tokens': {share.document_id: share.access_token for share in shares},
+    }, status=status.HTTP_201_CREATED if shares else status.HTTP_200_OK)
+
+
 @api_view(['GET'])
 @permission_classes([permissions.AllowAny])
 def download_shared_document(request, access_token):
     """Download a shared document using access token"""
-    share = get_object_or_404(
-        DocumentShare,
-        access_token=access_token,
-        is_active=True
-    )
+    share = resolve_share(access_token)
+    if share is None:
+        raise Http404("Share link not found")
     
     # Check if expired
-    if share.expires_at and share.expires_at < timezone.now():
+    if share['expires_at'] and share['expires_at'] < timezone.now():
         raise Http404("Share link has expired")
     
-    # Update access tracking
-    share.accessed_count += 1
-    share.last_accessed = timezone.now()
-    share.save(update_fields=['accessed_count', 'last_accessed'])
+    # Update access tracking (buffered, flushed in batches)
+    record_access(DocumentShare, share['id'], 'accessed_count')
     
-    document = share.document
+    document = get_object_or_404(Document, id=share['document_id'])
     
-    if share.access_level == 'view':
+    if share['access_level'] == 'view':
         # Return document content as JSON for viewing
         response_data = {
             'title': document.title_fr,
@@ -280,15 +505,11 @@ def download_shared_document(request, access_token):
         
         return Response(response_data)
     
-    elif share.access_level in ['download', 'edit'] and document.file:
+    elif share['access_level'] in ['download', 'edit'] and document.file:
         # Return file for download
         try:
-            response = HttpResponse(
-                document.file.read(),
-                content_type=document.file_type or 'application/octet-stream'
-            )
-            response['Content-Disposition'] = f'attachment; filename="{document.file_name}"'
-            return response
+            fileobj, size = open_plaintext(document.file)
+            return file_response(request, fileobj, size, document.file_type, document.file_name)
         except Exception as e:
             return Response(
                 {'error': 'Failed to download file'}, 
@@ -304,22 +525,37 @@ def download_shared_document(request, access_token):
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def download_document(request, document_id):
-    """Download a document file"""
-    document = get_object_or_404(Document, id=document_id, user=request.user)
+    """Download a document file, or with ?original=1 the upload kept before optimization"""
+    document = get_object_or_404(Document.objects.defer('content'), id=document_id, user=request.user)
+    file, file_type = document.file, document.file_type
+
+    if request.GET.get('original'):
+        optimization = DocumentOptimization.objects.filter(document=document).first()
+        if optimization is None or not optimization.original_file:
+            return Response(
+                {'error': 'No original file kept for this document'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        file = optimization.original_file
+        file_type = mimetypes.guess_type(file.name)[0]
     
-    if not document.file:
+    if not file:
         return Response(
             {'error': 'No file available'}, 
             status=status.HTTP_404_NOT_FOUND
         )
     
+    etag = make_etag('file', file.name, document.file_size if file == document.file else '')
+    response = not_modified(request, etag, document.updated_at)
+    if response is not None:
+        return response
+
     try:
-        response = HttpResponse(
-            document.file.read(),
-            content_type=document.file_type or 'application/octet-stream'
+        fileobj, size = open_plaintext(file)
+        return file_response(
+            request, fileobj, size, file_type, os.path.basename(file.name),
+            etag=etag, last_modified=document.updated_at
         )
-        response['Content-Disposition'] = f'attachment; filename="{document.file_name}"'
-        return response
     except Exception as e:
         return Response(
             {'error': 'Failed to download file'}, 
@@ -331,43 +567,7 @@ def download_document(request, document_id):
 @permission_classes([permissions.IsAuthenticated])
 def document_analytics(request):
     """Get document analytics for the user"""
-    user_documents = Document.objects.filter(user=request.user)
-    
-    analytics = {
-        'total_documents': user_documents.count(),
-        'documents_by_type': list(user_documents.values('document_type').annotate(
-            count=Count('id')
-        )),
-        'documents_by_language': list(user_documents.values('language').annotate(
-            count=Count('id')
-        )),
-        'documents_by_template_type': list(user_documents.exclude(
-            template_type=''
-        ).values('template_type').annotate(
-            count=Count('id')
-        )),
-        'recent_documents': DocumentSerializer(
-            user_documents.order_by('-created_at')[:10], 
-            many=True,
-            context={'request': request}
-        ).data,
-        'shared_documents_count': DocumentShare.objects.filter(
-            document__user=request.user, 
-            is_active=True
-        ).count(),
-        'templates_count': DocumentTemplate.objects.filter(
-            user=request.user
-        ).count(),
-        'total_file_size': user_documents.aggregate(
-            total_size=models.Sum('file_size')
-        )['total_size'] or 0,
-        'documents_shared_with_me': DocumentShare.objects.filter(
-            shared_with_email=request.user.email,
-            is_active=True
-        ).count() if hasattr(request.user, 'email') else 0
-    }
-    
-    return Response(analytics)
+    return Response(document_analytics_for(request.user, request))
 
 
 @api_view(['POST'])
@@ -382,6 +582,7 @@ def revoke_document_share(request, share_id):
     
     share.is_active = False
     share.save(update_fields=['is_active'])
+    invalidate_share(share.access_token)
     
     return Response({'message': 'Share revoked successfully'})
 
@@ -390,12 +591,135 @@ def revoke_document_share(request, share_id):
 @permission_classes([permissions.IsAuthenticated])
 def document_versions(request, document_id):
     """Get all versions of a document"""
+    document = get_object_or_404(Document.objects.defer('content'), id=document_id, user=request.user)
+    return _document_version_list(request, document)
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def document_version_detail(request, document_id, version_number):
+    """
+    Get one version of a document. Its content never changes once written,
+    but encryption moves its file, so the file name is part of the ETag.
+    """
+    row = DocumentVersion.objects.filter(
+        document_id=document_id,
+        document__user=request.user,
+        version_number=version_number
+    ).values('pk', 'created_at', 'file').first()
+    if row is None:
+        raise Http404
+    etag = make_etag('version', row['pk'], row['created_at'].isoformat(), row['file'] or '', weak=True)
+    response = not_modified(request, etag)
+    if response is not None:
+        return response
+
+    version = DocumentVersion.objects.select_related('created_by').get(pk=row['pk'])
+    serializer = DocumentVersionSerializer(version, context={'request': request})
+    return add_validators(Response(serializer.data), etag)
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def search_user_documents(request):
+    """Ranked full-text search with highlighted snippets"""
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return Response(
+            {'error': 'Search query is required'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    try:
+        limit = max(1, min(int(request.GET.get('limit', 20)), 100))
+        offset = int(request.GET.get('offset', 0))
+        if offset < 0:
+            raise ValueError(offset)
+    except ValueError:
+        return Response(
+            {'error': 'Invalid limit or offset'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    results = search_documents(request.user, query, limit=limit, offset=offset)
+    return Response({'query': query, 'results': results})
+
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def document_preview(request, document_id):
+    """Serve a cached thumbnail or first-page preview of a document file"""
     document = get_object_or_404(Document, id=document_id, user=request.user)
-    versions = document.versions.all()
-    
-    serializer = DocumentVersionSerializer(
-        versions, 
-        many=True, 
-        context={'request': request}
+
+    size = request.GET.get('size', 'medium')
+    if size not in preview_sizes():
+        return Response(
+            {'error': f'Invalid size, expected one of: {", ".join(preview_sizes())}'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    if not can_preview(document):
+        return Response(
+            {'error': 'No preview available for this file'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+    path = preview_path(document, size)
+    if not os.path.exists(path):
+        if preview_state(document) == PREVIEW_FAILED:
+            return Response(
+                {'error': 'The preview of this file could not be rendered'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        schedule_previews(document)
+        return Response({'status': 'pending'}, status=status.HTTP_202_ACCEPTED)
+
+    digest = preview_digest(document)
+    etag = f'"{digest}-{size}"'
+    # Preview URLs that carry the file digest never change content
+    immutable = request.GET.get('v') == digest
+    response = not_modified(request, etag, immutable=immutable)
+    if response is not None:
+        return response
+
+    response = FileResponse(open(path, 'rb'), content_type='image/jpeg')
+    return add_validators(response, etag, immutable=immutable)
+
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def export_documents(request):
+    """Stream a ZIP of the user's documents, or of those shared on one case"""
+    documents = Document.objects.filter(user=request.user)
+    filename = f'documents-{timezone.localdate():%Y%m%d}.zip'
+
+    case_id = request.GET.get('case')
+    if case_id:
+        try:
+            case_id = int(case_id)
+        except ValueError:
+            return Response(
+                {'error': 'case must be an integer id'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        case = get_object_or_404(Case, id=case_id, user=request.user)
+        documents = documents.filter(client_shares__case=case).distinct()
+        filename = f'{slugify(case.reference) or case.pk}-documents.zip'
+
+    documents = documents.order_by('id').prefetch_related(
+        Prefetch(
+            'versions',
+            queryset=DocumentVersion.objects.exclude(file='').exclude(file__isnull=True).only(
+                'id', 'document_id', 'version_number', 'file', 'created_at'
+            ).order_by('version_number')
+        )
+    )
+
+    response = StreamingHttpResponse(
+        stream_documents_zip(documents.iterator(chunk_size=100)),
+        content_type='application/zip'
     )
-    return Response(serializer.data)
\ No newline at end of file
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
@@ -168,6 +168,100 @@ EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD', '')
 CELERY_BROKER_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
 CELERY_RESULT_BACKEND = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
 
+# Cache. Share links, analytics payloads and revenue tokens are invalidated
+# through it, so every web worker must see the same cache: set CACHE_URL
+# (e.g. redis://localhost:6379/1) whenever more than one process serves
+# requests. Without it each process keeps its own copy, which only suits a
+# single-process development server.
+CACHE_URL = os.environ.get('CACHE_URL', '')
+if CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+            'KEY_PREFIX': 'lexa',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'lexa-default',
+        }
+    }
+
+# Document versions: a full copy every N versions, deltas in between
+DOCUMENT_VERSION_KEYFRAME_INTERVAL = int(os.environ.get('DOCUMENT_VERSION_KEYFRAME_INTERVAL', '10'))
+DOCUMENT_VERSION_CACHE_TIMEOUT = 60 * 60  # 1 hour
+
+# Background worker pools (see utils.background)
+BACKGROUND_THREAD_WORKERS = int(os.environ.get('BACKGROUND_THREAD_WORKERS', '4'))
+BACKGROUND_PROCESS_WORKERS = int(os.environ.get('BACKGROUND_PROCESS_WORKERS', '2'))
+BACKGROUND_TASKS_EAGER = os.environ.get('BACKGROUND_TASKS_EAGER', 'False') == 'True'
+
+# Text extraction from uploaded files
+DOCUMENT_EXTRACTION_MAX_ATTEMPTS = 3
+DOCUMENT_EXTRACTION_MAX_CHARS = 2_000_000
+
+# Document thumbnails: size name -> longest side in pixels
+DOCUMENT_PREVIEW_SIZES = {
+    'small': 160,
+    'medium': 480,
+    'large': 1200,
+}
+# How long a queued render blocks rescheduling, and a failed one answers 404
+DOCUMENT_PREVIEW_PENDING_TIMEOUT = 10 * 60  # seconds
+DOCUMENT_PREVIEW_FAILURE_TIMEOUT = 60 * 60  # seconds
+
+# Share links: token-to-share-id cache and buffered access counters
+DOCUMENT_SHARE_CACHE_TIMEOUT = 60  # seconds
+ACCESS_COUNTER_FLUSH_INTERVAL = 30  # seconds
+ACCESS_COUNTER_MAX_PENDING = 500
+
+# Per-user document analytics payload
+DOCUMENT_ANALYTICS_CACHE_TIMEOUT = 5 * 60  # seconds
+
+# Rendered template previews kept per process (LRU)
+DOCUMENT_TEMPLATE_PREVIEW_CACHE_SIZE = 256
+
+# Upload-time re-encoding of scanned images; lossy, so off unless enabled.
+# PNG, BMP and TIFF uploads are only converted with DOCUMENT_IMAGE_CONVERT_LOSSLESS
+DOCUMENT_IMAGE_OPTIMIZATION = False
+DOCUMENT_IMAGE_CONVERT_LOSSLESS = False
+DOCUMENT_IMAGE_FORMAT = 'jpeg'  # 'jpeg', 'webp' or 'pdf'; multi-page TIFFs always become PDF
+DOCUMENT_IMAGE_GRAYSCALE = False
+DOCUMENT_IMAGE_QUALITY = 75
+DOCUMENT_IMAGE_MAX_SIDE = 3508  # A4 at 300 dpi
+DOCUMENT_IMAGE_MIN_SIZE = 256 * 1024  # bytes
+DOCUMENT_IMAGE_KEEP_ORIGINAL = False  # kept originals count towards the storage quota
+
+# Encryption at rest for confidential documents (AES-256-GCM in 64 KB chunks).
+# Required for confidential documents and independent of SECRET_KEY; keep it,
+# files encrypted under a lost key cannot be read back. Without it the
+# documents.E001 system check stops a DEBUG=False deploy from starting.
+DOCUMENT_ENCRYPTION_KEY = os.environ.get('DOCUMENT_ENCRYPTION_KEY', '')
+DOCUMENT_ENCRYPTION_CHUNK_SIZE = 64 * 1024
+
+# Per-user revenue analytics, cached per date range
+BILLING_ANALYTICS_CACHE_TIMEOUT = 5 * 60  # seconds
+
+# Gapless yearly numbering; formats receive {year} and {number}
+INVOICE_NUMBER_FORMATS = {
+    'invoice': 'FAC-{year}-{number:05d}',
+    'billing_info': 'HON-{year}-{number:05d}',
+}
+
+# Due date of batch-generated invoices
+INVOICE_PAYMENT_TERMS_DAYS = 30
+
+# Printable invoices; Arabic labels need a TTF with Arabic glyphs (e.g. DejaVuSans.ttf)
+INVOICE_PDF_FONT = os.environ.get('INVOICE_PDF_FONT', '')
+
+# Analytics convert amounts to this currency with the ExchangeRate table;
+# in-process rate lookups are kept this long before being re-read
+BILLING_BASE_CURRENCY = 'DZD'
+EXCHANGE_RATE_CACHE_TIMEOUT = 5 * 60  # seconds
+
 # File upload settings
 FILE_UPLOAD_MAX_MEMORY_SIZE = 50 * 1024 * 1024  # 50MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 50 * 1024 * 1024  # 50MB
@@ -0,0 +1,102 @@
+"""
+Buffered access counters for share links and client portal records.
+
+Hits are accumulated in memory and written in batches with atomic
+``F()`` increments instead of a read-modify-write save per request. The
+buffer is flushed every ACCESS_COUNTER_FLUSH_INTERVAL seconds, when it
+holds ACCESS_COUNTER_MAX_PENDING rows, and at process exit. Counts read
+from the database may therefore lag behind by up to one flush interval.
+"""
+import atexit
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_pending = {}
+_timer = None
+
+
+def record_access(model, pk, count_field):
+    """Count one access to ``model`` row ``pk`` in ``count_field``"""
+    global _timer
+    now = timezone.now()
+    with _lock:
+        key = (model, pk, count_field)
+        count, _ = _pending.get(key, (0, None))
+        _pending[key] = (count + 1, now)
+        full = len(_pending) >= getattr(settings, 'ACCESS_COUNTER_MAX_PENDING', 500)
+        if not full and _timer is None:
+            _timer = threading.Timer(
+                getattr(settings, 'ACCESS_COUNTER_FLUSH_INTERVAL', 30),
+                _flush_from_timer
+            )
+            _timer.daemon = True
+            _timer.start()
+
+    if full:
+        flush()
+
+
+def flush():
+    """Write all pending counts; returns the number of rows updated"""
+    global _pending, _timer
+    with _lock:
+        pending, _pending = _pending, {}
+        if _timer is not None:
+            _timer.cancel()
+            _timer = None
+    if not pending:
+        return 0
+
+    # One UPDATE per counter: CASE expressions carry each row's increment
+    # and last access, and a timestamp never moves backwards
+    groups = defaultdict(dict)
+    for (model, pk, count_field), hits in pending.items():
+        groups[(model, count_field)][pk] = hits
+
+    updated = 0
+    try:
+        with transaction.atomic():
+            for (model, count_field), rows in groups.items():
+                by_count = defaultdict(list)
+                for pk, (count, _) in rows.items():
+                    by_count[count].append(pk)
+                increment = Case(*[When(pk__in=pks, then=Value(count)) for count, pks in by_count.items()])
+                last_accessed = Case(*[When(pk=pk, then=Value(last)) for pk, (_, last) in rows.items()])
+                updated += model.objects.filter(pk__in=list(rows)).update(**{
+                    count_field: F(count_field) + increment,
+                    'last_accessed': Greatest(Coalesce(F('last_accessed'), last_accessed), last_accessed),
+                })
+    except Exception:
+        logger.exception('Failed to flush %d access counters', len(pending))
+        _requeue(pending)
+    return updated
+
+
+def _requeue(pending):
+    with _lock:
+        for key, (count, last_accessed) in pending.items():
+            current, current_last = _pending.get(key, (0, last_accessed))
+            _pending[key] = (current + count, max(last_accessed, current_last))
+
+
+def _flush_from_timer():
+    global _timer
+    with _lock:
+        _timer = None
+    try:
+        flush()
+    finally:
+        close_old_connections()
+
+
+atexit.register(flush)
@@ -0,0 +1,98 @@
+"""
+In-process worker pools for work that should stay off the request path.
+
+Jobs are submitted after the surrounding transaction commits so workers
+always see the rows they were scheduled for. Set BACKGROUND_TASKS_EAGER to
+run jobs inline (management commands, tests, debugging).
+"""
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_thread_pool = None
+_process_pool = None
+
+
+def thread_pool():
+    global _thread_pool
+    with _lock:
+        if _thread_pool is None:
+            _thread_pool = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'BACKGROUND_THREAD_WORKERS', 4),
+                thread_name_prefix='lexa-worker'
+            )
+        return _thread_pool
+
+
+def process_pool():
+    """Pool for CPU-bound jobs; submitted callables must be picklable"""
+    global _process_pool
+    with _lock:
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(
+                max_workers=getattr(settings, 'BACKGROUND_PROCESS_WORKERS', 2)
+            )
+        return _process_pool
+
+
+def _run_inline(func, args, kwargs):
+    try:
+        return func(*args, **kwargs)
+    except Exception:
+        logger.exception('Background job %s failed', getattr(func, '__name__', func))
+
+
+def _run_job(func, args, kwargs):
+    close_old_connections()
+    try:
+        return _run_inline(func, args, kwargs)
+    finally:
+        close_old_connections()
+
+
+def run_in_background(func, *args, **kwargs):
+    """Run ``func`` in the thread pool once the current transaction commits"""
+    if getattr(settings, 'BACKGROUND_TASKS_EAGER', False):
+        transaction.on_commit(lambda: _run_inline(func, args, kwargs))
+        return
+
+    transaction.on_commit(
+        lambda: thread_pool().submit(_run_job, func, args, kwargs)
+    )
+
+
+def run_in_process(func, *args):
+    """Run ``func`` in the process pool once the current transaction commits"""
+    if getattr(settings, 'BACKGROUND_TASKS_EAGER', False):
+        transaction.on_commit(lambda: _run_inline(func, args, {}))
+        return
+
+    def submit():
+        future = process_pool().submit(func, *args)
+        future.add_done_callback(_log_failure)
+
+    transaction.on_commit(submit)
+
+
+def _log_failure(future):
+    exception = future.exception()
+    if exception is not None:
+        logger.error('Background process job failed: %r', exception)
+
+
+def call_in_process(func, *args):
+    """
+    Run ``func`` in the process pool and wait for its result.
+
+    For CPU-heavy steps inside a background job; the calling thread keeps
+    the database work while the process does the number crunching.
+    """
+    if getattr(settings, 'BACKGROUND_TASKS_EAGER', False):
+        return func(*args)
+    return process_pool().submit(func, *args).result()
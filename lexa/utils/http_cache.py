@@ -0,0 +1,124 @@
+"""
+Conditional GET helpers for API views.
+
+Views compute their validators (ETag, Last-Modified) from cheap columns,
+check them with ``not_modified`` after authentication and before any
+serialization or file I/O, and stamp them on the full response with
+``add_validators``. ``file_response`` streams files with single-range
+support.
+"""
+import hashlib
+import re
+
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+STREAM_CHUNK_SIZE = 64 * 1024
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def make_etag(*parts, weak=False):
+    digest = hashlib.sha1(':'.join(str(part) for part in parts).encode('utf-8')).hexdigest()[:32]
+    return f'W/"{digest}"' if weak else f'"{digest}"'
+
+
+def add_validators(response, etag=None, last_modified=None, immutable=False):
+    """
+    Set ETag, Last-Modified and Cache-Control on ``response``.
+
+    Mutable resources may be stored but must be revalidated on every use;
+    immutable ones are cached by the browser for a year.
+    """
+    if etag:
+        response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    if immutable:
+        patch_cache_control(response, private=True, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+    else:
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def not_modified(request, etag=None, last_modified=None, immutable=False):
+    """Return a 304 response when the client's copy is current, else None"""
+    if request.method not in ('GET', 'HEAD'):
+        return None
+    response = get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=int(last_modified.timestamp()) if last_modified else None,
+    )
+    if response is None:
+        return None
+    return add_validators(response, etag, last_modified, immutable)
+
+
+def parse_range(header, size):
+    """
+    Return (start, end) for a single ``bytes=`` range, None when the whole
+    file should be sent, or False when the range cannot be satisfied.
+    """
+    match = RANGE_RE.match(header.replace(' ', ''))
+    if not match:
+        return None  # malformed or multiple ranges: ignore the header
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def _stream(fileobj, start, length):
+    try:
+        fileobj.seek(start)
+        while length > 0:
+            data = fileobj.read(min(STREAM_CHUNK_SIZE, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+    finally:
+        fileobj.close()
+
+
+def file_response(request, fileobj, size, content_type, filename, etag=None, last_modified=None):
+    """
+    Stream an open, seekable ``fileobj`` as an attachment.
+
+    A ``Range`` header is answered with 206 and just that slice, unless an
+    ``If-Range`` validator shows the client's copy is stale.
+    """
+    start, end = 0, size - 1
+    byte_range = None
+    if request.META.get('HTTP_RANGE'):
+        if_range = request.META.get('HTTP_IF_RANGE')
+        if not if_range or if_range == etag:
+            byte_range = parse_range(request.META['HTTP_RANGE'], size)
+    if byte_range is False:
+        fileobj.close()
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+    if byte_range:
+        start, end = byte_range
+
+    response = StreamingHttpResponse(
+        _stream(fileobj, start, end - start + 1),
+        status=206 if byte_range else 200,
+        content_type=content_type or 'application/octet-stream'
+    )
+    response['Content-Length'] = str(end - start + 1)
+    response['Accept-Ranges'] = 'bytes'
+    if byte_range:
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return add_validators(response, etag, last_modified)
@@ -1,4 +1,4 @@
-from rest_framework import permissions
+from rest_framework import exceptions, permissions, status
 
 class IsOwnerOrReadOnly(permissions.BasePermission):
     """
@@ -58,4 +58,52 @@ class HasValidSubscription(permissions.BasePermission):
             return True
         
         # Check subscription status
-        return request.user.subscription_status in ['trial', 'active']
\ No newline at end of file
+        return request.user.subscription_status in ['trial', 'active']
+
+class StorageQuotaExceeded(exceptions.APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Upload exceeds your remaining storage quota.'
+    default_code = 'storage_quota_exceeded'
+
+class HasStorageQuota(permissions.BasePermission):
+    """
+    Custom permission to reject uploads larger than the remaining storage quota.
+    Uses the Content-Length header, so the body is never read. Requests
+    without one are let through; serializers check each parsed file with
+    documents.quota.check_upload.
+    """
+
+    def has_permission(self, request, view):
+        if request.method not in ('POST', 'PUT', 'PATCH'):
+            return True
+        if not request.user or not request.user.is_authenticated:
+            return True
+
+        try:
+            content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            content_length = 0
+        if not content_length:
+            return True
+
+        from documents.quota import remaining_bytes
+        remaining = remaining_bytes(request.user)
+        if remaining is not None and content_length > remaining:
+            raise StorageQuotaExceeded()
+        return True
+
+class HasDocumentQuota(permissions.BasePermission):
+    """
+    Custom permission to stop document creation once the subscription limit is reached.
+    """
+    message = 'Document limit reached for your subscription.'
+
+    def has_permission(self, request, view):
+        if request.method != 'POST':
+            return True
+        if not request.user or not request.user.is_authenticated:
+            return True
+
+        from documents.quota import remaining_documents
+        remaining = remaining_documents(request.user)
+        return remaining is None or remaining > 0